@@ -0,0 +1,134 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Compares the crypto backends on the test keys
+
+Run from the root of the repository:
+
+    GNUPGHOME=pypass/tests/gnupg python benchmarks/crypto_backends.py
+
+The gpg backend uses the test keyring, the pgpy backend the exported test
+key, which are the same key. Every backend encrypts, then decrypts, the
+same passwords one at a time and then concurrently, and decrypts the files
+written by the other backend.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pypass import PasswordStore  # noqa: E402
+from pypass.crypto import GPGBackend  # noqa: E402
+from pypass.crypto import GPGServerBackend  # noqa: E402
+from pypass.crypto import PGPyBackend  # noqa: E402
+
+TESTS = os.path.join(os.path.dirname(__file__), '..', 'pypass', 'tests')
+
+
+def make_store(backend):
+    path = tempfile.mkdtemp()
+    with open(os.path.join(path, '.gpg-id'), 'w') as gpg_id_file:
+        gpg_id_file.write('5C5833E3')
+    return PasswordStore(path, crypto_backend=backend)
+
+
+def timed(function):
+    start = time.time()
+    function()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--count', type=int, default=100,
+                        help='How many passwords to encrypt and decrypt.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Threads for the concurrent decryption.')
+    args = parser.parse_args()
+
+    backends = [('gpg', GPGBackend())]
+    try:
+        backends.append(('gpg-server', GPGServerBackend()))
+    except Exception as e:
+        print('Skipping gpg-server: %s' % e)
+    try:
+        backends.append(('pgpy', PGPyBackend(
+            [os.path.join(TESTS, 'test_key_sec.asc')]
+        )))
+    except Exception as e:
+        print('Skipping pgpy: %s' % e)
+
+    paths = ['bench/%04d' % number for number in range(args.count)]
+    passwords = dict(
+        (path, 'password %s\nuser: %s' % (path, path)) for path in paths
+    )
+
+    stores = []
+    print('%-10s %12s %12s %12s %12s' % (
+        'crypto', 'encrypt', 'decrypt', 'decrypt -j', 'other files'
+    ))
+    try:
+        for name, backend in backends:
+            store = make_store(backend)
+            stores.append(store)
+
+            encrypt = timed(lambda: [
+                store.insert_password(path, passwords[path])
+                for path in paths
+            ])
+            decrypt = timed(lambda: [
+                store.get_decrypted_password(path) for path in paths
+            ])
+            concurrent = timed(lambda: store.get_decrypted_passwords(
+                paths, workers=args.workers
+            ))
+
+            # Files written by the first backend
+            other = make_store(backend)
+            stores.append(other)
+            shutil.rmtree(other.path)
+            shutil.copytree(stores[0].path, other.path)
+            decrypted = {}
+            compatible = timed(lambda: decrypted.update(
+                other.get_decrypted_passwords(paths, workers=args.workers)
+            ))
+            if decrypted != passwords:
+                raise Exception('%s decrypted the passwords wrong' % name)
+
+            print('%-10s %11.1fms %11.1fms %11.1fms %11.1fms' % tuple(
+                [name] + [
+                    1000 * duration / args.count for duration in
+                    (encrypt, decrypt, concurrent, compatible)
+                ]
+            ))
+    finally:
+        for store in stores:
+            store.close()
+            shutil.rmtree(store.path, ignore_errors=True)
+
+    print('Times are per password.')
+
+
+if __name__ == '__main__':
+    main()
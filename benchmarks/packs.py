@@ -0,0 +1,101 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Compares bulk reads of loose password files and of packed folders
+
+Run from the root of the repository:
+
+    GNUPGHOME=pypass/tests/gnupg python benchmarks/packs.py
+
+The same passwords, spread over a few folders, are decrypted with
+get_decrypted_passwords() before and after the folders were packed, and
+after some of them were written again so that they shadow their pack.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pypass import PasswordStore  # noqa: E402
+
+
+def timed(function):
+    start = time.time()
+    function()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--count', type=int, default=200,
+                        help='How many passwords to read.')
+    parser.add_argument('--folders', type=int, default=4,
+                        help='How many folders to spread them over.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Threads for the concurrent decryption.')
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    with open(os.path.join(path, '.gpg-id'), 'w') as gpg_id_file:
+        gpg_id_file.write('5C5833E3')
+    store = PasswordStore(path)
+
+    paths = [
+        'folder%d/%04d' % (number % args.folders, number)
+        for number in range(args.count)
+    ]
+    passwords = dict(
+        (path, 'password %s\nuser: %s' % (path, path)) for path in paths
+    )
+
+    def read():
+        if store.get_decrypted_passwords(
+                paths, workers=args.workers) != passwords:
+            raise Exception('the passwords were decrypted wrong')
+
+    try:
+        store.insert_passwords(passwords, workers=args.workers)
+
+        loose = timed(read)
+        packing = timed(lambda: store.pack(workers=args.workers))
+        packed = timed(read)
+
+        # Every tenth password shadows its pack
+        for path in paths[::10]:
+            store.insert_password(path, passwords[path])
+        shadowed = timed(read)
+
+        print('%-20s %10.1fms' % ('loose files', 1000 * loose))
+        print('%-20s %10.1fms' % ('packing', 1000 * packing))
+        print('%-20s %10.1fms' % ('packed', 1000 * packed))
+        print('%-20s %10.1fms' % ('10% shadowed', 1000 * shadowed))
+    finally:
+        store.close()
+        shutil.rmtree(path, ignore_errors=True)
+
+    print('Times are for reading all %d passwords.' % args.count)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,10 +18,30 @@
 #    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from .passwordstore import PasswordStore
-from .entry_type import EntryType
+import sys
 
 __all__ = [
     'PasswordStore',
-    'EntryType'
+    'EntryType',
+    'MissingSecretKeyError',
 ]
+
+if sys.version_info >= (3, 7):
+    # Load the store lazily, so that shell completion does not pay for it
+    def __getattr__(name):
+        if name == 'PasswordStore':
+            from .passwordstore import PasswordStore
+            return PasswordStore
+        elif name == 'EntryType':
+            from .entry_type import EntryType
+            return EntryType
+        elif name == 'MissingSecretKeyError':
+            from .passwordstore import MissingSecretKeyError
+            return MissingSecretKeyError
+        raise AttributeError(
+            "module %r has no attribute %r" % (__name__, name)
+        )
+else:
+    from .passwordstore import PasswordStore  # noqa: F401
+    from .entry_type import EntryType  # noqa: F401
+    from .passwordstore import MissingSecretKeyError  # noqa: F401
@@ -0,0 +1,225 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import hashlib
+import hmac
+import math
+import os
+import string
+import subprocess
+import time
+from multiprocessing.pool import ThreadPool
+
+from .entry_type import EntryType
+from .entry_type import extract_entry
+from .passwordstore import DEFAULT_WORKERS
+
+# Passwords with fewer bits of entropy are reported as weak
+DEFAULT_MIN_ENTROPY = 60
+
+CHARACTER_CLASSES = [
+    string.ascii_lowercase,
+    string.ascii_uppercase,
+    string.digits,
+    string.punctuation,
+]
+
+
+def entropy_bits(password):
+    """Estimates the entropy of a password, in bits
+
+    The estimate assumes every character was drawn at random from the
+    character classes the password uses: lowercase letters, uppercase
+    letters, digits, punctuation and, for anything else, the rest of
+    unicode. It is an upper bound for passwords that were not generated.
+    """
+    pool_size = 0
+    remaining = set(password)
+    for characters in CHARACTER_CLASSES:
+        if remaining.intersection(characters):
+            pool_size += len(characters)
+            remaining.difference_update(characters)
+    if remaining:
+        pool_size += 100
+
+    if not pool_size:
+        return 0.0
+    return len(password) * math.log(pool_size, 2)
+
+
+def _split_nul(stream):
+    """Yields the NUL terminated fields of a stream as they are read"""
+    pending = b''
+    for chunk in iter(lambda: os.read(stream.fileno(), 65536), b''):
+        fields = (pending + chunk).split(b'\0')
+        pending = fields.pop()
+        for field in fields:
+            yield field
+    if pending:
+        yield pending
+
+
+def modification_times(store, paths):
+    """Returns when each of paths was last changed
+
+    The times come from one git log over the history of the store, read
+    newest first and stopped as soon as every path was seen. Passwords
+    that were never committed, or all of them when the store does not use
+    git, get the modification time of their file.
+
+    :param store: The PasswordStore of the passwords.
+    :param paths: The passwords. Example: ['Email/bob.net']
+    :returns: A dict mapping each path to a unix timestamp.
+    """
+    remaining = set(paths)
+    times = {}
+
+    if store.uses_git and remaining:
+        git_log = subprocess.Popen(
+            [
+                'git',
+                '--git-dir=%s' % store.git_dir,
+                '--work-tree=%s' % store.path,
+                'log',
+                '-z',
+                '--format=%x01%ct',
+                '--name-only',
+                '--no-renames',
+                '--',
+                '*.gpg',
+            ],
+            shell=False,
+            # The pathspec is relative to the store, not to the caller
+            cwd=store.path,
+            stdout=subprocess.PIPE
+        )
+        try:
+            timestamp = None
+            for name in _split_nul(git_log.stdout):
+                # Every commit is "\x01<time>", then its paths. The first
+                # one comes after a newline.
+                if name.startswith(b'\x01'):
+                    timestamp = int(name[1:])
+                    continue
+                if name.startswith(b'\n'):
+                    name = name[1:]
+
+                path = name.decode('utf-8')[:-len('.gpg')]
+                if path in remaining:
+                    times[path] = timestamp
+                    remaining.discard(path)
+                    if not remaining:
+                        break
+        finally:
+            if git_log.poll() is None:
+                git_log.kill()
+            git_log.stdout.close()
+            git_log.wait()
+
+    for path in remaining:
+        try:
+            times[path] = os.path.getmtime(
+                os.path.join(store.path, path + '.gpg')
+            )
+        except OSError:
+            pass
+
+    return times
+
+
+def audit(store, paths=None, min_entropy=DEFAULT_MIN_ENTROPY, max_age=None,
+          workers=None, now=None, breach_db=None):
+    """Looks for reused, breached, weak and stale passwords
+
+    Passwords are decrypted concurrently. Each worker reduces the password
+    it decrypted to its entropy and to an HMAC keyed with a random key
+    that only lives for this audit, so plaintexts are never compared or
+    kept around, except for the packs of packed folders, which are
+    decrypted once and held until the audit ends. Problems are yielded as
+    soon as a password was checked, in the order of paths.
+
+    :param store: The PasswordStore to audit.
+    :param paths: The passwords to audit. By default, all of them.
+    :param min_entropy: Passwords with fewer bits of entropy are weak.
+    :param max_age: Passwords unchanged for more days than this are stale.
+                    By default, age is not checked.
+    :param workers: How many gpg processes may run at the same time.
+    :param now: The current unix time. Defaults to time.time().
+    :param breach_db: A BreachDatabase to look every password up in, from
+                      the worker that decrypted it. By default, passwords
+                      are not looked up.
+    :returns: An iterator of (path, problem, detail) tuples. problem is one
+              of 'reused', with the first path using the same password as
+              detail, 'breached', with how many times the password was
+              seen in breach_db, 'weak', with the entropy in bits, 'stale',
+              with the age in days, and 'unreadable', with the error
+              message.
+    """
+    paths = sorted(set(store.get_passwords_list() if paths is None
+                       else paths))
+    key = os.urandom(32)
+    packs = store.open_packs()
+
+    times = {}
+    if max_age is not None:
+        times = modification_times(store, paths)
+        now = time.time() if now is None else now
+
+    def check(path):
+        try:
+            password = extract_entry(
+                store.get_decrypted_password(path, packs=packs),
+                EntryType.password
+            )
+        except Exception as e:
+            return path, None, None, None, str(e)
+
+        return path, hmac.new(
+            key, password.encode('utf-8'), hashlib.sha256
+        ).digest(), breach_db.count(password) if breach_db else 0, \
+            entropy_bits(password), None
+
+    first_users = {}
+    pool = ThreadPool(max(1, min(workers or DEFAULT_WORKERS, len(paths))))
+    try:
+        for path, digest, breaches, entropy, error in pool.imap(
+                check, paths
+        ):
+            if error is not None:
+                yield path, 'unreadable', error
+                continue
+
+            if digest in first_users:
+                yield path, 'reused', first_users[digest]
+            else:
+                first_users[digest] = path
+
+            if breaches:
+                yield path, 'breached', breaches
+
+            if entropy < min_entropy:
+                yield path, 'weak', entropy
+
+            if path in times:
+                age = (now - times[path]) / 86400
+                if age > max_age:
+                    yield path, 'stale', age
+    finally:
+        pool.close()
+        pool.join()
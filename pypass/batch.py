@@ -0,0 +1,167 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import os
+
+from .entry_type import EntryType
+from .pack import PACK_NAME
+
+
+def _show(store, operation):
+    field = operation.get('field')
+    if field is not None:
+        try:
+            field = EntryType[field]
+        except KeyError:
+            raise Exception('unknown field %s' % field)
+
+    value = store.get_decrypted_password(
+        operation['path'], entry=field, rev=operation.get('rev')
+    )
+    if value is None:
+        raise Exception('%s has no %s entry' % (
+            operation['path'], operation['field']
+        ))
+    return {'content': value}, []
+
+
+def _insert(store, operation):
+    changed = store.insert_password(operation['path'], operation['content'])
+    return (
+        {'changed': changed},
+        [operation['path']] if changed else []
+    )
+
+
+def _generate(store, operation):
+    password = store.generate_password(
+        operation['path'],
+        digits=operation.get('digits', True),
+        symbols=operation.get('symbols', True),
+        length=operation.get('length', 25),
+        first_line_only=operation.get('in_place', False)
+    )
+    return {'password': password}, [operation['path']]
+
+
+def _rm(store, operation):
+    entries = store.remove_password(
+        operation['path'], recursive=operation.get('recursive', False)
+    )
+    return {'entries': entries}, entries
+
+
+def _cp(store, operation):
+    entries = store.copy_password(
+        operation['from'],
+        operation['to'],
+        overwrite=operation.get('overwrite', True)
+    )
+    return {'entries': entries}, entries
+
+
+def _mv(store, operation):
+    entries = store.move_password(
+        operation['from'],
+        operation['to'],
+        overwrite=operation.get('overwrite', True)
+    )
+    return {'entries': entries}, entries
+
+
+OPERATIONS = {
+    'show': _show,
+    'insert': _insert,
+    'generate': _generate,
+    'rm': _rm,
+    'cp': _cp,
+    'mv': _mv,
+}
+
+
+def run_operation(store, operation):
+    """Runs one batch operation
+
+    :param store: The PasswordStore to run the operation on.
+    :param operation: A dict with an 'op' key naming the operation, and its
+                      arguments. Example: {'op': 'show', 'path': 'a.com'}
+    :returns: A tuple of the result dict and of the list of the passwords
+              that were written or removed.
+    """
+    if not isinstance(operation, dict):
+        raise Exception('operations must be JSON objects')
+
+    try:
+        run = OPERATIONS[operation.get('op')]
+    except KeyError:
+        raise Exception('unknown op %s' % operation.get('op'))
+
+    try:
+        return run(store, operation)
+    except KeyError as e:
+        raise Exception('missing %s' % e.args[0])
+
+
+def run_batch(store, lines, commit=True):
+    """Runs newline-delimited JSON operations, yielding one result each
+
+    Every result is a dict with an 'ok' key, the 'id' of its operation if
+    it had one, and either the output of the operation or an 'error'.
+    Operations keep running after one of them failed. When the store uses
+    git, all the changes are committed together after the last operation.
+
+    :param store: The PasswordStore to run the operations on.
+    :param lines: An iterable of lines, each holding one JSON operation.
+                  Blank lines are skipped.
+    :param commit: Commit the changes at the end. Defaults to True.
+    """
+    changed = set()
+    count = 0
+
+    for line in lines:
+        if not line.strip():
+            continue
+
+        operation = None
+        try:
+            operation = json.loads(line)
+            result, entries = run_operation(store, operation)
+            result['ok'] = True
+            changed.update(entries)
+        except Exception as e:
+            result = {'ok': False, 'error': str(e)}
+
+        if isinstance(operation, dict) and 'id' in operation:
+            result['id'] = operation['id']
+        count += 1
+        yield result
+
+    if commit and changed and store.uses_git:
+        # rm and mv remove the packs of the folders they take passwords from
+        packs = set(
+            os.path.join(entry.rpartition('/')[0], PACK_NAME)
+            for entry in changed
+        )
+        store.git_add_and_commit(
+            sorted(entry + '.gpg' for entry in changed) + sorted(packs),
+            message='Batch of %d operations changing %d passwords.' % (
+                count, len(changed)
+            )
+        )
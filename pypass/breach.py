@@ -0,0 +1,101 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import hashlib
+import mmap
+import string
+
+
+class BreachDatabase(object):
+    """A sorted file of the SHA-1 hashes of breached passwords
+
+    The file has one hexadecimal SHA-1 per line, optionally followed by a
+    colon and how many times the password was seen, like the downloadable
+    Pwned Passwords lists. Lines must be sorted by hash. The file is
+    memory-mapped and binary searched, so it is never read into memory
+    and each lookup only touches a few pages of it.
+
+    :param file_path: The path of the hash file.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = open(file_path, 'rb')
+        try:
+            self._map = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        except ValueError:
+            self._file.close()
+            raise Exception('%s is empty' % file_path)
+
+        first_hash = self._map[:40].decode('ascii', 'replace')
+        if not all(c in string.hexdigits for c in first_hash):
+            self.close()
+            raise Exception('%s is not a list of SHA-1 hashes' % file_path)
+        self._lowercase = first_hash.lower() == first_hash and \
+            first_hash.upper() != first_hash
+
+    def count_hash(self, sha1):
+        """Returns how many times a SHA-1 hash was seen, 0 if it wasn't
+
+        Lines without a count count as one.
+
+        :param sha1: The hexadecimal SHA-1. Example:
+                     '5BAA61E4C9B93F3F0682250B6CF8331B7EE68FD8'
+        """
+        target = (sha1.lower() if self._lowercase else sha1.upper()) \
+            .encode('ascii')
+        data = self._map
+        low, high = 0, len(data)
+
+        while low < high:
+            middle = (low + high) // 2
+            start = data.rfind(b'\n', 0, middle) + 1
+            end = data.find(b'\n', start)
+            if end == -1:
+                end = len(data)
+
+            line_hash = data[start:start + 40]
+            if line_hash < target:
+                low = end + 1
+            elif line_hash > target:
+                high = start
+            else:
+                count = data[start + 40:end].strip().lstrip(b':')
+                return int(count) if count.isdigit() else 1
+
+        return 0
+
+    def count(self, password):
+        """Returns how many times password was seen, 0 if it wasn't"""
+        return self.count_hash(
+            hashlib.sha1(password.encode('utf-8')).hexdigest()
+        )
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
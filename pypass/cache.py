@@ -0,0 +1,93 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import threading
+
+
+def file_signature(file_path):
+    """Returns a value that changes whenever the file is rewritten
+
+    :param file_path: The file to stat.
+    :returns: A tuple, or None if the file does not exist.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+
+    return (
+        stat.st_ino,
+        stat.st_size,
+        getattr(stat, 'st_mtime_ns', stat.st_mtime),
+        getattr(stat, 'st_ctime_ns', stat.st_ctime),
+    )
+
+
+class DecryptionCache(object):
+    """In-memory cache of decrypted password files
+
+    Each decrypted content is stored along with the signature of the
+    encrypted file it came from, so an entry whose .gpg file changed is
+    decrypted again instead of being served stale.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, signature, check_signature=True):
+        """Returns the cached content of path, or None
+
+        :param path: The path of the password. Example: 'email.com'
+        :param signature: The current signature of the encrypted file.
+        :param check_signature: Set to False when changes to the file are
+                                known to invalidate the cache, to skip
+                                comparing signatures.
+        """
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached is not None and (not check_signature or (
+                    signature is not None and cached[0] == signature)):
+                self.hits += 1
+                return cached[1]
+
+            self.misses += 1
+            return None
+
+    def set(self, path, signature, content):
+        with self._lock:
+            self._entries[path] = (signature, content)
+
+    def invalidate(self, path):
+        """Forgets the cached content of path"""
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, path):
+        return path in self._entries
@@ -17,18 +17,75 @@
 #    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import json
 import os
 import subprocess
-import shutil
 import sys
 import tempfile
 
 import click
 import colorama
-from pexpect import pxssh
 
 from pypass.entry_type import EntryType
+from pypass.entry_type import extract_entry
 from pypass import PasswordStore
+from pypass import ssh
+from pypass.audit import DEFAULT_MIN_ENTROPY
+from pypass.audit import audit as audit_store
+from pypass.batch import run_batch
+from pypass.breach import BreachDatabase
+from pypass.cache import DecryptionCache
+from pypass.federation import FederatedStore
+from pypass.materialize import Materializer
+from pypass.materialize import is_tmpfs
+from pypass.pack import PACK_NAME
+from pypass.pack import pack_path
+from pypass.template import render_template
+from pypass.tree import render_tree
+from pypass.verify import changed_since
+from pypass.verify import verify as verify_store
+from pypass.watch import StoreWatcher
+
+try:
+    from shlex import quote as shell_quote
+except ImportError:
+    from pipes import quote as shell_quote
+
+
+def _format_option(function):
+    return click.option(
+        '--format', 'output_format',
+        type=click.Choice(['text', 'json', 'ndjson']),
+        default='text',
+        help='Print text, a JSON array, or one JSON object per line.'
+    )(function)
+
+
+def _rev_option(function):
+    return click.option(
+        '--rev', '-r', type=click.STRING,
+        help='Read the password store as it was at this git revision.'
+    )(function)
+
+
+def _stores_at(config, rev):
+    """Returns the stores, or read-only views of them at rev"""
+    if rev is None:
+        return config['stores']
+    try:
+        return config['stores'].at(rev)
+    except Exception as e:
+        click.echo('Error: %s.' % e)
+        sys.exit(1)
+
+
+def _echo_records(records, output_format):
+    """Prints dicts as a JSON array, or streams them one per line"""
+    if output_format == 'ndjson':
+        for record in records:
+            click.echo(json.dumps(record, sort_keys=True))
+    else:
+        click.echo(json.dumps(list(records), sort_keys=True, indent=2))
 
 
 @click.group(invoke_without_command=True)
@@ -40,12 +97,34 @@ from pypass import PasswordStore
               envvar='PASSWORD_STORE_GIT',
               type=click.Path(file_okay=False, resolve_path=True),
               default=None)
+@click.option('--PASSWORD_STORE_GIT_BACKEND',
+              envvar='PASSWORD_STORE_GIT_BACKEND',
+              type=click.Choice(['subprocess', 'inprocess']),
+              default='subprocess')
+@click.option('--PASSWORD_STORE_CRYPTO_BACKEND',
+              envvar='PASSWORD_STORE_CRYPTO_BACKEND',
+              type=click.Choice(['gpg', 'gpg-server', 'pgpy']),
+              default='gpg')
+@click.option('--PASSWORD_STORE_CONTENT_MANIFEST',
+              envvar='PASSWORD_STORE_CONTENT_MANIFEST',
+              is_flag=True,
+              help='Do not re-encrypt nor commit passwords whose content '
+                   'does not change, at the cost of a manifest to decrypt '
+                   'and encrypt again on every write.')
+@click.option('--mount', 'mounts',
+              envvar='PASSWORD_STORE_MOUNTS',
+              multiple=True,
+              type=click.STRING,
+              help='Mount another password store under a prefix, as '
+                   'PREFIX=DIRECTORY. Can be repeated.')
 @click.option('--EDITOR',
               envvar='EDITOR',
               default='editor',
               type=click.STRING)
 @click.pass_context
-def main(ctx, password_store_dir, password_store_git, editor):
+def main(ctx, password_store_dir, password_store_git,
+         password_store_git_backend, password_store_crypto_backend,
+         password_store_content_manifest, mounts, editor):
 
     # init does not need any of this.
     if ctx.invoked_subcommand == "init":
@@ -55,11 +134,29 @@ def main(ctx, password_store_dir, password_store_git, editor):
     config = {
         'password_store': PasswordStore(
             path=password_store_dir,
-            git_dir=password_store_git
+            git_dir=password_store_git,
+            git_backend=password_store_git_backend,
+            content_manifest=password_store_content_manifest,
+            crypto_backend=password_store_crypto_backend
         ),
         'editor': editor
     }
 
+    stores = {'': config['password_store']}
+    for mount in mounts:
+        prefix, separator, directory = mount.partition('=')
+        if not separator or not prefix.strip('/') or not directory:
+            click.echo('Error: --mount expects PREFIX=DIRECTORY, got %s.'
+                       % mount)
+            sys.exit(1)
+        stores[prefix] = PasswordStore(
+            path=os.path.realpath(os.path.expanduser(directory)),
+            git_backend=password_store_git_backend,
+            content_manifest=password_store_content_manifest,
+            crypto_backend=config['password_store'].crypto
+        )
+    config['stores'] = FederatedStore(stores)
+
     ctx.obj = config
 
     # By default, invoke ls
@@ -81,9 +178,28 @@ def hlp(contex):
 @click.option('--clone', '-c',
               type=click.STRING,
               help='Git url to clone')
+@click.option('--remote', type=click.STRING, default='origin',
+              help='Name of the cloned remote.')
+@click.option('--branch', type=click.STRING, default=None,
+              help='Branch to clone, by default the one of the remote HEAD.')
+@click.option('--depth', type=click.IntRange(min=1), default=None,
+              help='Only fetch this many commits.')
+@click.option('--filter', 'filter_spec', type=click.STRING, default=None,
+              help='Partial clone filter, such as blob:none.')
+@click.option('--sparse', 'sparse_paths', multiple=True, type=click.STRING,
+              help='Only check out this folder. Can be repeated.')
 @click.argument('gpg-id', type=click.STRING)
-def init(path, clone, gpg_id):
-    PasswordStore.init(gpg_id, path, clone_url=clone)
+def init(path, clone, remote, branch, depth, filter_spec, sparse_paths,
+         gpg_id):
+    try:
+        PasswordStore.init(
+            gpg_id, path, clone_url=clone, remote=remote, branch=branch,
+            depth=depth, filter_spec=filter_spec,
+            sparse_paths=list(sparse_paths)
+        )
+    except Exception as e:
+        click.echo('Error: %s.' % e)
+        sys.exit(1)
     click.echo("Password store initialized for %s." % gpg_id)
 
 
@@ -115,9 +231,9 @@ def insert(config, path, echo, multiline):
             if confirmation != password:
                 sys.exit('Error: the entered passwords do not match.')
 
-    config['password_store'].insert_password(path, password)
-
-    if config['password_store'].uses_git:
+    if not config['password_store'].insert_password(path, password):
+        click.echo('%s is unchanged.' % path)
+    elif config['password_store'].uses_git:
         config['password_store'].git_add_and_commit(
             path + '.gpg',
             message='Add given password for %s to store.' % path
@@ -170,6 +286,50 @@ def generate(config, pass_name, pass_length, no_symbols, clip, in_place):
             'The generated password for %s is:\n%s' % (pass_name, password))
 
 
+@main.command()
+@click.option('--no-symbols', '-n', is_flag=True)
+@click.argument('subtree', type=click.STRING)
+@click.argument(
+    'pass_length',
+    type=int,
+    required=False,
+    envvar='PASSWORD_STORE_GENERATED_LENGTH',
+    default=25
+)
+@click.pass_obj
+def rotate(config, subtree, pass_length, no_symbols):
+    subtree = subtree.strip('/')
+    pass_names = [
+        name for name in config['password_store'].get_passwords_list()
+        if not subtree or name == subtree or
+        name.startswith(subtree + '/')
+    ]
+
+    if not pass_names:
+        click.echo('Error: %s is not in the password store.' % subtree)
+        sys.exit(1)
+
+    config['password_store'].generate_passwords(
+        pass_names,
+        digits=True,
+        symbols=not no_symbols,
+        length=pass_length,
+        first_line_only=True
+    )
+
+    if config['password_store'].uses_git:
+        config['password_store'].git_add_and_commit(
+            [pass_name + '.gpg' for pass_name in pass_names],
+            message='Rotate %d passwords in %s.' % (
+                len(pass_names),
+                subtree or 'the password store'
+            )
+        )
+
+    for pass_name in pass_names:
+        click.echo('Rotated %s' % pass_name)
+
+
 @main.command()
 @click.pass_obj
 @click.argument('path', type=click.STRING)
@@ -182,10 +342,13 @@ def edit(config, path):
 
             subprocess.call([config['editor'], temp_file.name])
             temp_file.seek(0)
+            new_password = temp_file.file.read().decode()
 
-            config['password_store'].insert_password(
-                path, temp_file.file.read().decode()
-            )
+            if new_password == old_password:
+                click.echo("%s is unchanged." % path)
+                return
+
+            config['password_store'].insert_password(path, new_password)
             click.echo("%s was updated." % path)
 
             if config['password_store'].uses_git:
@@ -200,15 +363,93 @@ def edit(config, path):
 
 @main.command()
 @click.option('--clip', '-c', is_flag=True)
-@click.argument('path', type=click.STRING)
+@click.option('--rev', '-r', type=click.STRING,
+              help='Show the password as it was at this git revision.')
+@click.option('--field', '-f', 'fields', multiple=True,
+              type=click.Choice([entry.name for entry in EntryType]),
+              help='Only show this field. Can be repeated.')
+@_format_option
+@click.argument('paths', nargs=-1, required=True, type=click.STRING)
 @click.pass_obj
-def show(config, path, clip):
-    if path not in config['password_store'].get_passwords_list():
-        click.echo('Error: %s is not in the password store.' % path)
+def show(config, paths, clip, rev, fields, output_format):
+    if len(paths) == 1 and paths[0] != '-' and not fields and \
+            output_format == 'text':
+        _show_one(config, paths[0], clip, rev)
+        return
+
+    if clip:
+        click.echo('Error: --clip shows a single password.')
+        sys.exit(1)
+
+    if rev is not None and not all(
+            store.uses_git for store in config['stores'].stores.values()):
+        click.echo('Error: the password store does not use git.')
+        sys.exit(1)
+
+    if paths == ('-',):
+        # One path per line, decrypted while the next ones are read
+        paths = (
+            line.strip() for line in iter(sys.stdin.readline, '')
+            if line.strip()
+        )
+
+    failed = []
+
+    def records():
+        for path, content, error in config['stores'].iter_decrypted_passwords(
+                paths, rev=rev
+        ):
+            record = {'path': path}
+            if error is not None:
+                failed.append(path)
+                record['error'] = error
+            elif fields:
+                for field in fields:
+                    record[field] = extract_entry(content, EntryType[field])
+            else:
+                record['content'] = content
+            yield record
+
+    if output_format == 'text':
+        for record in records():
+            if 'error' in record:
+                click.echo('Error: %s.' % record['error'])
+                continue
+            click.echo(colorama.Fore.BLUE + record['path'] + ':' +
+                       colorama.Fore.RESET)
+            if fields:
+                for field in fields:
+                    if record[field] is not None:
+                        click.echo('%s: %s' % (field, record[field]))
+            else:
+                click.echo(record['content'].strip())
+    else:
+        _echo_records(records(), output_format)
+
+    if failed:
         sys.exit(1)
 
-    decrypted_password = \
-        config['password_store'].get_decrypted_password(path).strip()
+
+def _show_one(config, path, clip, rev):
+    store, store_path = config['stores'].resolve(path)
+
+    if rev is not None:
+        if not store.uses_git:
+            click.echo('Error: the password store does not use git.')
+            sys.exit(1)
+        try:
+            decrypted_password = store.get_decrypted_password(
+                store_path, rev=rev
+            ).strip()
+        except Exception as e:
+            click.echo('Error: %s.' % e)
+            sys.exit(1)
+    elif store_path not in store.get_passwords_list():
+        click.echo('Error: %s is not in the password store.' % path)
+        sys.exit(1)
+    else:
+        decrypted_password = \
+            store.get_decrypted_password(store_path).strip()
 
     if clip:
         xclip = subprocess.Popen(
@@ -226,107 +467,439 @@ def show(config, path, clip):
 
 
 @main.command()
-@click.argument('path', type=click.STRING)
+@click.option('--exec', '-e', 'command', type=click.STRING,
+              help='Run this command on every host instead of a shell.')
+@click.option('--jobs', '-j', type=click.IntRange(min=1),
+              default=ssh.DEFAULT_JOBS,
+              help='How many hosts to run the command on at the same time.')
+@click.argument('paths', nargs=-1, required=True, type=click.STRING)
 @click.pass_obj
-def connect(config, path):
+def connect(config, paths, command, jobs):
     store = config['password_store']
-    hostname = store.get_decrypted_password(path, entry=EntryType.hostname)
-    username = store.get_decrypted_password(path, entry=EntryType.username)
-    password = store.get_decrypted_password(path, entry=EntryType.password)
-    s = pxssh.pxssh()
-    click.echo("Connectig to %s" % hostname)
-    s.login(hostname, username, password=password)
-    s.sendline()
-    s.interact()
+
+    if command is None:
+        if len(paths) != 1:
+            click.echo('Error: give one path, or a command with --exec.')
+            sys.exit(1)
+
+        try:
+            hostname, username, password = \
+                ssh.get_credentials(store, paths)[paths[0]]
+        except Exception as e:
+            click.echo('Error: %s.' % e, err=True)
+            sys.exit(1)
+        click.echo("Connectig to %s" % hostname)
+        s = ssh.login(hostname, username, password)
+        s.sendline()
+        s.interact()
+        return
+
+    failed = False
+    for path, status, output in ssh.fan_out(store, paths, command, jobs):
+        if status is None:
+            click.echo('Error: %s: %s' % (path, output), err=True)
+            failed = True
+            continue
+
+        for line in output.splitlines():
+            click.echo('%s: %s' % (path, line))
+        if status != 0:
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+def _parse_mapping(mapping):
+    """Parses a VAR=path[:field] environment mapping"""
+    variable, separator, path = mapping.partition('=')
+    if not separator or not variable or not path:
+        raise click.BadParameter(
+            'Expected VAR=path[:field], got "%s".' % mapping
+        )
+
+    entry = None
+    base_path, _, field = path.rpartition(':')
+    if base_path and field in EntryType.__members__:
+        path, entry = base_path, EntryType[field]
+
+    return variable.strip(), path.strip(), entry
+
+
+def _read_mappings(mappings, spec):
+    parsed_mappings = [_parse_mapping(mapping) for mapping in mappings]
+
+    if spec is not None:
+        for line in spec:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                parsed_mappings.append(_parse_mapping(line))
+
+    return parsed_mappings
+
+
+def _resolve_mappings(store, mappings):
+    """Decrypts every entry referenced by the mappings in one batch"""
+    for _, path, _ in mappings:
+        if not os.path.isfile(os.path.join(store.path, path + '.gpg')):
+            click.echo('Error: %s is not in the password store.' % path,
+                       err=True)
+            sys.exit(1)
+
+    try:
+        decrypted_passwords = store.get_decrypted_passwords(
+            path for _, path, _ in mappings
+        )
+    except Exception as e:
+        click.echo('Error: %s.' % e, err=True)
+        sys.exit(1)
+
+    environment = []
+    for variable, path, entry in mappings:
+        value = extract_entry(decrypted_passwords[path], entry)
+        if value is None:
+            click.echo('Error: %s has no %s entry.' % (path, entry.name),
+                       err=True)
+            sys.exit(1)
+        if entry is None:
+            value = value.rstrip('\n')
+        environment.append((variable, value))
+
+    return environment
+
+
+@main.command(name='env')
+@click.option('--map', '-m', 'mappings', multiple=True,
+              help='VAR=path[:field] mapping, may be repeated.')
+@click.option('--spec', '-s', type=click.File('r'),
+              help='File with one VAR=path[:field] mapping per line.')
+@click.pass_obj
+def env(config, mappings, spec):
+    mappings = _read_mappings(mappings, spec)
+    for variable, value in _resolve_mappings(
+            config['password_store'], mappings):
+        click.echo('export %s=%s' % (variable, shell_quote(value)))
+
+
+@main.command(name='exec')
+@click.option('--map', '-m', 'mappings', multiple=True,
+              help='VAR=path[:field] mapping, may be repeated.')
+@click.option('--spec', '-s', type=click.File('r'),
+              help='File with one VAR=path[:field] mapping per line.')
+@click.argument('command', nargs=-1, required=True, type=click.UNPROCESSED)
+@click.pass_obj
+def exec_(config, mappings, spec, command):
+    mappings = _read_mappings(mappings, spec)
+
+    environment = dict(os.environ)
+    environment.update(
+        _resolve_mappings(config['password_store'], mappings)
+    )
+
+    try:
+        os.execvpe(command[0], list(command), environment)
+    except OSError as e:
+        click.echo('Error: could not execute %s: %s' % (command[0], e))
+        sys.exit(1)
 
 
 @main.command()
+@click.argument('template', type=click.File('r'))
+@click.pass_obj
+def render(config, template):
+    try:
+        for chunk in render_template(config['password_store'],
+                                     template.read()):
+            click.echo(chunk, nl=False)
+    except Exception as e:
+        click.echo('Error: %s.' % e, err=True)
+        sys.exit(1)
+
+
+@main.command()
+@click.option('--no-commit', is_flag=True,
+              help='Leave the changes uncommitted.')
+@click.pass_obj
+def batch(config, no_commit):
+    store = config['password_store']
+    if store.decryption_cache is None:
+        store.decryption_cache = DecryptionCache()
+
+    failed = False
+    for result in run_batch(
+            store, iter(sys.stdin.readline, ''), commit=not no_commit):
+        failed = failed or not result['ok']
+        click.echo(json.dumps(result, sort_keys=True))
+
+    if failed:
+        sys.exit(1)
+
+
+@main.command(name='sync-out')
+@click.option('--watch', '-w', is_flag=True,
+              help='Keep the directory up to date until interrupted.')
+@click.argument('directory',
+                type=click.Path(file_okay=False, resolve_path=True))
 @click.argument('subfolder', required=False, type=click.STRING, default='')
 @click.pass_obj
-def ls(config, subfolder):
-    tree = subprocess.Popen(
-        [
-            'tree',
-            '-C',
-            '-l',
-            '--noreport',
-            os.path.join(config['password_store'].path, subfolder),
-        ],
-        shell=False,
-        stdout=subprocess.PIPE
-    )
-    tree.wait()
+def sync_out(config, directory, subfolder, watch):
+    store = config['password_store']
+    if not os.path.isdir(os.path.join(store.path, subfolder)):
+        click.echo('Error: %s is not in the password store.' % subfolder)
+        sys.exit(1)
+
+    materializer = Materializer(store, directory, subfolder)
+
+    def report(written, removed):
+        for name in written:
+            click.echo('Updated %s' % name)
+        for name in removed:
+            click.echo('Removed %s' % name)
+
+    if not is_tmpfs(directory):
+        click.echo(
+            'Warning: %s is not on a tmpfs, passwords are written to disk.'
+            % directory,
+            err=True
+        )
 
-    if tree.returncode == 0:
-        output_without_gpg = \
-            tree.stdout.read().decode('utf8').replace('.gpg', '')
+    report(*materializer.sync())
 
-        output_replaced_first_line =\
-            "Password Store\n" + '\n'.join(output_without_gpg.split('\n')[1:])
+    if watch:
+        with StoreWatcher(materializer.source) as watcher:
+            try:
+                materializer.watch(watcher, callback=report)
+            except KeyboardInterrupt:
+                pass
 
-        output_stripped = output_replaced_first_line.strip()
 
-        click.echo(output_stripped)
+@main.command()
+@_rev_option
+@_format_option
+@click.argument('subfolder', required=False, type=click.STRING, default='')
+@click.pass_obj
+def ls(config, subfolder, rev, output_format):
+    subfolder = subfolder.strip('/')
+    entries = (
+        entry for entry in _stores_at(config, rev).iter_passwords_list()
+        if not subfolder or entry.startswith(subfolder + '/')
+    )
+
+    if output_format != 'text':
+        _echo_records(
+            ({'path': entry} for entry in entries), output_format
+        )
+        return
+
+    click.echo('\n'.join(render_tree(
+        [entry[len(subfolder):].lstrip('/') for entry in entries],
+        title='Password Store'
+    )))
 
 
 @main.command()
+@_rev_option
+@_format_option
 @click.argument('search_terms', nargs=-1)
 @click.pass_obj
-def find(config, search_terms):
+def find(config, search_terms, rev, output_format):
+    stores = _stores_at(config, rev)
+    if output_format != 'text':
+        _echo_records(
+            ({'path': entry} for entry in stores.find(search_terms)),
+            output_format
+        )
+        return
+
     click.echo("Search Terms: " + ','.join(search_terms))
+    click.echo('\n'.join(render_tree(stores.find(search_terms))))
+
 
-    pattern = '*' + '*|*'.join(search_terms) + '*'
-
-    tree = subprocess.Popen(
-        [
-            'tree',
-            '-C',
-            '-l',
-            '--noreport',
-            '-P', pattern,
-            # '--prune', (tree>=1.5)
-            # '--matchdirs', (tree>=1.7)
-            # '--ignore-case', (tree>=1.7)
-            config['password_store'].path,
-        ],
-        shell=False,
-        stdout=subprocess.PIPE
+@main.command()
+@_rev_option
+@_format_option
+@click.argument('search_string')
+@click.pass_obj
+def grep(config, search_string, rev, output_format):
+    undecryptable = []
+    matches = _stores_at(config, rev).grep(
+        search_string, undecryptable=undecryptable
     )
-    tree.wait()
 
-    if tree.returncode == 0:
-        output_without_gpg = \
-            tree.stdout.read().decode('utf8').replace('.gpg', '')
+    if output_format != 'text':
+        _echo_records(
+            ({'path': password, 'lines': lines}
+             for password, lines in matches),
+            output_format
+        )
+    else:
+        for password, lines in matches:
+            click.echo(
+                colorama.Fore.BLUE + password + ":" + '\n' +
+                colorama.Fore.RESET + '\n'.join(lines)
+            )
+
+    if undecryptable:
+        click.echo(
+            'Skipped %d passwords not encrypted for any of your secret '
+            'keys: %s' % (
+                len(undecryptable), ', '.join(sorted(undecryptable))
+            ),
+            err=True
+        )
 
-        output_without_first_line =\
-            '\n'.join(output_without_gpg.split('\n')[1:]).strip()
 
-        click.echo(output_without_first_line)
+def _audit_message(problem, detail):
+    if problem == 'reused':
+        return 'reuses the password of %s' % detail
+    elif problem == 'breached':
+        return 'breached password (seen %d times)' % detail
+    elif problem == 'weak':
+        return 'weak password (%d bits)' % detail
+    elif problem == 'stale':
+        return 'unchanged for %d days' % detail
+    else:
+        return detail
 
 
 @main.command()
-@click.argument('search_string')
+@click.option('--min-entropy', type=int, default=DEFAULT_MIN_ENTROPY,
+              help='Report passwords with fewer bits of entropy.')
+@click.option('--max-age', type=int, default=None,
+              help='Report passwords unchanged for more days.')
+@click.option('--breach-db',
+              type=click.Path(exists=True, dir_okay=False),
+              help='Report passwords whose SHA-1 is in this sorted file.')
+@_format_option
+@click.argument('subfolder', required=False, type=click.STRING, default='')
 @click.pass_obj
-def grep(config, search_string):
-    for password in config['password_store'].get_passwords_list():
-        decrypted_password = \
-            config['password_store'].get_decrypted_password(password)
+def audit(config, subfolder, min_entropy, max_age, breach_db, output_format):
+    subfolder = subfolder.strip('/')
+    pass_names = [
+        name for name in config['password_store'].get_passwords_list()
+        if not subfolder or name == subfolder or
+        name.startswith(subfolder + '/')
+    ]
+
+    if breach_db is not None:
+        try:
+            breach_db = BreachDatabase(breach_db)
+        except Exception as e:
+            click.echo('Error: %s.' % e)
+            sys.exit(1)
+
+    problems = []
+
+    def records():
+        for pass_name, problem, detail in audit_store(
+                config['password_store'],
+                pass_names,
+                min_entropy=min_entropy,
+                max_age=max_age,
+                breach_db=breach_db
+        ):
+            problems.append(pass_name)
+            yield {
+                'path': pass_name,
+                'problem': problem,
+                'detail': detail,
+                'message': _audit_message(problem, detail),
+            }
+
+    try:
+        if output_format != 'text':
+            _echo_records(records(), output_format)
+        else:
+            for record in records():
+                click.echo('%s: %s' % (record['path'], record['message']))
+    finally:
+        if breach_db is not None:
+            breach_db.close()
 
-        grep = subprocess.Popen(
-            ['grep', '-e', search_string],
-            stdout=subprocess.PIPE,
-            stdin=subprocess.PIPE
-        )
+    if problems:
+        sys.exit(1)
 
-        grep.stdin.write(decrypted_password.encode())
-        grep.stdin.close()
 
-        grep_stdout = grep.stdout.read().decode().strip()
-        if grep_stdout.strip() != '':
-            click.echo(
-                colorama.Fore.BLUE + password + ":" + '\n' +
-                colorama.Fore.RESET + grep_stdout
+@main.command()
+@click.option('--decrypt', '-d', is_flag=True,
+              help='Also check that every password can be decrypted.')
+@click.option('--changed-since', 'changed_since_rev', type=click.STRING,
+              help='Only check passwords changed since this git revision.')
+@click.argument('subfolder', required=False, type=click.STRING, default='')
+@click.pass_obj
+def verify(config, subfolder, decrypt, changed_since_rev):
+    store = config['password_store']
+    subfolder = subfolder.strip('/')
+
+    if changed_since_rev is not None:
+        try:
+            pass_names = changed_since(store, changed_since_rev)
+        except Exception as e:
+            click.echo('Error: %s.' % e)
+            sys.exit(1)
+    else:
+        pass_names = store.get_passwords_list()
+    pass_names = [
+        name for name in pass_names
+        if not subfolder or name == subfolder or
+        name.startswith(subfolder + '/')
+    ]
+
+    problems = []
+    subtrees = {}
+    with click.progressbar(verify_store(store, pass_names, decrypt=decrypt),
+                           length=len(pass_names),
+                           label='Verifying %d passwords' % len(pass_names),
+                           file=sys.stderr) as results:
+        for pass_name, subtree, problem in results:
+            counts = subtrees.setdefault(subtree, [0, 0])
+            if problem is None:
+                counts[0] += 1
+            else:
+                counts[1] += 1
+                problems.append((pass_name, problem))
+
+    for pass_name, problem in problems:
+        click.echo('%s: %s' % (pass_name, problem))
+
+    for subtree in sorted(subtrees, key=lambda subtree: subtree or ''):
+        verified, failed = subtrees[subtree]
+        click.echo('%s: %d verified, %d failed' % (
+            'no .gpg-id' if subtree is None else
+            (subtree or '.') + '/.gpg-id',
+            verified,
+            failed
+        ))
+
+    if problems:
+        sys.exit(1)
+
+
+@main.command()
+@click.argument('subfolder', required=False, type=click.STRING, default='')
+@click.pass_obj
+def pack(config, subfolder):
+    store = config['password_store']
+    try:
+        folders = store.pack(subfolder)
+    except Exception as e:
+        click.echo('Error: %s.' % e)
+        sys.exit(1)
+
+    if folders and store.uses_git:
+        store.git_add_and_commit(
+            [os.path.join(folder, PACK_NAME) for folder in folders],
+            message='Pack %d folders in %s.' % (
+                len(folders),
+                subfolder.strip('/') or 'the password store'
             )
+        )
+
+    for folder in folders:
+        if os.path.isfile(pack_path(store.path, folder)):
+            click.echo('Packed %s' % (folder or '/'))
+        else:
+            click.echo('Removed the pack of %s' % (folder or '/'))
 
 
 @main.command()
@@ -334,96 +907,123 @@ def grep(config, search_string):
 @click.argument('path', type=click.STRING)
 @click.pass_obj
 def rm(config, recursive, path):
-    resolved_path = os.path.realpath(
-        os.path.join(config['password_store'].path, path)
-    )
+    store = config['password_store']
+    resolved_path = os.path.realpath(os.path.join(store.path, path))
 
     if os.path.isdir(resolved_path) is False:
-        resolved_path = os.path.join(
-            config['password_store'].path,
-            path + '.gpg'
-        )
+        resolved_path = os.path.join(store.path, path + '.gpg')
 
-    if os.path.exists(resolved_path):
-        if recursive:
-            click.confirm("Recursively remove %s?" % resolved_path, abort=True)
-            shutil.rmtree(resolved_path)
-        else:
-            click.confirm("Really remove %s?" % resolved_path, abort=True)
-            os.remove(resolved_path)
-        click.echo("%s was removed from the store." % path)
-    else:
+    if not os.path.exists(resolved_path):
         click.echo("Error: %s is not in the password store." % path)
+        return
 
+    if recursive:
+        click.confirm("Recursively remove %s?" % resolved_path, abort=True)
+    else:
+        click.confirm("Really remove %s?" % resolved_path, abort=True)
 
-@main.command()
-@click.argument('old_path', type=click.STRING)
-@click.argument('new_path', type=click.STRING)
-@click.pass_obj
-def cp(config, old_path, new_path):
-    resolved_old_path = os.path.realpath(
-        os.path.join(config['password_store'].path, old_path)
-    )
+    try:
+        store.remove_password(path, recursive=recursive)
+    except Exception as e:
+        click.echo('Error: %s' % e)
+        sys.exit(1)
 
-    if os.path.isdir(resolved_old_path):
-        shutil.copytree(
-            resolved_old_path,
-            os.path.realpath(
-                os.path.join(config['password_store'].path, new_path)
-            )
+    if store.uses_git:
+        store.git_add_and_commit(
+            [
+                os.path.relpath(resolved_path, store.path),
+                # The pack of the folder is removed along
+                os.path.join(os.path.dirname(path.strip('/')), PACK_NAME),
+            ],
+            message='Remove %s from store.' % path
         )
+    click.echo("%s was removed from the store." % path)
+
+
+def _copy_or_move(config, old_path, new_path, no_overwrite, move):
+    store = config['password_store']
+    resolved_old_path = os.path.realpath(os.path.join(store.path, old_path))
+
+    if os.path.isdir(resolved_old_path):
+        # Folders are staged whole, with their .gpg-id files
+        extension = ''
+    elif os.path.isfile(resolved_old_path + '.gpg'):
+        extension = '.gpg'
     else:
-        resolved_old_path = os.path.realpath(
-            os.path.join(config['password_store'].path, old_path + '.gpg')
-        )
+        click.echo("Error: %s is not in the password store" % old_path)
+        return
 
-        if os.path.isfile(resolved_old_path):
-            shutil.copy(
-                resolved_old_path,
-                os.path.realpath(
-                    os.path.join(
-                        config['password_store'].path,
-                        new_path + '.gpg'
-                    )
-                )
-            )
+    # Where the password goes, decided before it creates any folder
+    _, destination = store.get_destination(old_path, new_path)
+    try:
+        if move:
+            store.move_password(old_path, new_path, overwrite=not no_overwrite)
         else:
-            click.echo("Error: %s is not in the password store" % old_path)
+            store.copy_password(old_path, new_path, overwrite=not no_overwrite)
+    except Exception as e:
+        click.echo('Error: %s' % e)
+        sys.exit(1)
+
+    if store.uses_git:
+        paths = [destination + extension]
+        if move:
+            paths.append(old_path.strip('/') + extension)
+            paths.append(os.path.join(
+                os.path.dirname(old_path.strip('/')), PACK_NAME
+            ))
+        store.git_add_and_commit(
+            paths,
+            message='%s %s to %s.' % (
+                'Rename' if move else 'Copy', old_path, new_path
+            )
+        )
 
 
 @main.command()
+@click.option('--no-overwrite', is_flag=True,
+              help='Fail, before copying anything, if a password would be '
+                   'overwritten.')
 @click.argument('old_path', type=click.STRING)
 @click.argument('new_path', type=click.STRING)
 @click.pass_obj
-def mv(config, old_path, new_path):
-    resolved_old_path = os.path.realpath(
-        os.path.join(config['password_store'].path, old_path)
-    )
+def cp(config, old_path, new_path, no_overwrite):
+    _copy_or_move(config, old_path, new_path, no_overwrite, move=False)
 
-    if os.path.isdir(resolved_old_path):
-        shutil.move(
-            resolved_old_path,
-            os.path.realpath(
-                os.path.join(config['password_store'].path, new_path)
-            )
-        )
-    else:
-        resolved_old_path = os.path.realpath(
-            os.path.join(config['password_store'].path, old_path + '.gpg')
-        )
 
-        if os.path.isfile(resolved_old_path):
-            shutil.move(
-                resolved_old_path,
-                os.path.realpath(
-                    os.path.join(
-                        config['password_store'].path,
-                        new_path + '.gpg'
-                    )
-                )
-            )
-        else:
-            click.echo("Error: %s is not in the password store" % old_path)
+@main.command()
+@click.option('--no-overwrite', is_flag=True,
+              help='Fail, before moving anything, if a password would be '
+                   'overwritten.')
+@click.argument('old_path', type=click.STRING)
+@click.argument('new_path', type=click.STRING)
+@click.pass_obj
+def mv(config, old_path, new_path, no_overwrite):
+    _copy_or_move(config, old_path, new_path, no_overwrite, move=True)
+
+
+@main.command()
+@click.option('--remote', type=click.STRING, default='origin',
+              help='The remote to sync with.')
+@click.option('--branch', type=click.STRING, default=None,
+              help='The remote branch, by default the current branch.')
+@click.option('--no-push', is_flag=True,
+              help='Only fetch and rebase.')
+@click.pass_obj
+def sync(config, remote, branch, no_push):
+    store = config['password_store']
+    if not store.uses_git:
+        click.echo('Error: the password store does not use git.')
+        sys.exit(1)
+
+    try:
+        changed = store.sync(remote=remote, branch=branch, push=not no_push)
+    except Exception as e:
+        click.echo('Error: %s.' % e)
+        sys.exit(1)
+
+    for path in changed:
+        click.echo('Updated %s' % path)
+    click.echo('Password store synchronized with %s.' % remote)
 
 
 @main.command(context_settings={'ignore_unknown_options': True})
@@ -0,0 +1,126 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# This module runs on every tab press of the shell completion. It must only
+# import light modules: no click, no subprocess on the common path and
+# nothing that imports pypass.passwordstore.
+
+import binascii
+import os
+import sys
+
+from .index import EntryIndex
+from .keys import cache_directory
+from .keys import list_secret_keys
+
+USAGE = 'usage: pypass __complete entries|folders|keys [--expand] [prefix]'
+
+
+def index_cache_path(store_path):
+    """Returns where the entry index of a store is saved between runs"""
+    return os.path.join(
+        cache_directory(),
+        'index-%08x' % (binascii.crc32(store_path.encode('utf-8')) &
+                        0xffffffff)
+    )
+
+
+def _is_hidden(path):
+    return any(part.startswith('.') for part in path.split('/'))
+
+
+def complete_entries(index, prefix, folders_only=False, expand=False):
+    """Completes prefix with the entries and folders at its level
+
+    :param index: The EntryIndex of the store.
+    :param prefix: What the user typed so far. Example: 'Email/b'
+    :param folders_only: Only complete folders.
+    :param expand: When there is only one match and it is a folder with a
+                   single child, complete that child instead, recursively.
+    :returns: A sorted list of completions. Folders end with a slash.
+    """
+    directory = prefix.rpartition('/')[0]
+    if _is_hidden(directory):
+        return []
+
+    entries, subdirectories = index.children(directory)
+
+    matches = [
+        subdirectory + '/' for subdirectory in subdirectories
+        if subdirectory.startswith(prefix) and not _is_hidden(subdirectory)
+    ]
+    if not folders_only:
+        matches.extend(
+            entry for entry in entries
+            if entry.startswith(prefix) and not _is_hidden(entry)
+        )
+
+    while expand and len(matches) == 1 and matches[0].endswith('/'):
+        entries, subdirectories = index.children(matches[0])
+        children = [subdirectory + '/' for subdirectory in subdirectories]
+        if not folders_only:
+            children.extend(entries)
+        if len(children) != 1:
+            break
+        matches = children
+
+    return sorted(matches)
+
+
+def main(argv=None):
+    """Prints completions, one per line"""
+    argv = list(sys.argv[1:] if argv is None else argv)
+    expand = '--expand' in argv
+    if expand:
+        argv.remove('--expand')
+
+    if not argv or argv[0] not in ('entries', 'folders', 'keys') or \
+            len(argv) > 2:
+        sys.stderr.write(USAGE + '\n')
+        return 2
+
+    kind = argv[0]
+    prefix = argv[1] if len(argv) > 1 else ''
+
+    if kind == 'keys':
+        _, uids = list_secret_keys()
+        completions = [uid for uid in uids if uid.startswith(prefix)]
+    else:
+        store_path = os.path.realpath(
+            os.environ.get('PASSWORD_STORE_DIR') or
+            os.path.join(os.path.expanduser('~'), '.password-store')
+        )
+        index = EntryIndex(store_path)
+        cache_path = index_cache_path(store_path)
+        index.load(cache_path)
+        completions = complete_entries(
+            index,
+            prefix,
+            folders_only=kind == 'folders',
+            expand=expand
+        )
+        index.save(cache_path)
+
+    for completion in completions:
+        sys.stdout.write(completion + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,787 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import array
+import errno
+import fcntl
+import marshal
+import os
+import select
+import socket
+import subprocess
+import threading
+import warnings
+from multiprocessing import cpu_count
+
+from .keys import _keyring_signature
+from .keys import cache_directory
+from .keys import find_executable
+from .keys import find_gpg
+from .keys import gnupg_home
+from .keys import list_secret_keys
+from .keys import write_cache_file
+from .openpgp import recipient_key_ids
+
+# The key id of the recipients hidden with gpg --throw-keyids
+ANONYMOUS_KEY_ID = '0000000000000000'
+
+
+def _matches_key(query, key_ids, uids):
+    """Tells if a gpg-style key query designates a key
+
+    :param query: A key id, a fingerprint, with or without 0x, or a part of
+                  a user id. Example: '5C5833E3', '<test@key.com>'
+    :param key_ids: The fingerprints of the key and its subkeys.
+    :param uids: The user ids of the key.
+    """
+    hex_query = query.upper()
+    if hex_query.startswith('0X'):
+        hex_query = hex_query[2:]
+    if len(hex_query) >= 8 and \
+            all(c in '0123456789ABCDEF' for c in hex_query):
+        return any(key_id.upper().endswith(hex_query) for key_id in key_ids)
+
+    query = query.lower()
+    if query.startswith('<') and query.endswith('>'):
+        return any(query in uid.lower() for uid in uids)
+    return any(query.strip('<>') in uid.lower() for uid in uids)
+
+
+class CryptoBackend(object):
+    """Encrypts and decrypts the files of a password store
+
+    Subclasses implement encrypt, decrypt, secret_key_ids and find_keys.
+    """
+
+    name = None
+
+    def encrypt(self, text, file_path, recipients):
+        """Encrypts text for recipients and writes it to file_path
+
+        :param recipients: Key queries, like the lines of a .gpg-id file.
+        :returns: True on success.
+        """
+        raise NotImplementedError
+
+    def decrypt(self, file_path=None, ciphertext=None):
+        """Decrypts a file, or ciphertext bytes
+
+        :returns: The decrypted text, or None if it can't be decrypted.
+        """
+        raise NotImplementedError
+
+    def secret_key_ids(self):
+        """Returns the ids of the keys and subkeys we can decrypt with
+
+        :returns: A set of 16 digit uppercase hex key ids.
+        """
+        raise NotImplementedError
+
+    def find_keys(self, query):
+        """Returns the fingerprints of the public keys matching a query
+
+        :param query: A key id, a fingerprint or a part of a user id.
+        """
+        raise NotImplementedError
+
+    def recipients(self, file_path=None, ciphertext=None):
+        """Returns the key ids a file, or ciphertext bytes, is encrypted for
+
+        The packets are read without decrypting anything.
+        """
+        if ciphertext is None:
+            with open(file_path, 'rb') as f:
+                ciphertext = f.read()
+        return recipient_key_ids(ciphertext)
+
+    def missing_secret_keys(self, file_path=None, ciphertext=None):
+        """Tells, without decrypting, that we can't decrypt a message
+
+        :returns: The key ids the message is encrypted for when we have the
+                  secret key of none of them, otherwise None. None is also
+                  returned when it can't be told: for anonymous recipients,
+                  passphrases, unreadable files or an empty keyring.
+        """
+        try:
+            recipients = self.recipients(file_path, ciphertext)
+            secret_key_ids = self.secret_key_ids()
+        except Exception:
+            return None
+
+        key_ids = set()
+        for recipient in recipients:
+            if len(recipient) == 64:
+                # Version 6 fingerprints start with the key id
+                key_ids.add(recipient[:16])
+            else:
+                key_ids.add(recipient[-16:])
+
+        if not key_ids or ANONYMOUS_KEY_ID in key_ids or \
+                not secret_key_ids or key_ids & secret_key_ids:
+            return None
+        return sorted(key_ids)
+
+    def close(self):
+        """Stops the helper processes of the backend, if it has any"""
+
+
+class GPGBackend(CryptoBackend):
+    """Runs the gpg command line tool for every operation
+
+    :param gpg_bin: The gpg binary. Defaults to gpg2, or gpg.
+    :param cache_path: Where to keep the list of secret keys between runs.
+                       Defaults to a file in $XDG_CACHE_HOME/pypass, or
+                       ~/.cache/pypass.
+    """
+
+    name = 'gpg'
+
+    def __init__(self, gpg_bin=None, cache_path=None):
+        self.gpg_bin = gpg_bin or find_gpg()
+        if self.gpg_bin is None:
+            raise Exception("Could not find GPG")
+        self.cache_path = cache_path
+        # The keyring signature, and the secret key ids it had
+        self._secret_key_ids = (None, None)
+
+    def encrypt(self, text, file_path, recipients):
+        command = [self.gpg_bin, '-e']
+        for recipient in recipients:
+            command += ['-r', recipient]
+
+        gpg = subprocess.Popen(
+            command + [
+                '--batch',
+                '--use-agent',
+                '--no-tty',
+                '--yes',
+                '-o', file_path
+            ],
+            shell=False,
+            stdin=subprocess.PIPE
+        )
+
+        gpg.stdin.write(text.encode())
+        gpg.stdin.close()
+        return gpg.wait() == 0
+
+    def decrypt(self, file_path=None, ciphertext=None):
+        gpg = subprocess.Popen(
+            [
+                self.gpg_bin,
+                '--quiet',
+                '--batch',
+                '--use-agent',
+                '-d',
+            ] + ([file_path] if file_path else []),
+            shell=False,
+            stdin=subprocess.PIPE if ciphertext is not None else None,
+            stdout=subprocess.PIPE
+        )
+        stdout, _ = gpg.communicate(ciphertext)
+
+        if gpg.returncode == 0:
+            return stdout.decode()
+        return None
+
+    def secret_key_ids(self):
+        # Only the keyring files are checked while it does not change
+        keyring = _keyring_signature(gnupg_home())
+        signature, key_ids = self._secret_key_ids
+        if signature != keyring:
+            key_ids = frozenset(
+                key_id.upper() for key_id in list_secret_keys(
+                    self.gpg_bin, cache_path=self.cache_path
+                )[0]
+            )
+            self._secret_key_ids = (keyring, key_ids)
+        return key_ids
+
+    def find_keys(self, query):
+        gpg = subprocess.Popen(
+            [
+                self.gpg_bin,
+                '--list-keys',
+                '--with-colons',
+                '--',
+                query,
+            ],
+            shell=False,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        output = gpg.communicate()[0].decode('utf-8', 'replace')
+
+        fingerprints = []
+        in_primary_key = False
+        for line in output.splitlines():
+            fields = line.split(':')
+            if fields[0] in ('pub', 'sub'):
+                in_primary_key = fields[0] == 'pub'
+            elif fields[0] == 'fpr' and in_primary_key and len(fields) > 9:
+                fingerprints.append(fields[9])
+                in_primary_key = False
+        return fingerprints
+
+
+class GPGServerError(Exception):
+    """A gpg server exited or closed its connection"""
+
+
+def _executable_signature(name):
+    """Identifies the installed version of a program, or returns None
+
+    It changes when the program is upgraded, without running it.
+    """
+    path = name if os.sep in name else find_executable(name)
+    if path is None:
+        return None
+    path = os.path.realpath(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (path, stat.st_size, getattr(stat, 'st_mtime_ns', stat.st_mtime))
+
+
+def _set_non_blocking(fd):
+    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) |
+                os.O_NONBLOCK)
+
+
+class GPGServer(object):
+    """One long-lived ``gpg --server``, spoken to with the Assuan protocol
+
+    Commands go over a unix socket, on which files are handed to gpg by
+    passing their descriptors, so nothing but the command lines is copied
+    through the connection. gpg talks to gpg-agent as it does from the
+    command line.
+
+    A server encrypts as many times as needed. gpg 2.2 counts the
+    plaintexts it saw for the whole process, so it fails to decrypt more
+    than one message.
+
+    :param gpg_bin: The gpg binary to run.
+    """
+
+    def __init__(self, gpg_bin):
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.process = subprocess.Popen(
+                [
+                    gpg_bin,
+                    '--server',
+                    '--quiet',
+                    '--batch',
+                    '--use-agent',
+                    '--no-tty',
+                ],
+                shell=False,
+                stdin=theirs.fileno(),
+                stdout=theirs.fileno(),
+                # Failures are reported through the Assuan protocol, the
+                # messages gpg prints along would only clutter the terminal
+                stderr=subprocess.DEVNULL,
+                pass_fds=[theirs.fileno()],
+                # Makes libassuan receive descriptors on the connection
+                env=dict(
+                    os.environ, _assuan_connection_fd=str(theirs.fileno())
+                )
+            )
+        finally:
+            theirs.close()
+
+        self.socket = ours
+        self.keyring = _keyring_signature(gnupg_home())
+        self.decrypted = False
+        self._buffer = b''
+        try:
+            if not self._command(None)[0]:
+                raise GPGServerError('gpg --server did not greet')
+        except GPGServerError:
+            self.close()
+            raise
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def _send(self, line, fds=()):
+        data = line.encode('utf-8') + b'\n'
+        try:
+            if fds:
+                self.socket.sendmsg([data], [(
+                    socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                    array.array('i', fds)
+                )])
+            else:
+                self.socket.sendall(data)
+        except (IOError, OSError) as e:
+            raise GPGServerError(str(e))
+
+    def _command(self, line, fds=(), feed=None, drain=None):
+        """Sends a command line and waits for its OK or ERR
+
+        While waiting, the data of feed is written to its descriptor, which
+        is closed afterwards, and drain is read, so gpg never blocks on
+        either of them.
+
+        :param line: The command, or None to only read a response.
+        :param fds: Descriptors to pass along with the command.
+        :param feed: A (descriptor, bytes) tuple.
+        :param drain: A descriptor.
+        :returns: A tuple of whether gpg answered OK, and of what was read
+                  from drain.
+        """
+        if line is not None:
+            self._send(line, fds)
+
+        feed_fd, data = feed or (None, b'')
+        if feed_fd is not None:
+            _set_non_blocking(feed_fd)
+        if drain is not None:
+            _set_non_blocking(drain)
+        output = []
+
+        try:
+            while True:
+                newline = self._buffer.find(b'\n')
+                if newline >= 0:
+                    response = self._buffer[:newline]
+                    self._buffer = self._buffer[newline + 1:]
+                    if response.startswith(b'INQUIRE'):
+                        # Nothing is ever inquired by the commands we send
+                        self._send('CAN')
+                    elif response == b'OK' or response.startswith(b'OK '):
+                        ok = True
+                        break
+                    elif response.startswith(b'ERR'):
+                        ok = False
+                        break
+                    # Status, comment and data lines are skipped
+                    continue
+
+                readable, writable, _ = select.select(
+                    [self.socket] + ([drain] if drain is not None else []),
+                    [feed_fd] if feed_fd is not None else [],
+                    []
+                )
+                if self.socket in readable:
+                    chunk = self.socket.recv(4096)
+                    if not chunk:
+                        raise GPGServerError('gpg --server exited')
+                    self._buffer += chunk
+                if drain in readable:
+                    chunk = os.read(drain, 65536)
+                    output.append(chunk)
+                    if not chunk:
+                        drain = None
+                if feed_fd in writable:
+                    try:
+                        data = data[os.write(feed_fd, data[:65536]):]
+                    except OSError as e:
+                        if e.errno != errno.EPIPE:
+                            raise
+                        data = b''
+                    if not data:
+                        os.close(feed_fd)
+                        feed_fd = None
+        finally:
+            if feed_fd is not None:
+                os.close(feed_fd)
+
+        # gpg wrote everything before answering
+        while drain is not None:
+            try:
+                chunk = os.read(drain, 65536)
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+                break
+            output.append(chunk)
+            if not chunk:
+                break
+
+        return ok, b''.join(output)
+
+    def _set_files(self, input_fd, output_fd):
+        """Hands the input and output descriptors of a command to gpg
+
+        Both descriptors are closed on our side.
+        """
+        try:
+            return self._command('INPUT FD', [input_fd])[0] and \
+                self._command('OUTPUT FD', [output_fd])[0]
+        finally:
+            os.close(input_fd)
+            os.close(output_fd)
+
+    def encrypt(self, text, file_path, recipients):
+        """Like CryptoBackend.encrypt"""
+        try:
+            for recipient in recipients:
+                if '\n' in recipient or \
+                        not self._command('RECIPIENT ' + recipient)[0]:
+                    return False
+            if not recipients:
+                return False
+
+            try:
+                output_fd = os.open(
+                    file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666
+                )
+            except OSError:
+                return False
+            input_fd, feed_fd = os.pipe()
+
+            ok = False
+            try:
+                if self._set_files(input_fd, output_fd):
+                    feed, feed_fd = (feed_fd, text.encode()), None
+                    ok = self._command('ENCRYPT', feed=feed)[0]
+            finally:
+                if feed_fd is not None:
+                    os.close(feed_fd)
+                if not ok:
+                    os.remove(file_path)
+            return ok
+        finally:
+            self._command('RESET')
+
+    def decrypt(self, file_path=None, ciphertext=None):
+        """Like CryptoBackend.decrypt"""
+        feed_fd = None
+        if ciphertext is None:
+            try:
+                input_fd = os.open(file_path, os.O_RDONLY)
+            except OSError:
+                return None
+        else:
+            input_fd, feed_fd = os.pipe()
+        drain, output_fd = os.pipe()
+        self.decrypted = True
+
+        try:
+            if not self._set_files(input_fd, output_fd):
+                return None
+            feed = None
+            if feed_fd is not None:
+                feed, feed_fd = (feed_fd, ciphertext), None
+            ok, plaintext = self._command('DECRYPT', feed=feed, drain=drain)
+            self._command('RESET')
+        finally:
+            if feed_fd is not None:
+                os.close(feed_fd)
+            os.close(drain)
+
+        if ok:
+            return plaintext.decode()
+        return None
+
+    def close(self):
+        self.socket.close()
+        self.process.wait()
+
+
+class GPGServerBackend(GPGBackend):
+    """Runs gpg like GPGBackend, reusing gpg co-processes
+
+    A pool of GPGServer, shared by all the threads, is kept running and
+    reused for every operation. Servers that died, or that were started
+    before the keyring changed, are replaced, and an operation that lost
+    its server is tried again once.
+
+    gpg 2.2 refuses to decrypt a second message in the same process, which
+    is detected the first time a server is reused to decrypt. From then on,
+    decryptions run one gpg each like GPGBackend does, since a new process
+    is needed anyway, and only encryptions use the pool. The outcome is
+    remembered in the cache directory for the installed gpg, so it is only
+    detected once.
+
+    Descriptors are passed with sendmsg, so this needs Python 3.3.
+
+    :param gpg_bin: The gpg binary. Defaults to gpg2, or gpg.
+    :param servers: How many idle servers to keep. By default, the number
+                    of CPUs.
+    :param cache_path: Where to keep the list of secret keys, see
+                       GPGBackend.
+    """
+
+    name = 'gpg-server'
+
+    def __init__(self, gpg_bin=None, servers=None, cache_path=None):
+        GPGBackend.__init__(self, gpg_bin, cache_path=cache_path)
+        if not hasattr(socket.socket, 'sendmsg'):
+            raise Exception('The gpg-server crypto backend requires '
+                            'Python 3.3 or later')
+
+        if servers is None:
+            try:
+                servers = cpu_count()
+            except NotImplementedError:
+                servers = 4
+        self.servers = servers
+
+        # Whether a server decrypts more than once, None until tried
+        self._reuse_cache_path = os.path.join(
+            cache_directory(), 'gpg-server-reuse'
+        )
+        self._gpg_signature = _executable_signature(self.gpg_bin)
+        self.reuse_for_decryption = self._load_reuse_for_decryption()
+
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def _load_reuse_for_decryption(self):
+        if self._gpg_signature is None:
+            return None
+        try:
+            with open(self._reuse_cache_path, 'rb') as cache_file:
+                signature, reuse = marshal.load(cache_file)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+        return reuse if signature == self._gpg_signature else None
+
+    def _save_reuse_for_decryption(self, reuse):
+        self.reuse_for_decryption = reuse
+        if self._gpg_signature is not None:
+            write_cache_file(
+                self._reuse_cache_path, (self._gpg_signature, reuse)
+            )
+
+    def _take(self):
+        keyring = _keyring_signature(gnupg_home())
+        stale = []
+        server = None
+        with self._lock:
+            while self._idle and server is None:
+                candidate = self._idle.pop()
+                if candidate.alive and candidate.keyring == keyring:
+                    server = candidate
+                else:
+                    stale.append(candidate)
+        for candidate in stale:
+            candidate.close()
+        return server or GPGServer(self.gpg_bin)
+
+    def _release(self, server):
+        with self._lock:
+            if server.alive and len(self._idle) < self.servers:
+                self._idle.append(server)
+                return
+        server.close()
+
+    def _run(self, operation, failed):
+        """Runs operation(server), on a new server if the first one died
+
+        :returns: What operation returned, or failed if gpg could not be
+                  run.
+        """
+        try:
+            server = self._take()
+        except GPGServerError:
+            return failed
+
+        try:
+            try:
+                return operation(server)
+            except GPGServerError:
+                server.close()
+                server = GPGServer(self.gpg_bin)
+                return operation(server)
+        except GPGServerError:
+            return failed
+        finally:
+            self._release(server)
+
+    def encrypt(self, text, file_path, recipients):
+        return self._run(
+            lambda server: server.encrypt(text, file_path, recipients),
+            False
+        )
+
+    def decrypt(self, file_path=None, ciphertext=None):
+        reuse = self.reuse_for_decryption
+        if reuse is False:
+            return GPGBackend.decrypt(self, file_path, ciphertext)
+
+        reused, plaintext = self._run(
+            lambda server: (
+                server.decrypted, server.decrypt(file_path, ciphertext)
+            ),
+            (False, None)
+        )
+        if reused and reuse is None:
+            if plaintext is not None:
+                self._save_reuse_for_decryption(True)
+            else:
+                # Either the message is not for us, or gpg refused it
+                plaintext = GPGBackend.decrypt(self, file_path, ciphertext)
+                if plaintext is not None:
+                    self._save_reuse_for_decryption(False)
+        return plaintext
+
+    def close(self):
+        with self._lock:
+            servers = self._idle
+            self._idle = []
+        for server in servers:
+            server.close()
+
+
+class PGPyBackend(CryptoBackend):
+    """Encrypts and decrypts in process with PGPy
+
+    Nothing is forked, which makes every operation much cheaper than with
+    gpg, but keys are not read from the GnuPG keyring: they are loaded from
+    exported key files. The files it writes are regular OpenPGP messages,
+    readable by gpg, and it reads the files written by gpg.
+
+    :param key_files: Paths of ASCII armored or binary key files, public or
+                      secret. Defaults to the PASSWORD_STORE_PGPY_KEYS
+                      environment variable, a list of paths separated like
+                      $PATH.
+    :param passphrase: Unlocks the protected secret keys.
+    """
+
+    name = 'pgpy'
+
+    def __init__(self, key_files=None, passphrase=None):
+        try:
+            import pgpy
+        except ImportError:
+            raise Exception('The pgpy crypto backend requires PGPy')
+        # PGPy uses ciphers that cryptography deprecated, for old messages
+        warnings.filterwarnings('ignore', module=r'pgpy\.')
+
+        self._pgpy = pgpy
+        self.passphrase = passphrase
+        self._lock = threading.Lock()
+
+        if key_files is None:
+            key_files = [
+                key_file for key_file in os.environ.get(
+                    'PASSWORD_STORE_PGPY_KEYS', ''
+                ).split(os.pathsep) if key_file
+            ]
+
+        # fingerprint -> key, secret keys replace their public key
+        self._keys = {}
+        for key_file in key_files:
+            loaded, others = pgpy.PGPKey.from_file(key_file)
+            for key in [loaded] + list(others.values()):
+                if not key.is_primary:
+                    continue
+                fingerprint = str(key.fingerprint).replace(' ', '')
+                if key.is_public and fingerprint in self._keys:
+                    continue
+                self._keys[fingerprint] = key
+
+    def _key_ids(self, key):
+        return [str(key.fingerprint).replace(' ', '')] + [
+            str(subkey.fingerprint).replace(' ', '')
+            for subkey in key.subkeys.values()
+        ]
+
+    def find_keys(self, query):
+        return [
+            fingerprint for fingerprint, key in sorted(self._keys.items())
+            if _matches_key(query, self._key_ids(key), [
+                str(uid.userid) for uid in key.userids])
+        ]
+
+    def secret_key_ids(self):
+        return set(
+            key_id[-16:].upper()
+            for key in self._keys.values() if not key.is_public
+            for key_id in self._key_ids(key)
+        )
+
+    def encrypt(self, text, file_path, recipients):
+        pgpy = self._pgpy
+        keys = []
+        for recipient in recipients:
+            fingerprints = self.find_keys(recipient)
+            if not fingerprints:
+                return False
+            keys.append(self._keys[fingerprints[0]])
+        if not keys:
+            return False
+
+        cipher = pgpy.constants.SymmetricKeyAlgorithm.AES256
+        session_key = cipher.gen_key()
+        message = pgpy.PGPMessage.new(bytearray(text.encode('utf-8')))
+        try:
+            for key in keys:
+                message = (key.pubkey if not key.is_public else key).encrypt(
+                    message, cipher=cipher, sessionkey=session_key
+                )
+        except Exception:
+            return False
+        finally:
+            del session_key
+
+        try:
+            with open(file_path, 'wb') as encrypted_file:
+                encrypted_file.write(bytes(message))
+        except (IOError, OSError):
+            return False
+        return True
+
+    def decrypt(self, file_path=None, ciphertext=None):
+        pgpy = self._pgpy
+        try:
+            if ciphertext is None:
+                with open(file_path, 'rb') as f:
+                    ciphertext = f.read()
+            message = pgpy.PGPMessage.from_blob(ciphertext)
+        except Exception:
+            return None
+
+        encrypters = set(key_id.upper() for key_id in message.encrypters)
+        for key in self._keys.values():
+            if key.is_public or not encrypters.intersection(
+                    key_id[-16:].upper() for key_id in self._key_ids(key)):
+                continue
+
+            try:
+                if key.is_protected:
+                    if self.passphrase is None:
+                        continue
+                    # Unlocking changes the key, one thread at a time
+                    with self._lock:
+                        with key.unlock(self.passphrase):
+                            decrypted = key.decrypt(message).message
+                else:
+                    decrypted = key.decrypt(message).message
+            except Exception:
+                continue
+
+            if isinstance(decrypted, (bytes, bytearray)):
+                return bytes(decrypted).decode('utf-8')
+            return decrypted
+
+        return None
+
+
+CRYPTO_BACKENDS = {
+    'gpg': GPGBackend,
+    'gpg-server': GPGServerBackend,
+    'pgpy': PGPyBackend,
+}
@@ -17,6 +17,8 @@
 #    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import re
+
 from enum import Enum
 
 
@@ -29,3 +31,33 @@ class EntryType(Enum):
 
     hostname = 3
     """hostname entry"""
+
+
+def extract_entry(decrypted_password, entry=None):
+    """Returns the requested entry of a decrypted password file
+
+    :param decrypted_password: The full content of a password file
+    :param entry: The entry to retreive. (EntryType enum) When None, the
+                  whole content is returned.
+    """
+    if entry == EntryType.username:
+        usr = re.search(
+            '(?:username|user|login): (.+)',
+            decrypted_password
+        )
+        if usr:
+            return usr.groups()[0]
+    elif entry == EntryType.password:
+        pw = re.search('(?:password|pass): (.+)', decrypted_password)
+        if pw:
+            return pw.groups()[0]
+        else:  # If there is no match, password is the first line
+            return decrypted_password.split('\n')[0]
+    elif entry == EntryType.hostname:
+        hostname = re.search(
+            '(?:host|hostname): (.+)', decrypted_password
+        )
+        if hostname:
+            return hostname.groups()[0]
+    else:
+        return decrypted_password
@@ -0,0 +1,34 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+
+
+def main():
+    """Runs pypass
+
+    Shell completion is answered without importing the command line
+    interface, which is much slower to load.
+    """
+    if sys.argv[1:2] == ['__complete']:
+        from pypass import complete
+        sys.exit(complete.main(sys.argv[2:]))
+
+    from pypass import command
+    command.main()
@@ -0,0 +1,270 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import fnmatch
+import heapq
+import re
+from multiprocessing.pool import ThreadPool
+
+from .passwordstore import DEFAULT_WORKERS
+from .passwordstore import MissingSecretKeyError
+
+
+def _join(prefix, path):
+    return prefix + '/' + path if prefix else path
+
+
+class FederatedStore(object):
+    """Several password stores mounted under prefixes
+
+    Paths are routed to the store mounted on their longest matching prefix,
+    so each store keeps its own .gpg-id files and git repository. Listings
+    and searches run on all the stores at once.
+
+    :param stores: A dict mapping prefixes to PasswordStore instances. The
+                   empty prefix mounts a store at the root. Example:
+                   {'': personal_store, 'team': team_store}
+    :param workers: How many passwords grep decrypts at the same time. By
+                    default, the number of CPUs.
+    """
+
+    def __init__(self, stores, workers=None):
+        self.stores = {}
+        for prefix, store in stores.items():
+            prefix = prefix.strip('/')
+            if prefix in self.stores:
+                raise Exception('%s is mounted twice' % (prefix or '/'))
+            self.stores[prefix] = store
+        self.workers = workers or DEFAULT_WORKERS
+
+    @property
+    def prefixes(self):
+        return sorted(self.stores)
+
+    def _mount_of(self, path):
+        path = path.strip('/')
+        for prefix in sorted(self.stores, key=len, reverse=True):
+            if not prefix or path == prefix or \
+                    path.startswith(prefix + '/'):
+                return prefix
+        raise Exception('%s is not in a mounted password store' % path)
+
+    def resolve(self, path):
+        """Returns the store of path, and path relative to that store
+
+        :param path: Example: 'team/Email/bob.net'
+        :returns: Example: (team_store, 'Email/bob.net')
+        """
+        prefix = self._mount_of(path)
+        return self.stores[prefix], path.strip('/')[len(prefix):].lstrip('/')
+
+    def _map_stores(self, function):
+        """Returns {prefix: function(prefix, store)}, run concurrently"""
+        prefixes = self.prefixes
+        pool = ThreadPool(max(1, len(prefixes)))
+        try:
+            results = pool.map(
+                lambda prefix: function(prefix, self.stores[prefix]),
+                prefixes
+            )
+        finally:
+            pool.close()
+            pool.join()
+        return dict(zip(prefixes, results))
+
+    def iter_passwords_list(self):
+        """Yields the passwords of all the stores, in order
+
+        Entries of a store hidden by a store mounted inside of it are
+        skipped.
+        """
+        def list_store(prefix, store):
+            return [
+                _join(prefix, entry) for entry in store.get_passwords_list()
+                if self._mount_of(_join(prefix, entry)) == prefix
+            ]
+
+        return heapq.merge(*self._map_stores(list_store).values())
+
+    def get_passwords_list(self):
+        """Returns the sorted list of the passwords of all the stores
+
+        :returns: Example: ['Email/bob.net', 'team/db']
+        """
+        return list(self.iter_passwords_list())
+
+    def find(self, search_terms):
+        """Yields the passwords whose name matches one of search_terms
+
+        :param search_terms: Glob patterns, matched against the last part
+                             of the path of the passwords like tree -P
+                             '*term*' does. Example: ['bob', 'db*']
+        """
+        patterns = ['*%s*' % term for term in search_terms] or ['*']
+        for entry in self.iter_passwords_list():
+            name = entry.rpartition('/')[2]
+            if any(fnmatch.fnmatchcase(name, p) for p in patterns):
+                yield entry
+
+    def at(self, rev):
+        """Returns read-only views of all the stores at a git revision
+
+        :param rev: The revision, resolved in the repository of each store.
+        :returns: A FederatedStore of StoreRevision instances.
+        """
+        return FederatedStore(
+            dict((prefix, store.at(rev))
+                 for prefix, store in self.stores.items()),
+            workers=self.workers
+        )
+
+    def get_decrypted_password(self, path, entry=None, rev=None):
+        """Like PasswordStore.get_decrypted_password, in the right store"""
+        store, relative_path = self.resolve(path)
+        return store.get_decrypted_password(
+            relative_path, entry=entry, rev=rev
+        )
+
+    def _bulk_decrypter(self, entry=None, rev=None):
+        """Returns a function decrypting paths for one bulk read
+
+        The packs of every store are read through one PackReader per
+        store, so each pack is decrypted at most once.
+        """
+        packs = dict(
+            (prefix, store.open_packs() if rev is None else None)
+            for prefix, store in self.stores.items()
+        )
+
+        def decrypt(path):
+            prefix = self._mount_of(path)
+            relative_path = path.strip('/')[len(prefix):].lstrip('/')
+            store = self.stores[prefix]
+            if rev is None and not store.has_password(relative_path):
+                raise Exception('%s is not in the password store' % path)
+            return store.get_decrypted_password(
+                relative_path, entry=entry, rev=rev, packs=packs[prefix]
+            )
+
+        return decrypt
+
+    def iter_decrypted_passwords(self, paths, entry=None, rev=None):
+        """Decrypts passwords concurrently, yielding them in order
+
+        :param paths: An iterable of paths. It is consumed while the first
+                      passwords are decrypted, so it can be a stream.
+        :param entry: The entry to retreive. (EntryType enum)
+        :param rev: Read the passwords as they were at this git revision.
+        :returns: An iterator of (path, content, error) tuples. error is
+                  None, or why the password could not be read.
+        """
+        decrypt_path = self._bulk_decrypter(entry=entry, rev=rev)
+
+        def decrypt(path):
+            try:
+                return path, decrypt_path(path), None
+            except Exception as e:
+                return path, None, str(e)
+
+        pool = ThreadPool(self.workers)
+        try:
+            for result in pool.imap(decrypt, paths):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+
+    def get_decrypted_passwords(self, paths, entry=None,
+                                skip_undecryptable=False):
+        """Like PasswordStore.get_decrypted_passwords, across stores
+
+        The passwords of each store are decrypted by that store, all the
+        stores at the same time.
+        """
+        paths_by_prefix = {}
+        for path in set(paths):
+            paths_by_prefix.setdefault(self._mount_of(path), []).append(
+                path.strip('/')
+            )
+
+        def decrypt(prefix, store):
+            paths = paths_by_prefix.get(prefix, [])
+            relative = dict(
+                (path[len(prefix):].lstrip('/'), path) for path in paths
+            )
+            decrypted = store.get_decrypted_passwords(
+                list(relative), entry=entry,
+                skip_undecryptable=skip_undecryptable
+            )
+            return dict(
+                (relative[path], value) for path, value in decrypted.items()
+            )
+
+        decrypted_passwords = {}
+        for results in self._map_stores(decrypt).values():
+            decrypted_passwords.update(results)
+        return decrypted_passwords
+
+    def grep(self, pattern, flags=0, undecryptable=None):
+        """Yields the lines of the passwords that match a regular expression
+
+        Passwords are decrypted concurrently and yielded in order as soon
+        as they are searched, packed folders from their pack. Passwords
+        that can't be decrypted are skipped, and gpg is not even run for
+        the ones that are not encrypted for any of our secret keys.
+
+        :param pattern: A Python regular expression.
+        :param flags: re flags, such as re.IGNORECASE.
+        :param undecryptable: A list the passwords not encrypted for any of
+                              our secret keys are appended to.
+        :returns: An iterator of (path, matching lines) tuples.
+        """
+        regex = re.compile(pattern, flags)
+        decrypt = self._bulk_decrypter()
+
+        def search(path):
+            try:
+                content = decrypt(path)
+            except MissingSecretKeyError:
+                if undecryptable is not None:
+                    undecryptable.append(path)
+                return path, []
+            except Exception:
+                return path, []
+            return path, [
+                line for line in content.splitlines() if regex.search(line)
+            ]
+
+        pool = ThreadPool(self.workers)
+        try:
+            for path, lines in pool.imap(search, self.get_passwords_list()):
+                if lines:
+                    yield path, lines
+        finally:
+            pool.close()
+            pool.join()
+
+    def insert_password(self, path, password):
+        """Like PasswordStore.insert_password, in the right store"""
+        store, relative_path = self.resolve(path)
+        return store.insert_password(relative_path, password)
+
+    def close(self):
+        for store in self.stores.values():
+            store.close()
@@ -0,0 +1,783 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import binascii
+import hashlib
+import os
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import zlib
+from stat import S_ISREG
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # noqa: N813
+
+
+class GitCatFile(object):
+    """Reads git objects through one long-lived ``git cat-file --batch``
+
+    The git process is started on the first read and reused for all the
+    following ones, it is started again if it dies.
+
+    :param git_dir: The git directory to read objects from.
+    """
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        self._process = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                [
+                    'git',
+                    '--git-dir=%s' % self.git_dir,
+                    'cat-file',
+                    '--batch',
+                ],
+                shell=False,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE
+            )
+        return self._process
+
+    def read_object(self, name):
+        """Returns the type and content of a git object
+
+        :param name: Anything git understands as an object name. Example:
+                     'HEAD~3:Email/bob.net.gpg'
+        :returns: A (type, content) tuple, or None if the object does not
+                  exist.
+        """
+        if '\n' in name:
+            raise ValueError('Object names cannot contain newlines')
+
+        with self._lock:
+            process = self._start()
+            process.stdin.write(name.encode() + b'\n')
+            process.stdin.flush()
+
+            header = process.stdout.readline()
+            if not header:
+                self._process = None
+                raise Exception('git cat-file exited unexpectedly')
+
+            # "<name> missing" or "<name> ambiguous", the name may contain
+            # spaces
+            header = header.rstrip(b'\n')
+            if header.endswith(b' missing') or \
+                    header.endswith(b' ambiguous'):
+                return None
+
+            _, object_type, size = header.rsplit(b' ', 2)
+            content = process.stdout.read(int(size))
+            process.stdout.read(1)
+
+        return object_type.decode(), content
+
+    def read(self, rev, path):
+        """Returns the content of a file at a given revision
+
+        :param rev: The revision. Example: 'HEAD~1'
+        :param path: The path of the file in the repository.
+        :returns: The content as bytes, or None if the file does not exist
+                  at that revision.
+        """
+        git_object = self.read_object('%s:%s' % (rev, path))
+        if git_object is None or git_object[0] != 'blob':
+            return None
+        return git_object[1]
+
+    def close(self):
+        with self._lock:
+            if self._process is not None:
+                self._process.stdin.close()
+                self._process.wait()
+                self._process.stdout.close()
+                self._process = None
+
+
+class SubprocessGitBackend(object):
+    """Updates the git repository of a password store by running git
+
+    :param git_dir: The git directory.
+    :param work_tree: The root of the password store.
+    """
+
+    def __init__(self, git_dir, work_tree):
+        self.git_dir = git_dir
+        self.work_tree = work_tree
+
+    def _git(self, *args):
+        return subprocess.call(
+            [
+                'git',
+                '--git-dir=%s' % self.git_dir,
+                '--work-tree=%s' % self.work_tree,
+            ] + list(args),
+            shell=False
+        )
+
+    def output(self, *args):
+        """Runs git and returns what it printed
+
+        :returns: The standard output, or None if git failed.
+        """
+        git = subprocess.Popen(
+            [
+                'git',
+                '--git-dir=%s' % self.git_dir,
+                '--work-tree=%s' % self.work_tree,
+            ] + list(args),
+            shell=False,
+            stdout=subprocess.PIPE
+        )
+        stdout, _ = git.communicate()
+        if git.returncode != 0:
+            return None
+        return stdout.decode('utf8')
+
+    def init(self):
+        """Creates an empty git repository"""
+        self._git('init')
+
+    def set_config(self, key, value):
+        self._git('config', '--local', key, value)
+
+    def add_and_commit(self, paths, message=None):
+        """Stages paths and commits them
+
+        :param paths: The paths to stage, relative to the work tree. Paths
+                      that no longer exist are staged as removed.
+        :param message: The commit message. If None, git opens an editor.
+        """
+        # git add fails on paths that are neither in the work tree nor in
+        # the index, such as a file added then removed before committing.
+        missing = [
+            path for path in paths
+            if not os.path.lexists(os.path.join(self.work_tree, path))
+        ]
+        if missing:
+            tracked = [
+                tracked_path for tracked_path in (
+                    self.output('ls-files', '-z', '--', *missing) or ''
+                ).split('\0') if tracked_path
+            ]
+            paths = [
+                path for path in paths
+                if path not in missing or any(
+                    tracked_path == path.rstrip('/') or
+                    tracked_path.startswith(path.rstrip('/') + '/')
+                    for tracked_path in tracked
+                )
+            ]
+            if not paths:
+                return
+
+        self._git('add', '--all', '--', *paths)
+
+        if message:
+            self._git('commit', '-m', message)
+        else:
+            self._git('commit')
+
+    def close(self):
+        pass
+
+
+class _Unsupported(Exception):
+    """Raised when the in-process backend must defer to git"""
+
+
+def _pad_index_entry(length):
+    return 8 - (length % 8)
+
+
+def _timezone_offset(timestamp):
+    local_time = time.localtime(timestamp)
+    offset = getattr(local_time, 'tm_gmtoff', None)
+    if offset is None:
+        offset = -(time.altzone if local_time.tm_isdst else time.timezone)
+    sign = '+' if offset >= 0 else '-'
+    offset = abs(offset) // 60
+    return '%s%02d%02d' % (sign, offset // 60, offset % 60)
+
+
+def _cleanup_message(message):
+    """Mimics git commit's default cleanup of -m messages"""
+    lines = [line.rstrip() for line in message.splitlines()]
+    cleaned = []
+    for line in lines:
+        if line or (cleaned and cleaned[-1]):
+            cleaned.append(line)
+    while cleaned and not cleaned[-1]:
+        cleaned.pop()
+    return '\n'.join(cleaned) + '\n'
+
+
+class InProcessGitBackend(SubprocessGitBackend):
+    """Commits to the git repository of a password store without forking
+
+    Blobs, the index, trees, commits, refs and reflogs are written by
+    Python. Anything this backend cannot reproduce exactly (hooks, signed
+    commits, split or version 4 indexes, adding whole directories, an
+    editor for the message...) is handed over to git, like
+    SubprocessGitBackend does.
+
+    :param git_dir: The git directory.
+    :param work_tree: The root of the password store.
+    """
+
+    HOOKS = ('pre-commit', 'prepare-commit-msg', 'commit-msg', 'post-commit')
+
+    def __init__(self, git_dir, work_tree):
+        super(InProcessGitBackend, self).__init__(git_dir, work_tree)
+        self._config = None
+        self._git_cat_file = None
+        self._known_trees = {}
+        self._lock = threading.Lock()
+
+    def _read_config(self):
+        if self._config is None:
+            git_config = subprocess.Popen(
+                [
+                    'git',
+                    '--git-dir=%s' % self.git_dir,
+                    'config', '--null', '--list',
+                ],
+                shell=False,
+                stdout=subprocess.PIPE
+            )
+            stdout, _ = git_config.communicate()
+            config = {}
+            for item in stdout.decode('utf8', 'replace').split('\0'):
+                key, _, value = item.partition('\n')
+                if key:
+                    config[key.lower()] = value
+            self._config = config
+        return self._config
+
+    def _check_supported(self):
+        config = self._read_config()
+
+        if config.get('commit.gpgsign', 'false').lower() in \
+                ('true', 'yes', 'on', '1'):
+            raise _Unsupported('signed commits')
+        for key in ('core.hookspath', 'extensions.objectformat',
+                    'core.splitindex', 'index.version'):
+            if key in config:
+                raise _Unsupported(key)
+        if config.get('core.autocrlf', 'false').lower() != 'false':
+            raise _Unsupported('core.autocrlf')
+        for hook in self.HOOKS:
+            if os.access(os.path.join(self.git_dir, 'hooks', hook), os.X_OK):
+                raise _Unsupported('hook %s' % hook)
+
+        gitattributes = os.path.join(self.work_tree, '.gitattributes')
+        if os.path.isfile(gitattributes):
+            with open(gitattributes, 'r') as f:
+                attributes = f.read()
+            if 'filter' in attributes or 'text' in attributes or \
+                    'eol' in attributes:
+                raise _Unsupported('.gitattributes')
+
+    def _identity(self, role):
+        config = self._read_config()
+        name = os.getenv('GIT_%s_NAME' % role) or config.get('user.name')
+        email = os.getenv('GIT_%s_EMAIL' % role) or \
+            config.get('user.email')
+        if not name or not email:
+            raise _Unsupported('no identity configured')
+
+        timestamp = int(time.time())
+        return '%s <%s> %d %s' % (
+            name, email, timestamp, _timezone_offset(timestamp)
+        )
+
+    # Objects
+
+    def _object_path(self, sha):
+        return os.path.join(self.git_dir, 'objects', sha[:2], sha[2:])
+
+    def _write_object(self, object_type, content):
+        data = ('%s %d' % (object_type, len(content))).encode() + \
+            b'\0' + content
+        sha = hashlib.sha1(data).hexdigest()
+        object_path = self._object_path(sha)
+
+        if not os.path.exists(object_path):
+            directory = os.path.dirname(object_path)
+            if not os.path.isdir(directory):
+                try:
+                    os.makedirs(directory)
+                except OSError:
+                    if not os.path.isdir(directory):
+                        raise
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix='tmp_obj_')
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(zlib.compress(data))
+            os.chmod(temp_path, 0o444)
+            os.rename(temp_path, object_path)
+
+        return sha
+
+    def _read_commit_tree(self, commit):
+        if commit in self._known_trees:
+            return self._known_trees[commit]
+
+        object_path = self._object_path(commit)
+        if os.path.isfile(object_path):
+            with open(object_path, 'rb') as f:
+                data = zlib.decompress(f.read())
+            content = data[data.index(b'\0') + 1:]
+        else:
+            # Packed object
+            if self._git_cat_file is None:
+                self._git_cat_file = GitCatFile(self.git_dir)
+            git_object = self._git_cat_file.read_object(commit)
+            if git_object is None:
+                return None
+            content = git_object[1]
+
+        tree = content.split(b'\n', 1)[0].split()[1].decode()
+        self._known_trees[commit] = tree
+        return tree
+
+    # Refs
+
+    def _read_ref(self, ref):
+        ref_path = os.path.join(self.git_dir, ref)
+        if os.path.isfile(ref_path):
+            with open(ref_path, 'r') as f:
+                value = f.read().strip()
+            if value.startswith('ref: '):
+                return self._read_ref(value[len('ref: '):])
+            return value or None
+
+        packed_refs = os.path.join(self.git_dir, 'packed-refs')
+        if os.path.isfile(packed_refs):
+            with open(packed_refs, 'r') as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) == 2 and fields[1] == ref:
+                        return fields[0]
+        return None
+
+    def _head_ref(self):
+        """Returns the ref HEAD points to, or 'HEAD' when detached"""
+        with open(os.path.join(self.git_dir, 'HEAD'), 'r') as f:
+            head = f.read().strip()
+        if head.startswith('ref: '):
+            return head[len('ref: '):]
+        return 'HEAD'
+
+    def _lock_file(self, file_path):
+        lock_path = file_path + '.lock'
+        try:
+            fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                         0o666)
+        except OSError:
+            raise _Unsupported('%s is locked' % file_path)
+        return fd, lock_path
+
+    def _update_ref(self, ref, old_sha, new_sha, reflog_message, identity):
+        ref_path = os.path.join(self.git_dir, ref)
+        directory = os.path.dirname(ref_path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        fd, lock_path = self._lock_file(ref_path)
+        try:
+            if self._read_ref(ref) != old_sha:
+                raise _Unsupported('%s changed during the commit' % ref)
+            os.write(fd, (new_sha + '\n').encode())
+            os.close(fd)
+            fd = None
+            os.rename(lock_path, ref_path)
+        finally:
+            if fd is not None:
+                os.close(fd)
+                os.remove(lock_path)
+
+        if self._read_config().get(
+                'core.logallrefupdates', 'true').lower() == 'false':
+            return
+
+        line = '%s %s %s\t%s\n' % (
+            old_sha or '0' * 40, new_sha, identity, reflog_message
+        )
+        for log_ref in set([ref, 'HEAD']):
+            log_path = os.path.join(self.git_dir, 'logs', log_ref)
+            if not os.path.isdir(os.path.dirname(log_path)):
+                os.makedirs(os.path.dirname(log_path))
+            with open(log_path, 'a') as log:
+                log.write(line)
+
+    # Index
+
+    def _read_index(self):
+        """Returns the index version and a dict of its entries
+
+        Each entry maps a path (bytes) to a (mode, sha, raw entry) tuple.
+        """
+        index_path = os.path.join(self.git_dir, 'index')
+        if not os.path.isfile(index_path):
+            return 2, {}
+
+        with open(index_path, 'rb') as f:
+            data = f.read()
+
+        signature, version, count = struct.unpack('>4sII', data[:12])
+        if signature != b'DIRC' or version not in (2, 3):
+            raise _Unsupported('index version %d' % version)
+
+        entries = {}
+        offset = 12
+        for _ in range(count):
+            fields = struct.unpack('>10I20sH', data[offset:offset + 62])
+            mode, sha, flags = fields[6], fields[10], fields[11]
+            header_length = 62
+            if flags & 0x4000:
+                raise _Unsupported('extended index entries')
+            if flags & 0x3000:
+                raise _Unsupported('unmerged index entries')
+
+            name_start = offset + header_length
+            name_end = data.index(b'\0', name_start)
+            path = data[name_start:name_end]
+            length = header_length + len(path)
+            entry_end = offset + length + _pad_index_entry(length)
+
+            entries[path] = (mode, binascii.hexlify(sha).decode(),
+                             data[offset:entry_end])
+            offset = entry_end
+
+        # Only the cache-tree and resolve-undo extensions are safe to drop
+        while offset < len(data) - 20:
+            extension = data[offset:offset + 4]
+            size = struct.unpack('>I', data[offset + 4:offset + 8])[0]
+            if extension not in (b'TREE', b'REUC', b'UNTR', b'FSMN',
+                                 b'EOIE', b'IEOT'):
+                raise _Unsupported('index extension %r' % extension)
+            offset += 8 + size
+
+        return version, entries
+
+    def _index_entry(self, path, file_path, sha):
+        stat = os.lstat(file_path)
+        if not S_ISREG(stat.st_mode):
+            raise _Unsupported('%s is not a regular file' % file_path)
+
+        mode = 0o100755 if stat.st_mode & 0o100 else 0o100644
+        ctime_ns = getattr(stat, 'st_ctime_ns', int(stat.st_ctime * 1e9))
+        mtime_ns = getattr(stat, 'st_mtime_ns', int(stat.st_mtime * 1e9))
+        header = struct.pack(
+            '>10I20sH',
+            (ctime_ns // 10 ** 9) & 0xFFFFFFFF, ctime_ns % 10 ** 9,
+            (mtime_ns // 10 ** 9) & 0xFFFFFFFF, mtime_ns % 10 ** 9,
+            stat.st_dev & 0xFFFFFFFF, stat.st_ino & 0xFFFFFFFF,
+            mode, stat.st_uid, stat.st_gid, stat.st_size & 0xFFFFFFFF,
+            binascii.unhexlify(sha), min(len(path), 0xFFF)
+        )
+        length = len(header) + len(path)
+        return mode, sha, header + path + b'\0' * _pad_index_entry(length)
+
+    def _write_index(self, fd, lock_path, version, entries):
+        body = [struct.pack('>4sII', b'DIRC', version, len(entries))]
+        for path in sorted(entries):
+            body.append(entries[path][2])
+        data = b''.join(body)
+        os.write(fd, data + hashlib.sha1(data).digest())
+        os.close(fd)
+        os.rename(lock_path, os.path.join(self.git_dir, 'index'))
+
+    # Trees
+
+    def _write_tree(self, entries):
+        root = {}
+        for path, (mode, sha, _) in entries.items():
+            parts = path.split(b'/')
+            node = root
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+            node[parts[-1]] = (mode, sha)
+
+        def write(node):
+            items = []
+            for name, value in node.items():
+                if isinstance(value, dict):
+                    items.append((name + b'/', b'40000', name, write(value)))
+                else:
+                    mode, sha = value
+                    items.append(
+                        (name, ('%o' % mode).encode(), name, sha)
+                    )
+            content = b''.join(
+                mode + b' ' + name + b'\0' + binascii.unhexlify(sha)
+                for _, mode, name, sha in sorted(items)
+            )
+            return self._write_object('tree', content)
+
+        return write(root)
+
+    # Commits
+
+    def _stage(self, entries, path):
+        """Updates the index entries for path"""
+        file_path = os.path.join(self.work_tree, path)
+        encoded_path = path.replace(os.sep, '/').encode('utf8')
+
+        if os.path.isdir(file_path):
+            raise _Unsupported('adding directory %s' % path)
+
+        if os.path.lexists(file_path):
+            with open(file_path, 'rb') as f:
+                sha = self._write_object('blob', f.read())
+            entries[encoded_path] = self._index_entry(
+                encoded_path, file_path, sha
+            )
+        else:
+            prefix = encoded_path + b'/'
+            for indexed_path in list(entries):
+                if indexed_path == encoded_path or \
+                        indexed_path.startswith(prefix):
+                    del entries[indexed_path]
+
+    def _commit(self, paths, message):
+        self._check_supported()
+
+        relative_paths = []
+        for path in paths:
+            relative_path = os.path.relpath(
+                os.path.join(self.work_tree, path), self.work_tree
+            )
+            if relative_path == '.' or relative_path.startswith('..'):
+                raise _Unsupported('adding %s' % path)
+            relative_paths.append(relative_path)
+
+        author = self._identity('AUTHOR')
+        committer = self._identity('COMMITTER')
+
+        fd, lock_path = self._lock_file(os.path.join(self.git_dir, 'index'))
+        try:
+            version, entries = self._read_index()
+            for relative_path in relative_paths:
+                self._stage(entries, relative_path)
+
+            ref = self._head_ref()
+            parent = self._read_ref(ref)
+            tree = self._write_tree(entries)
+
+            if parent is not None and \
+                    self._read_commit_tree(parent) == tree:
+                # Nothing to commit, the index is still written like
+                # git add would.
+                self._write_index(fd, lock_path, version, entries)
+                fd = None
+                return
+
+            message = _cleanup_message(message)
+            commit = self._write_object('commit', (
+                'tree %s\n' % tree +
+                ('parent %s\n' % parent if parent else '') +
+                'author %s\n' % author +
+                'committer %s\n' % committer +
+                '\n' + message
+            ).encode('utf8'))
+
+            self._write_index(fd, lock_path, version, entries)
+            fd = None
+        finally:
+            if fd is not None:
+                os.close(fd)
+                os.remove(lock_path)
+
+        self._known_trees[commit] = tree
+        self._update_ref(
+            ref, parent, commit,
+            '%s: %s' % (
+                'commit' if parent else 'commit (initial)',
+                message.split('\n', 1)[0]
+            ),
+            committer
+        )
+
+    def add_and_commit(self, paths, message=None):
+        if message:
+            with self._lock:
+                try:
+                    return self._commit(paths, message)
+                except _Unsupported:
+                    pass
+
+        super(InProcessGitBackend, self).add_and_commit(paths, message)
+
+    def close(self):
+        if self._git_cat_file is not None:
+            self._git_cat_file.close()
+            self._git_cat_file = None
+
+
+class GitWriter(object):
+    """Runs the git operations that write to a repository one at a time
+
+    Operations queued from any thread are run in order by a single
+    background thread, started on the first one, and the caller waits for
+    its own. Operations queued from that thread are run right away.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def run(self, function, *args):
+        """Queues function(*args), waits for it and returns its result
+
+        Exceptions raised by function are raised again in the caller.
+        """
+        if threading.current_thread() is self._thread:
+            return function(*args)
+
+        done = threading.Event()
+        outcome = []
+        with self._lock:
+            if self._thread is None:
+                # A new queue, so that a stopping thread can't take jobs
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._queue,)
+                )
+                self._thread.daemon = True
+                self._thread.start()
+            self._queue.put((function, args, done, outcome))
+
+        done.wait()
+        if outcome[0]:
+            raise outcome[1]
+        return outcome[1]
+
+    def _run(self, jobs):
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+
+            function, args, done, outcome = job
+            try:
+                outcome.extend([False, function(*args)])
+            except BaseException as e:
+                # Even KeyboardInterrupt or SystemExit go to the caller,
+                # the thread stays up for the next operations
+                outcome.extend([True, e])
+            finally:
+                done.set()
+
+    def stop(self):
+        """Stops the background thread once the queued operations ran"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+
+class BackgroundPusher(object):
+    """Pushes from a background thread, coalescing close requests
+
+    Every notify() schedules a push delay seconds later. Notifications
+    received in the meantime push the deadline back, so a burst of commits
+    results in a single push.
+
+    :param push: The function that pushes.
+    :param delay: Seconds without notification before pushing.
+    """
+
+    def __init__(self, push, delay=5.0):
+        self._push = push
+        self.delay = delay
+        self.last_error = None
+        self._pending = False
+        self._last_notification = 0
+        self._stopping = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def notify(self):
+        """Schedules a push"""
+        with self._condition:
+            self._pending = True
+            self._last_notification = time.time()
+            self._condition.notify()
+
+    def _wait_for_push(self):
+        """Returns True when it is time to push, False to stop"""
+        with self._condition:
+            while not self._pending and not self._stopping:
+                self._condition.wait()
+
+            while not self._stopping:
+                remaining = self._last_notification + self.delay - \
+                    time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            if self._stopping:
+                return False
+
+            self._pending = False
+            return True
+
+    def _run(self):
+        while self._wait_for_push():
+            try:
+                self._push()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+
+    def stop(self, flush=True):
+        """Stops the background thread
+
+        :param flush: Push right away if a push is still scheduled.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+
+        if flush and self._pending:
+            self._pending = False
+            self._push()
+
+
+GIT_BACKENDS = {
+    'subprocess': SubprocessGitBackend,
+    'inprocess': InProcessGitBackend,
+}
@@ -0,0 +1,209 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import marshal
+import os
+import threading
+import time
+
+from .keys import write_cache_file
+
+# Directories modified less than this many seconds before they were listed
+# are listed again on the next refresh, in case they changed within the
+# same timestamp.
+RACY_DELAY = 2
+
+
+def _directory_signature(directory):
+    try:
+        stat = os.stat(directory)
+    except OSError:
+        return None
+
+    return (
+        stat.st_ino,
+        getattr(stat, 'st_mtime_ns', stat.st_mtime),
+        getattr(stat, 'st_ctime_ns', stat.st_ctime),
+    )
+
+
+def _mtime(signature):
+    mtime = signature[1]
+    return mtime / 1e9 if isinstance(mtime, int) else mtime
+
+
+class EntryIndex(object):
+    """Sorted list of the entries of a password store
+
+    Only the directories whose modification time changed since they were
+    last listed are listed again, so keeping the index current costs one
+    stat per directory. When watched is set, something else, such as a
+    StoreWatcher, invalidates the directories that change, and listed
+    directories are not checked at all.
+
+    :param path: The root of the password store.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        # relative directory -> (signature, entries, subdirectories)
+        self._directories = {}
+        self._entries = None
+        self._modified = False
+        self._lock = threading.RLock()
+        self.watched = False
+
+    def _list_directory(self, relative_directory):
+        directory = os.path.join(self.path, relative_directory)
+        signature = _directory_signature(directory)
+        entries = []
+        subdirectories = []
+
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            names = []
+
+        for name in names:
+            if relative_directory:
+                relative_name = relative_directory + '/' + name
+            else:
+                relative_name = name
+
+            if name.endswith('.gpg'):
+                if os.path.isfile(os.path.join(directory, name)):
+                    entries.append(relative_name[:-len('.gpg')])
+            elif name != '.git' and \
+                    os.path.isdir(os.path.join(directory, name)) and \
+                    not os.path.islink(os.path.join(directory, name)):
+                subdirectories.append(relative_name)
+
+        if signature is not None and \
+                time.time() - _mtime(signature) < RACY_DELAY:
+            signature = None
+
+        self._directories[relative_directory] = (
+            signature, entries, subdirectories
+        )
+        self._entries = None
+        self._modified = True
+
+    def _refresh_one(self, relative_directory):
+        known = self._directories.get(relative_directory)
+        if known is None or not self.watched and (
+                known[0] is None or known[0] != _directory_signature(
+                    os.path.join(self.path, relative_directory))):
+            self._list_directory(relative_directory)
+
+    def _refresh_directory(self, relative_directory, seen):
+        seen.add(relative_directory)
+        self._refresh_one(relative_directory)
+
+        for subdirectory in self._directories[relative_directory][2]:
+            self._refresh_directory(subdirectory, seen)
+
+    def refresh(self):
+        """Lists again the directories that changed"""
+        with self._lock:
+            seen = set()
+            self._refresh_directory('', seen)
+            for relative_directory in list(self._directories):
+                if relative_directory not in seen:
+                    del self._directories[relative_directory]
+                    self._entries = None
+                    self._modified = True
+
+    def invalidate(self, paths):
+        """Lists again the directories of the given entries
+
+        :param paths: Entries that were added, changed or removed. Example:
+                      ['Email/bob.net']
+        """
+        with self._lock:
+            for path in paths:
+                relative_directory = os.path.dirname(path)
+                while relative_directory not in self._directories and \
+                        relative_directory:
+                    relative_directory = os.path.dirname(relative_directory)
+                self._directories.pop(relative_directory, None)
+                self._entries = None
+                self._modified = True
+
+    def clear(self):
+        with self._lock:
+            self._directories = {}
+            self._entries = None
+            self._modified = True
+
+    def children(self, relative_directory=''):
+        """Returns the content of one directory of the store
+
+        Only that directory is checked for changes, which makes this much
+        cheaper than entries() on large stores.
+
+        :param relative_directory: The directory, relative to the root of
+                                   the store. Example: 'Email'
+        :returns: A tuple of two sorted lists, the entries and the
+                  subdirectories of the directory.
+        """
+        relative_directory = relative_directory.strip('/')
+        with self._lock:
+            self._refresh_one(relative_directory)
+            _, entries, subdirectories = \
+                self._directories[relative_directory]
+            return sorted(entries), sorted(subdirectories)
+
+    def load(self, file_path):
+        """Replaces the index with one saved by save()
+
+        Saved directories are still checked for changes before being used.
+        Unreadable files are ignored.
+        """
+        try:
+            with open(file_path, 'rb') as index_file:
+                path, directories = marshal.load(index_file)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return
+
+        if path != self.path or not isinstance(directories, dict):
+            return
+
+        with self._lock:
+            self._directories = directories
+            self._entries = None
+            self._modified = False
+
+    def save(self, file_path):
+        """Writes the index to file_path if it changed since load()"""
+        with self._lock:
+            if not self._modified and os.path.exists(file_path):
+                return
+            write_cache_file(file_path, (self.path, self._directories))
+            self._modified = False
+
+    def entries(self):
+        """Returns the sorted list of the entries of the store"""
+        with self._lock:
+            self.refresh()
+            if self._entries is None:
+                entries = []
+                for _, directory_entries, _ in self._directories.values():
+                    entries.extend(directory_entries)
+                self._entries = sorted(entries)
+            return list(self._entries)
@@ -0,0 +1,164 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import marshal
+import os
+
+# Files and directories of a GnuPG home that change with its secret keys
+KEYRING_FILES = (
+    'pubring.kbx',
+    'pubring.gpg',
+    'secring.gpg',
+    'private-keys-v1.d',
+)
+
+
+def find_executable(name):
+    """Returns the full path of the program name in $PATH, or None"""
+    for directory in os.environ.get('PATH', os.defpath).split(os.pathsep):
+        candidate = os.path.join(directory, name)
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return candidate
+    return None
+
+
+def find_gpg():
+    """Returns the gpg binary to use, gpg2 if available, or None"""
+    for name in ('gpg2', 'gpg'):
+        if find_executable(name) is not None:
+            return name
+    return None
+
+
+def cache_directory():
+    """Returns the directory where pypass keeps its caches"""
+    return os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or
+        os.path.join(os.path.expanduser('~'), '.cache'),
+        'pypass'
+    )
+
+
+def gnupg_home():
+    return os.environ.get('GNUPGHOME') or \
+        os.path.join(os.path.expanduser('~'), '.gnupg')
+
+
+def _keyring_signature(home):
+    signature = [os.path.abspath(home)]
+    for name in KEYRING_FILES:
+        try:
+            stat = os.stat(os.path.join(home, name))
+        except OSError:
+            signature.append(None)
+            continue
+        signature.append((
+            stat.st_ino,
+            stat.st_size,
+            getattr(stat, 'st_mtime_ns', stat.st_mtime),
+        ))
+    return tuple(signature)
+
+
+def _parse_secret_keys(output):
+    key_ids = []
+    uids = []
+    in_secret_key = False
+
+    for line in output.splitlines():
+        fields = line.split(':')
+        if fields[0] in ('sec', 'ssb'):
+            in_secret_key = True
+            # '#' marks a stub whose secret part is not in the keyring
+            if len(fields) <= 14 or fields[14] != '#':
+                key_ids.append(fields[4])
+        elif fields[0] in ('pub', 'sub'):
+            in_secret_key = False
+        elif fields[0] == 'uid' and in_secret_key and len(fields) > 9 and \
+                fields[9]:
+            uids.append(fields[9])
+
+    return sorted(set(key_ids)), sorted(set(uids))
+
+
+def write_cache_file(cache_path, value):
+    """Atomically replaces cache_path with the marshalled value
+
+    Cache files are best effort, failing to write one is not an error.
+    """
+    directory = os.path.dirname(cache_path)
+    temp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        with open(temp_path, 'wb') as cache_file:
+            marshal.dump(value, cache_file)
+        os.rename(temp_path, cache_path)
+    except (IOError, OSError):
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def list_secret_keys(gpg_bin=None, cache_path=None):
+    """Lists the secret keys of the GnuPG keyring
+
+    gpg is only run when the keyring changed since the previous call that
+    used the same cache_path.
+
+    :param gpg_bin: The gpg binary to run. Defaults to find_gpg().
+    :param cache_path: Where to keep the result between calls. Defaults to
+                       a file in cache_directory().
+    :returns: A tuple of two sorted lists, the ids of the secret keys and
+              subkeys, and their user ids.
+    """
+    home = gnupg_home()
+    signature = _keyring_signature(home)
+    if cache_path is None:
+        cache_path = os.path.join(cache_directory(), 'secret-keys')
+
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            cached_signature, key_ids, uids = marshal.load(cache_file)
+        if cached_signature == signature:
+            return list(key_ids), list(uids)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        pass
+
+    # Imported here so that cache hits do not pay for it
+    import subprocess
+
+    gpg = subprocess.Popen(
+        [
+            gpg_bin or find_gpg() or 'gpg',
+            '--list-secret-keys',
+            '--with-colons',
+        ],
+        shell=False,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    output = gpg.communicate()[0].decode('utf-8', 'replace')
+    key_ids, uids = _parse_secret_keys(output)
+
+    if gpg.returncode == 0:
+        write_cache_file(cache_path, (signature, key_ids, uids))
+
+    return key_ids, uids
@@ -0,0 +1,168 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import threading
+
+from .keys import cache_directory
+
+
+def _hash_file(file_path):
+    try:
+        with open(file_path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+def manifest_path(store_path):
+    """Returns where the content manifest of a store is kept"""
+    return os.path.join(
+        cache_directory(),
+        'manifest-%08x.gpg' % (
+            binascii.crc32(store_path.encode('utf-8')) & 0xffffffff
+        )
+    )
+
+
+class ContentManifest(object):
+    """Keyed hashes of the content of the passwords of a store
+
+    For every password written through the store, the manifest keeps an
+    HMAC of its content, the hash of the encrypted file that was written
+    and the gpg id it was encrypted for. Writing the same content again
+    can then be skipped, as long as the encrypted file and its gpg id did
+    not change since.
+
+    The HMAC key is random and, like the rest of the manifest, is only
+    ever written to disk encrypted.
+
+    :param store_path: The root of the password store.
+    :param encrypt: Called as encrypt(text, file_path) to write the
+                    encrypted manifest. Returns True on success.
+    :param decrypt: Called as decrypt(file_path) to read the encrypted
+                    manifest. Returns None when it can't be decrypted.
+    :param file_path: Where to keep the encrypted manifest. Defaults to a
+                      file in the pypass cache directory.
+    """
+
+    def __init__(self, store_path, encrypt, decrypt, file_path=None):
+        self.store_path = store_path
+        self.file_path = file_path or manifest_path(store_path)
+        self._encrypt = encrypt
+        self._decrypt = decrypt
+        self._key = None
+        self._entries = None
+        self._modified = False
+        self._lock = threading.RLock()
+
+    def _load(self):
+        if self._entries is not None:
+            return
+
+        manifest = None
+        if os.path.isfile(self.file_path):
+            try:
+                manifest = json.loads(self._decrypt(self.file_path) or '')
+            except ValueError:
+                manifest = None
+
+        if isinstance(manifest, dict) and \
+                manifest.get('path') == self.store_path:
+            self._key = binascii.unhexlify(manifest['key'])
+            self._entries = manifest['entries']
+        else:
+            self._key = os.urandom(32)
+            self._entries = {}
+
+    def _digest(self, content):
+        return hmac.new(
+            self._key, content.encode('utf-8'), hashlib.sha256
+        ).hexdigest()
+
+    def is_unchanged(self, path, content, passfile_path, gpg_id):
+        """Tells if passfile_path already holds content encrypted for gpg_id
+
+        :param path: The path of the password. Example: 'Email/bob.net'
+        :param content: The content about to be written.
+        :param passfile_path: The encrypted file of the password.
+        :param gpg_id: The gpg id the content would be encrypted for.
+        """
+        with self._lock:
+            self._load()
+            recorded = self._entries.get(path)
+            if recorded is None:
+                return False
+
+            digest, file_hash, recorded_gpg_id = recorded
+            return hmac.compare_digest(
+                digest, self._digest(content)
+            ) and recorded_gpg_id == gpg_id and \
+                file_hash == _hash_file(passfile_path)
+
+    def record(self, path, content, passfile_path, gpg_id):
+        """Remembers that passfile_path now holds content"""
+        with self._lock:
+            self._load()
+            file_hash = _hash_file(passfile_path)
+            if file_hash is None:
+                self._entries.pop(path, None)
+            else:
+                self._entries[path] = [
+                    self._digest(content), file_hash, gpg_id
+                ]
+            self._modified = True
+
+    def forget(self, path):
+        """Forgets the content of path, after it was removed"""
+        with self._lock:
+            self._load()
+            if self._entries.pop(path, None) is not None:
+                self._modified = True
+
+    def save(self):
+        """Writes the manifest, encrypted, if it changed"""
+        with self._lock:
+            if not self._modified:
+                return
+
+            directory = os.path.dirname(self.file_path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory, 0o700)
+
+            temp_path = '%s.%d.tmp' % (self.file_path, os.getpid())
+            try:
+                if self._encrypt(
+                    json.dumps({
+                        'version': 1,
+                        'path': self.store_path,
+                        'key': binascii.hexlify(self._key).decode(),
+                        'entries': self._entries,
+                    }),
+                    temp_path
+                ):
+                    os.rename(temp_path, self.file_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            self._modified = False
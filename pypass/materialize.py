@@ -0,0 +1,217 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import hashlib
+import json
+import os
+import tempfile
+
+MANIFEST_NAME = '.pypass-manifest'
+
+
+def _hash_file(file_path):
+    try:
+        with open(file_path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+def _write_private_file(file_path, content):
+    """Atomically replaces file_path with content, readable only by us"""
+    directory = os.path.dirname(file_path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0o700)
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.pypass-')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(content)
+        os.rename(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _remove_empty_directories(file_path, top):
+    directory = os.path.dirname(file_path)
+    while directory != top:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            return
+        directory = os.path.dirname(directory)
+
+
+def is_tmpfs(path):
+    """Tells if path is on a memory-backed filesystem
+
+    Always returns False where /proc/mounts is not available.
+    """
+    path = os.path.realpath(path)
+    mount_type = None
+    longest_mount_point = ''
+
+    try:
+        with open('/proc/mounts', 'r') as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace('\\040', ' ')
+                if (path == mount_point or path.startswith(
+                        mount_point.rstrip('/') + '/')) and \
+                        len(mount_point) >= len(longest_mount_point):
+                    longest_mount_point = mount_point
+                    mount_type = fields[2]
+    except (IOError, OSError):
+        return False
+
+    return mount_type in ('tmpfs', 'ramfs')
+
+
+class Materializer(object):
+    """Keeps a directory of plain text copies of store entries
+
+    Every password below subfolder is written to a file of the same name
+    in destination, with mode 0600. A manifest of the hashes of the
+    encrypted files is kept in destination, so that only passwords whose
+    encrypted file changed are decrypted again.
+
+    :param store: The PasswordStore to read passwords from.
+    :param destination: The directory to write passwords to. It should be
+                        on a tmpfs.
+    :param subfolder: Only materialize passwords below this folder of the
+                      store. Defaults to the whole store.
+    """
+
+    def __init__(self, store, destination, subfolder=''):
+        self.store = store
+        self.destination = os.path.abspath(destination)
+        self.subfolder = subfolder.strip('/')
+        self.manifest_path = os.path.join(self.destination, MANIFEST_NAME)
+
+    @property
+    def source(self):
+        return os.path.join(self.store.path, self.subfolder)
+
+    def _store_path(self, name):
+        return '/'.join(filter(None, [self.subfolder, name]))
+
+    def _list_entries(self):
+        entries = []
+        for root, dirnames, filenames in os.walk(self.source):
+            dirnames[:] = [d for d in dirnames if d != '.git']
+            for filename in filenames:
+                if filename.endswith('.gpg'):
+                    entries.append(os.path.relpath(
+                        os.path.join(root, filename[:-len('.gpg')]),
+                        self.source
+                    ).replace(os.sep, '/'))
+        return entries
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as manifest:
+                return json.load(manifest)['entries']
+        except (IOError, OSError, ValueError, KeyError):
+            return {}
+
+    def _write_manifest(self, entries):
+        _write_private_file(
+            self.manifest_path,
+            json.dumps({'version': 1, 'entries': entries}).encode()
+        )
+
+    def sync(self, names=None):
+        """Brings destination up to date with the store
+
+        :param names: Only look at these entries, relative to subfolder.
+                      By default, every entry of subfolder is looked at.
+        :returns: A tuple of two sorted lists, the written entries and the
+                  removed entries.
+        """
+        if not os.path.isdir(self.destination):
+            os.makedirs(self.destination, 0o700)
+
+        manifest = self._read_manifest()
+        if names is None:
+            names = set(self._list_entries()) | set(manifest)
+
+        hashes = {}
+        for name in set(names):
+            hashes[name] = _hash_file(
+                os.path.join(self.source, name + '.gpg')
+            )
+
+        changed = sorted(
+            name for name, digest in hashes.items()
+            if digest is not None and (
+                manifest.get(name) != digest or
+                not os.path.isfile(os.path.join(self.destination, name))
+            )
+        )
+        removed = sorted(
+            name for name, digest in hashes.items()
+            if digest is None and name in manifest
+        )
+
+        decrypted_passwords = self.store.get_decrypted_passwords(
+            self._store_path(name) for name in changed
+        )
+        for name in changed:
+            _write_private_file(
+                os.path.join(self.destination, name),
+                decrypted_passwords[self._store_path(name)].encode()
+            )
+            manifest[name] = hashes[name]
+
+        for name in removed:
+            file_path = os.path.join(self.destination, name)
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+                _remove_empty_directories(file_path, self.destination)
+            del manifest[name]
+
+        if changed or removed or not os.path.isfile(self.manifest_path):
+            self._write_manifest(manifest)
+
+        return changed, removed
+
+    def watch(self, watcher, callback=None):
+        """Keeps destination up to date until interrupted
+
+        :param watcher: A StoreWatcher on the store or on subfolder.
+        :param callback: Called with the result of every sync.
+        """
+        source = os.path.abspath(self.source)
+        while True:
+            names = set()
+            for _, relative_path in watcher.read_events():
+                name = os.path.relpath(
+                    os.path.join(watcher.path, relative_path),
+                    source
+                )
+                if name.endswith('.gpg') and not name.startswith('..'):
+                    names.add(name[:-len('.gpg')].replace(os.sep, '/'))
+
+            if names:
+                result = self.sync(names)
+                if callback is not None:
+                    callback(*result)
@@ -0,0 +1,185 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import base64
+import binascii
+import struct
+
+PKESK = 1
+SKESK = 3
+SED = 9
+MARKER = 10
+SEIPD = 18
+AEAD = 20
+
+# Packets that may be split in chunks with partial body lengths
+PARTIAL_LENGTH_TAGS = (8, SED, 11, SEIPD, AEAD)
+
+ARMOR_HEADER = b'-----BEGIN PGP MESSAGE-----'
+
+
+def dearmor(data):
+    """Returns the binary content of an ASCII armored message"""
+    lines = data.splitlines()
+    try:
+        end = lines.index(b'-----END PGP MESSAGE-----')
+        start = lines.index(b'', 1) + 1
+    except ValueError:
+        raise Exception('truncated armor')
+
+    body = b''.join(
+        line.strip() for line in lines[start:end]
+        if not line.startswith(b'=')
+    )
+    try:
+        return base64.b64decode(body)
+    except (TypeError, binascii.Error):
+        raise Exception('invalid armor')
+
+
+def _read_new_length(data, offset):
+    """Returns (length, offset of the body, is partial)"""
+    if offset >= len(data):
+        raise Exception('truncated packet header')
+
+    first = ord(data[offset:offset + 1])
+    if first < 192:
+        return first, offset + 1, False
+    elif first < 224:
+        if offset + 2 > len(data):
+            raise Exception('truncated packet header')
+        second = ord(data[offset + 1:offset + 2])
+        return ((first - 192) << 8) + second + 192, offset + 2, False
+    elif first == 255:
+        if offset + 5 > len(data):
+            raise Exception('truncated packet header')
+        return struct.unpack('>I', data[offset + 1:offset + 5])[0], \
+            offset + 5, False
+    else:
+        return 1 << (first & 0x1f), offset + 1, True
+
+
+def iter_packets(data):
+    """Yields the (tag, body) of the OpenPGP packets of data
+
+    Both the old and the new packet formats are read, and bodies split in
+    partial lengths are joined.
+
+    :raises Exception: if the packets are malformed or truncated.
+    """
+    offset = 0
+    while offset < len(data):
+        header = ord(data[offset:offset + 1])
+        if not header & 0x80:
+            raise Exception('invalid packet header at byte %d' % offset)
+
+        if header & 0x40:
+            tag = header & 0x3f
+            length, offset, partial = _read_new_length(data, offset + 1)
+            if partial and tag not in PARTIAL_LENGTH_TAGS:
+                raise Exception('partial length in packet %d' % tag)
+
+            chunks = []
+            while partial:
+                if offset + length > len(data):
+                    raise Exception('truncated packet %d' % tag)
+                chunks.append(data[offset:offset + length])
+                length, offset, partial = _read_new_length(
+                    data, offset + length
+                )
+        else:
+            tag = (header >> 2) & 0x0f
+            length_type = header & 0x03
+            offset += 1
+            if length_type == 3:
+                length = len(data) - offset
+            else:
+                size = 1 << length_type
+                if offset + size > len(data):
+                    raise Exception('truncated packet header')
+                length = struct.unpack(
+                    ('>B', '>H', '>I')[length_type],
+                    data[offset:offset + size]
+                )[0]
+                offset += size
+            chunks = []
+
+        if offset + length > len(data):
+            raise Exception('truncated packet %d' % tag)
+        chunks.append(data[offset:offset + length])
+        offset += length
+
+        yield tag, b''.join(chunks)
+
+
+def _pkesk_key_id(body):
+    version = ord(body[0:1]) if body else None
+    if version == 3 and len(body) >= 10:
+        return binascii.hexlify(body[1:9]).decode().upper()
+    elif version == 6 and len(body) >= 2:
+        fingerprint_length = ord(body[1:2])
+        if len(body) >= 2 + fingerprint_length + 1:
+            return binascii.hexlify(
+                body[3:2 + fingerprint_length]
+            ).decode().upper()
+    raise Exception('invalid public-key encrypted session key')
+
+
+def recipient_key_ids(data):
+    """Checks the structure of an encrypted message, returns its recipients
+
+    A message must be made of session key packets followed by exactly one
+    encrypted data packet, with nothing after it. Nothing is decrypted.
+
+    :param data: The content of a .gpg file, binary or ASCII armored.
+    :returns: The key ids the message is encrypted for, as uppercase hex.
+              Key ids of 0000000000000000 are anonymous recipients. For
+              version 6 session keys, the fingerprint is returned.
+    :raises Exception: if the message is malformed.
+    """
+    if data.startswith(ARMOR_HEADER):
+        data = dearmor(data)
+    if not data:
+        raise Exception('empty file')
+
+    key_ids = []
+    session_keys = 0
+    encrypted_data = False
+    for tag, body in iter_packets(data):
+        if encrypted_data:
+            raise Exception('packet %d after the encrypted data' % tag)
+
+        if tag == PKESK:
+            key_ids.append(_pkesk_key_id(body))
+            session_keys += 1
+        elif tag == SKESK:
+            session_keys += 1
+        elif tag in (SED, SEIPD, AEAD):
+            if tag == SEIPD and body[0:1] not in (b'\x01', b'\x02'):
+                raise Exception('unknown encrypted data version')
+            encrypted_data = True
+        elif tag != MARKER:
+            raise Exception('unexpected packet %d' % tag)
+
+    if not encrypted_data:
+        raise Exception('no encrypted data')
+    if not session_keys and tag != SED:
+        raise Exception('no session key')
+    return key_ids
@@ -0,0 +1,165 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import json
+import os
+import threading
+
+from .manifest import _hash_file
+
+# The pack of a folder is kept in this file, next to its passwords
+PACK_NAME = '.pypass-pack'
+
+PACK_MAGIC = 'pypass-pack 1'
+
+
+def pack_path(store_path, folder):
+    """Returns the file of the pack of a folder
+
+    :param store_path: The root of the password store.
+    :param folder: The folder, relative to the store. The root is ''.
+    """
+    return os.path.join(store_path, folder, PACK_NAME)
+
+
+def encode_pack(gpg_id, entries):
+    """Returns the plaintext of a pack
+
+    The first line identifies the format, the second one is a JSON index
+    mapping each name to the offset and length of its content in the rest
+    of the pack, and the hash of the encrypted file it was read from.
+
+    :param gpg_id: The content of the .gpg-id file the pack is encrypted
+                   for.
+    :param entries: A dict mapping the names of the passwords of the folder
+                    to (file hash, content) tuples.
+    """
+    index = {}
+    contents = []
+    offset = 0
+    for name in sorted(entries):
+        file_hash, content = entries[name]
+        index[name] = [offset, len(content), file_hash]
+        contents.append(content)
+        offset += len(content)
+
+    return '%s\n%s\n%s' % (
+        PACK_MAGIC,
+        json.dumps({'gpg_id': gpg_id, 'entries': index}, sort_keys=True),
+        ''.join(contents)
+    )
+
+
+def decode_pack(text):
+    """Returns the gpg id, index and contents of a pack, or None"""
+    magic, _, rest = text.partition('\n')
+    if magic != PACK_MAGIC:
+        return None
+
+    header, _, contents = rest.partition('\n')
+    try:
+        header = json.loads(header)
+        return header['gpg_id'], header['entries'], contents
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class PackReader(object):
+    """Reads passwords from the packs of a store, for one bulk read
+
+    Each pack is decrypted at most once, the first time one of its
+    passwords is read, and kept in memory until the reader is dropped.
+    A packed password is only returned while its file still has the hash
+    recorded in the pack, so files written since the folder was packed
+    shadow their packed copy. Packs encrypted for another gpg id than the
+    one of their folder are ignored.
+
+    :param store_path: The root of the password store.
+    :param decrypt: Called as decrypt(file_path). Returns the plaintext,
+                    or None when it can't be decrypted.
+    :param get_gpg_id: Called with the path of a folder, returns the
+                       content of the .gpg-id file that applies to it.
+    """
+
+    def __init__(self, store_path, decrypt, get_gpg_id):
+        self.store_path = store_path
+        self._decrypt = decrypt
+        self._get_gpg_id = get_gpg_id
+        self._packs = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def _load(self, folder):
+        file_path = pack_path(self.store_path, folder)
+        if not os.path.isfile(file_path):
+            return None
+
+        try:
+            gpg_id = self._get_gpg_id(os.path.join(self.store_path, folder))
+        except Exception:
+            return None
+
+        pack = decode_pack(self._decrypt(file_path) or '')
+        if pack is None or pack[0] != gpg_id:
+            return None
+        return pack
+
+    def _pack(self, folder):
+        with self._lock:
+            if folder in self._packs:
+                return self._packs[folder]
+            loading = self._loading.setdefault(folder, threading.Lock())
+
+        # Workers reading the same folder wait for one decryption
+        with loading:
+            with self._lock:
+                if folder in self._packs:
+                    return self._packs[folder]
+            pack = self._load(folder)
+            with self._lock:
+                self._packs[folder] = pack
+            return pack
+
+    def get(self, path):
+        """Returns the packed content of a password, or None
+
+        None is returned when the password is not packed, or when its
+        file changed or was removed since.
+
+        :param path: The path of the password. Example: 'Email/bob.net'
+        """
+        folder, _, name = path.rpartition('/')
+        pack = self._pack(folder)
+        if pack is None or name not in pack[1]:
+            return None
+
+        offset, length, file_hash = pack[1][name]
+        if _hash_file(os.path.join(self.store_path, path + '.gpg')) != \
+                file_hash:
+            return None
+        return pack[2][offset:offset + length]
+
+    def is_current(self, folder, paths):
+        """Tells if the pack of folder holds exactly the current paths"""
+        pack = self._pack(folder)
+        if pack is None or \
+                set(pack[1]) != set(p.rpartition('/')[2] for p in paths):
+            return False
+        return all(self.get(path) is not None for path in paths)
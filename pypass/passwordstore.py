@@ -17,34 +17,182 @@
 #    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import contextlib
 import os
+import shutil
 import subprocess
 import string
-import re
+import tempfile
+import threading
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
-from .entry_type import EntryType
+from .cache import DecryptionCache
+from .cache import file_signature
+from .crypto import CRYPTO_BACKENDS
+from .crypto import CryptoBackend
+from .entry_type import extract_entry
+from .git import GIT_BACKENDS
+from .git import BackgroundPusher
+from .git import GitCatFile
+from .git import GitWriter
+from .index import EntryIndex
+from .keys import find_gpg
+from .manifest import ContentManifest
+from .manifest import _hash_file
+from .pack import PACK_NAME
+from .pack import PackReader
+from .pack import encode_pack
+from .pack import pack_path
+from .watch import StoreWatcher
 
-# Secure source of randomness for password generation
+# Find the right gpg binary, the gpg crypto backend fails without one
+GPG_BIN = find_gpg()
+
+# Default number of concurrent gpg processes for bulk operations
 try:
-    from secrets import choice
-except ImportError:
-    import random
-    _system_random = random.SystemRandom()
-    choice = _system_random.choice
-
-# Find the right gpg binary
-if subprocess.call(
-        ['which', 'gpg2'],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE) == 0:
-    GPG_BIN = 'gpg2'
-elif subprocess.call(
-        ['which', 'gpg'],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE) == 0:
-    GPG_BIN = 'gpg'
-else:
-    raise Exception("Could not find GPG")
+    DEFAULT_WORKERS = cpu_count()
+except NotImplementedError:
+    DEFAULT_WORKERS = 4
+
+
+def _map_concurrently(function, items, workers=None):
+    """Returns [function(item) for item in items], computed by a pool"""
+    items = list(items)
+    if len(items) <= 1:
+        return [function(item) for item in items]
+
+    pool = ThreadPool(min(workers or DEFAULT_WORKERS, len(items)))
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _makedirs(directory):
+    """Creates directory and its parents, unless another thread did"""
+    try:
+        os.makedirs(directory)
+    except OSError:
+        if not os.path.isdir(directory):
+            raise
+
+
+def _temporary_path(file_path):
+    """Returns a new empty file to write file_path under, then rename"""
+    fd, temp_path = tempfile.mkstemp(
+        prefix='.%s.' % os.path.basename(file_path),
+        suffix='.tmp',
+        dir=os.path.dirname(file_path)
+    )
+    os.close(fd)
+    return temp_path
+
+
+def _copy_file(source, destination):
+    """Copies source to destination, which is replaced at once"""
+    temp_path = _temporary_path(destination)
+    try:
+        shutil.copy2(source, temp_path)
+        os.rename(temp_path, destination)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class _EntryLocks(object):
+    """Write locks of the entries of a store, created when needed"""
+
+    def __init__(self):
+        # path -> [lock, how many threads hold or wait for it]
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def hold(self, paths):
+        """Holds the locks of paths, taken in order to avoid deadlocks"""
+        # 'a//b' and 'a/b/' are the same entry as 'a/b'
+        paths = sorted(set(
+            os.path.normpath(path.strip('/')) for path in paths
+        ))
+        with self._lock:
+            locks = []
+            for path in paths:
+                lock = self._locks.setdefault(path, [threading.Lock(), 0])
+                lock[1] += 1
+                locks.append(lock[0])
+
+        acquired = []
+        try:
+            for lock in locks:
+                lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+            with self._lock:
+                for path in paths:
+                    self._locks[path][1] -= 1
+                    if not self._locks[path][1]:
+                        del self._locks[path]
+
+
+class MissingSecretKeyError(Exception):
+    """A password is encrypted only for keys we have no secret key of
+
+    It is raised before running gpg, from the key ids in the file.
+
+    :param path: The password. Example: 'Email/bob.net'
+    :param key_ids: The key ids the password is encrypted for.
+    """
+
+    def __init__(self, path, key_ids):
+        Exception.__init__(
+            self,
+            'Couldn\'t decrypt %s, it is only encrypted for %s and none '
+            'of them is a secret key of yours' % (path, ', '.join(key_ids))
+        )
+        self.path = path
+        self.key_ids = key_ids
+
+
+def _password_chars(digits, symbols):
+    chars = string.ascii_letters
+
+    if symbols:
+        chars += string.punctuation
+
+    if digits:
+        chars += string.digits
+
+    return chars
+
+
+def _random_passwords(chars, length, count):
+    """Returns count random passwords made of chars
+
+    Random bytes come from os.urandom, drawn in bulk. Bytes above the
+    largest multiple of len(chars) are rejected so that every character is
+    equally likely.
+    """
+    limit = 256 - 256 % len(chars)
+    needed = length * count
+    picked = []
+
+    while len(picked) < needed:
+        missing = needed - len(picked)
+        # Draw enough bytes to rarely need another round
+        for byte in bytearray(os.urandom(missing + missing // 2 + 16)):
+            if byte < limit:
+                picked.append(chars[byte % len(chars)])
+                if len(picked) == needed:
+                    break
+
+    return [
+        ''.join(picked[i * length:(i + 1) * length]) for i in range(count)
+    ]
 
 
 class PasswordStore(object):
@@ -54,18 +202,82 @@ class PasswordStore(object):
                  '$home/.password-store'.
     :param git_dir: The git directory of the password store. By default,
                     it looks for a .git directory in the password store.
+    :param cache_decrypted: Keep decrypted passwords in memory and only
+                            decrypt them again when their file changes.
+                            Defaults to False.
+    :param git_backend: How commits are made. 'subprocess' runs git,
+                        'inprocess' writes the git objects, index and refs
+                        without forking, and defers to git for what it
+                        does not support. Defaults to 'subprocess'.
+    :param content_manifest: Keep an encrypted manifest of keyed hashes of
+                             the passwords, so that writing a password
+                             that did not change is skipped. Defaults to
+                             False.
+    :param crypto_backend: How passwords are encrypted and decrypted. 'gpg'
+                           runs gpg, 'gpg-server' reuses long-lived gpg
+                           processes, 'pgpy' works in process with PGPy
+                           and the keys listed in PASSWORD_STORE_PGPY_KEYS.
+                           A CryptoBackend instance can be given too.
+                           Defaults to 'gpg'.
+
+    A PasswordStore can be shared between threads. Reads take no lock and
+    run in parallel. Writes to the same password are serialized, and
+    password files are written under a temporary name and renamed, so
+    they are never seen half written. Commits, pulls and pushes are run
+    one at a time by a single git writer thread.
     """
 
     def __init__(
             self,
             path=os.path.join(os.getenv("HOME"), ".password-store"),
             git_dir=None,
+            cache_decrypted=False,
+            git_backend='subprocess',
+            content_manifest=False,
+            crypto_backend='gpg',
     ):
+        if git_backend not in GIT_BACKENDS:
+            raise Exception('Unknown git backend %s' % git_backend)
+
+        if isinstance(crypto_backend, CryptoBackend):
+            self.crypto = crypto_backend
+        elif crypto_backend in CRYPTO_BACKENDS:
+            self.crypto = CRYPTO_BACKENDS[crypto_backend]()
+        else:
+            raise Exception('Unknown crypto backend %s' % crypto_backend)
+
         self.path = os.path.abspath(path)
+        self.git_backend = git_backend
+        self._git_backend = None
+        self._git_backend_lock = threading.Lock()
+        self._git_writer = GitWriter()
+        self._git_init_lock = threading.Lock()
+        self._entry_locks = _EntryLocks()
+        self._pack_lock = threading.Lock()
+        self._background_pusher = None
+        self.decryption_cache = DecryptionCache() if cache_decrypted else None
+        self.entry_index = EntryIndex(self.path)
+        self._git_cat_file = None
+        self._git_cat_file_lock = threading.Lock()
+        self._store_watcher = None
+        self._watcher_thread = None
+        # directory -> content of its .gpg-id, or None, while watched
+        self._gpg_id_cache = {}
 
         # Check if a main .gpg-id exists
         self._get_gpg_id(self.path)
 
+        if content_manifest:
+            self.content_manifest = ContentManifest(
+                self.path,
+                lambda text, file_path: self._encrypt(
+                    text, file_path, self._get_gpg_id(self.path)
+                ),
+                lambda file_path: self._decrypt(passfile_path=file_path)
+            )
+        else:
+            self.content_manifest = None
+
         # Try to locate the git dir
         git_dir = git_dir or os.path.join(self.path, '.git')
         self.uses_git = os.path.isdir(git_dir)
@@ -85,43 +297,195 @@ class PasswordStore(object):
             commonprefix = os.path.commonprefix([self.path, child_path])
             return commonprefix.startswith(self.path)
 
+    def _read_gpg_id(self, directory):
+        """Returns the content of the .gpg-id file of directory, or None
+
+        While the store is watched, contents are remembered until a
+        .gpg-id file changes.
+        """
+        watched = self._store_watcher is not None
+        if watched and directory in self._gpg_id_cache:
+            return self._gpg_id_cache[directory]
+
+        gpg_id = None
+        gpg_id_path = os.path.join(directory, '.gpg-id')
+        if os.path.isfile(gpg_id_path):
+            with open(gpg_id_path, 'r') as gpg_id_file:
+                gpg_id = gpg_id_file.read().strip()
+
+        if watched:
+            self._gpg_id_cache[directory] = gpg_id
+        return gpg_id
+
     def _get_gpg_id(self, file_location):
         file_path = os.path.abspath(file_location)
+        if file_path.endswith('.gpg'):
+            file_path = os.path.dirname(file_path)
 
         while self._is_valid_store_subpath(file_path):
-            # Read the .gpg-id
-            gpg_id_path = os.path.join(file_path, '.gpg-id')
-            if os.path.isfile(gpg_id_path):
-                with open(gpg_id_path, 'r') as gpg_id_file:
-                    return gpg_id_file.read().strip()
+            gpg_id = self._read_gpg_id(file_path)
+            if gpg_id is not None:
+                return gpg_id
 
             file_path = os.path.dirname(file_path)
 
         raise Exception("could not find .gpg-id file")
 
+    def watch(self, poll_interval=1.0, use_inotify=True):
+        """Keeps the caches of the store current from filesystem events
+
+        A background thread follows a StoreWatcher on the store. Changes to
+        .gpg files update the entry index and the decryption cache, and
+        changes to .gpg-id files the cached recipients. In return, entries
+        are listed without checking any directory for changes, cached
+        passwords are served without checking their file, and .gpg-id
+        files are only read once.
+
+        :param poll_interval: Seconds between two scans of the store when
+                              inotify is not available. Defaults to 1.
+        :param use_inotify: Set to False to force polling.
+        """
+        if self._store_watcher is not None:
+            return
+
+        watcher = StoreWatcher(
+            self.path, poll_interval=poll_interval, use_inotify=use_inotify
+        )
+        # Whatever changes from now on is reported by the watcher
+        self.entry_index.refresh()
+        self._gpg_id_cache.clear()
+        self._store_watcher = watcher
+        self.entry_index.watched = True
+
+        self._watcher_thread = threading.Thread(
+            target=self._follow_watcher, args=(watcher,)
+        )
+        self._watcher_thread.daemon = True
+        self._watcher_thread.start()
+
+    def unwatch(self):
+        """Stops watching the store, see watch()"""
+        watcher, self._store_watcher = self._store_watcher, None
+        if watcher is None:
+            return
+
+        self.entry_index.watched = False
+        self._watcher_thread.join()
+        self._watcher_thread = None
+        watcher.close()
+        self._gpg_id_cache.clear()
+
+    @property
+    def watched(self):
+        return self._store_watcher is not None
+
+    def _follow_watcher(self, watcher):
+        while self._store_watcher is watcher:
+            self.apply_events(watcher.read_events(timeout=0.2))
+
+    def apply_events(self, events):
+        """Updates the caches of the store after changes to its files
+
+        :param events: (event, path) tuples like StoreWatcher.read_events
+                       returns them. Example: [('added', 'Email/bob.gpg')]
+        """
+        changed = []
+        for event, relative_path in events:
+            relative_path = relative_path.replace(os.sep, '/')
+            if relative_path.rpartition('/')[2] == '.gpg-id':
+                self._gpg_id_cache.clear()
+            elif relative_path.endswith('.gpg'):
+                changed.append(relative_path[:-len('.gpg')])
+
+        if changed:
+            self.entry_index.invalidate(changed)
+            if self.decryption_cache is not None:
+                for path in changed:
+                    self.decryption_cache.invalidate(path)
+
     def get_passwords_list(self):
         """Returns a list of the passwords in the store
 
         :returns: Example: ['Email/bob.net', 'example.com']
         """
-        passwords = []
+        return self.entry_index.entries()
 
-        for root, dirnames, filenames in os.walk(self.path):
-            for filename in filenames:
-                if filename.endswith('.gpg'):
-                    path = os.path.join(root, filename.replace('.gpg', ''))
-                    simplified_path = path.replace(self.path + '/', '')
-                    passwords.append(simplified_path)
+    def has_password(self, path):
+        """Returns True if path is a password of the store"""
+        return os.path.isfile(os.path.join(self.path, path + '.gpg'))
 
-        return passwords
+    def at(self, rev):
+        """Returns a read-only view of the store at a git revision
+
+        Nothing is checked out: entries are listed with git ls-tree, and
+        .gpg-id files and passwords are read with git cat-file.
+
+        :param rev: The revision. Example: 'HEAD~3'
+        :returns: A StoreRevision.
+        """
+        return StoreRevision(self, rev)
+
+    def _decrypt(self, passfile_path=None, ciphertext=None):
+        """Decrypts a file, or ciphertext given as bytes
+
+        :returns: The decrypted content, or None if it can't be decrypted.
+        """
+        return self.crypto.decrypt(
+            file_path=passfile_path, ciphertext=ciphertext
+        )
+
+    def _check_secret_keys(self, path, passfile_path=None, ciphertext=None):
+        """Raises MissingSecretKeyError if we can't decrypt a password
+
+        The secret key ids of the crypto backend are cached until the
+        keyring changes, so this only reads the session key packets.
+        """
+        key_ids = self.crypto.missing_secret_keys(
+            file_path=passfile_path, ciphertext=ciphertext
+        )
+        if key_ids is not None:
+            raise MissingSecretKeyError(path, key_ids)
 
-    def get_decrypted_password(self, path, entry=None):
+    def _get_git_cat_file(self):
+        with self._git_cat_file_lock:
+            if self._git_cat_file is None:
+                if not self.uses_git:
+                    raise Exception('The password store does not use git')
+                self._git_cat_file = GitCatFile(self.git_dir)
+            return self._git_cat_file
+
+    def open_packs(self):
+        """Returns a PackReader for one bulk read of the store, see pack()"""
+        return PackReader(
+            self.path,
+            lambda file_path: self._decrypt(passfile_path=file_path),
+            self._get_gpg_id
+        )
+
+    def get_decrypted_password(self, path, entry=None, rev=None, packs=None):
         """Returns the content of the decrypted password file
 
         :param path: The path of the password to be decrypted. Example:
                      'email.com'
         :param entry: The entry to retreive. (EntryType enum)
+        :param rev: Read the password as it was at this git revision.
+                    Example: 'HEAD~1'. By default, the current password is
+                    read.
+        :param packs: A PackReader from open_packs(). The password is read
+                      from the pack of its folder when it is packed and
+                      its file did not change since.
         """
+        if rev is not None:
+            ciphertext = self._get_git_cat_file().read(rev, path + '.gpg')
+            if ciphertext is None:
+                raise Exception('%s does not exist at %s' % (path, rev))
+
+            self._check_secret_keys(path, ciphertext=ciphertext)
+            decrypted_password = self._decrypt(ciphertext=ciphertext)
+            if decrypted_password is None:
+                raise Exception('Couldn\'t decrypt %s at %s' % (path, rev))
+            return extract_entry(decrypted_password, entry)
+
         passfile_path = os.path.realpath(
             os.path.join(
                 self.path,
@@ -129,78 +493,314 @@ class PasswordStore(object):
             )
         )
 
-        gpg = subprocess.Popen(
+        watched = self._store_watcher is not None
+        if self.decryption_cache is not None:
+            # While watched, changes to the file invalidate the cache, so
+            # it is read without a stat
+            signature = None if watched else file_signature(passfile_path)
+            decrypted_password = self.decryption_cache.get(
+                path, signature, check_signature=not watched
+            )
+            if decrypted_password is not None:
+                return extract_entry(decrypted_password, entry)
+            if watched:
+                signature = file_signature(passfile_path)
+
+        if packs is not None:
+            decrypted_password = packs.get(path)
+            if decrypted_password is not None:
+                return extract_entry(decrypted_password, entry)
+
+        self._check_secret_keys(path, passfile_path=passfile_path)
+        decrypted_password = self._decrypt(passfile_path=passfile_path)
+
+        if decrypted_password is not None:
+            # A file rewritten while it was decrypted is not cached
+            if self.decryption_cache is not None and \
+                    (not watched or
+                     signature == file_signature(passfile_path)):
+                self.decryption_cache.set(path, signature, decrypted_password)
+            return extract_entry(decrypted_password, entry)
+        else:
+            raise Exception('Couldn\'t decrypt %s' % path)
+
+    def get_decrypted_passwords(
+            self, paths, entry=None, workers=None, rev=None,
+            skip_undecryptable=False
+    ):
+        """Returns the content of many decrypted password files
+
+        The files are decrypted concurrently, each path only once. The
+        passwords of packed folders are read from their pack, which is
+        decrypted once, see pack().
+
+        :param paths: The paths of the passwords to be decrypted. Example:
+                      ['email.com', 'Email/bob.net']
+        :param entry: The entry to retreive. (EntryType enum)
+        :param workers: How many gpg processes may run at the same time.
+                        By default, the number of CPUs.
+        :param rev: Read the passwords as they were at this git revision.
+        :param skip_undecryptable: Leave out the passwords that are not
+                                   encrypted for any of our secret keys,
+                                   instead of raising MissingSecretKeyError.
+                                   gpg is not run for them. Defaults to
+                                   False.
+        :returns: A dict mapping each path to its decrypted content
+        """
+        undecryptable = object()
+        packs = self.open_packs() if rev is None else None
+
+        def decrypt(path):
+            try:
+                return self.get_decrypted_password(
+                    path, entry=entry, rev=rev, packs=packs
+                )
+            except MissingSecretKeyError:
+                if not skip_undecryptable:
+                    raise
+                return undecryptable
+
+        unique_paths = sorted(set(paths))
+        decrypted_passwords = _map_concurrently(decrypt, unique_paths, workers)
+
+        return dict(
+            (path, decrypted_password) for path, decrypted_password in
+            zip(unique_paths, decrypted_passwords)
+            if decrypted_password is not undecryptable
+        )
+
+    def pack(self, subfolder='', workers=None):
+        """Bundles the passwords of each folder into one encrypted pack
+
+        The pack of a folder is a .pypass-pack file holding the content of
+        all its passwords behind an offset index, encrypted for the
+        .gpg-id of the folder. Bulk reads then decrypt one pack instead of
+        every password of the folder. Password files are kept and stay
+        the reference: a file written after its folder was packed shadows
+        its packed copy until the folder is packed again. Removing or
+        moving a password out of a folder removes the pack of the folder.
+
+        Folders whose pack is current are skipped, and the packs of
+        folders without passwords are removed. Passwords that can't be
+        decrypted are left out, and folders with no other ones are not
+        packed.
+
+        :param subfolder: Only pack the folders below this one.
+        :param workers: How many gpg processes may run at the same time.
+                        By default, the number of CPUs.
+        :returns: The sorted list of the folders whose pack was written or
+                  removed. The root is ''.
+        """
+        with self._pack_lock:
+            return self._pack_locked(subfolder, workers)
+
+    def _pack_locked(self, subfolder, workers):
+        prefix = subfolder.strip('/')
+        by_folder = {}
+        for entry in self.get_passwords_list():
+            if not prefix or entry.startswith(prefix + '/'):
+                by_folder.setdefault(entry.rpartition('/')[0], []).append(
+                    entry
+                )
+
+        packs = self.open_packs()
+        stale = sorted(
+            folder for folder, paths in by_folder.items()
+            if not packs.is_current(folder, paths)
+        )
+
+        def read(path):
+            # Hashed first, so that a file rewritten meanwhile shadows it
+            file_hash = _hash_file(os.path.join(self.path, path + '.gpg'))
+            try:
+                return file_hash, self.get_decrypted_password(
+                    path, packs=packs
+                )
+            except Exception:
+                return None
+
+        paths = [path for folder in stale for path in by_folder[folder]]
+        entries = dict(zip(paths, _map_concurrently(read, paths, workers)))
+
+        def write(folder):
+            """Writes the pack of folder, returns True if it changed"""
+            file_path = pack_path(self.path, folder)
+            packed = dict(
+                (path.rpartition('/')[2], entries[path])
+                for path in by_folder[folder] if entries[path] is not None
+            )
+            if not packed:
+                if not os.path.isfile(file_path):
+                    return False
+                os.remove(file_path)
+                return True
+
+            gpg_id = self._get_gpg_id(os.path.join(self.path, folder))
+            if not self._encrypt(encode_pack(gpg_id, packed), file_path,
+                                 gpg_id):
+                raise Exception('Couldn\'t encrypt the pack of %s' % (
+                    folder or 'the password store'
+                ))
+            return True
+
+        changed = [
+            folder for folder, written in
+            zip(stale, _map_concurrently(write, stale, workers)) if written
+        ]
+
+        # Packs of folders that no longer have passwords
+        for directory, directories, files in os.walk(
+                os.path.join(self.path, prefix)
+        ):
+            directories[:] = [name for name in directories if name != '.git']
+            folder = os.path.relpath(directory, self.path).replace(
+                os.sep, '/'
+            )
+            folder = '' if folder == '.' else folder
+            if PACK_NAME in files and folder not in by_folder:
+                os.remove(os.path.join(directory, PACK_NAME))
+                changed.append(folder)
+
+        return sorted(changed)
+
+    def get_password_history(self, path, entry=None, max_count=None):
+        """Returns the successive versions of a password, newest first
+
+        The revisions are listed by one git log, and all of them are read
+        through the same git process.
+
+        :param path: The path of the password. Example: 'email.com'
+        :param entry: The entry to retreive. (EntryType enum)
+        :param max_count: Only return this many versions.
+        :returns: A list of (commit, decrypted content) tuples. The content
+                  is None for commits that removed the password.
+        """
+        if not self.uses_git:
+            raise Exception('The password store does not use git')
+
+        git_log = subprocess.Popen(
             [
-                GPG_BIN,
-                '--quiet',
-                '--batch',
-                '--use-agent',
-                '-d', passfile_path,
+                'git',
+                '--git-dir=%s' % self.git_dir,
+                '--work-tree=%s' % self.path,
+                'log',
+                '--format=%H',
+            ] + (['--max-count=%d' % max_count] if max_count else []) + [
+                '--',
+                path + '.gpg',
             ],
             shell=False,
-            stdout=subprocess.PIPE
+            stdout=subprocess.PIPE,
+            # The path is relative to the store, not to the caller
+            cwd=self.path
         )
-        gpg.wait()
+        stdout, _ = git_log.communicate()
 
-        if gpg.returncode == 0:
-            decrypted_password = gpg.stdout.read().decode()
+        git_cat_file = self._get_git_cat_file()
+        history = []
+        for commit in stdout.decode().split():
+            ciphertext = git_cat_file.read(commit, path + '.gpg')
+            if ciphertext is None:
+                history.append((commit, None))
+                continue
 
-            if entry == EntryType.username:
-                usr = re.search(
-                    '(?:username|user|login): (.+)',
-                    decrypted_password
-                )
-                if usr:
-                    return usr.groups()[0]
-            elif entry == EntryType.password:
-                pw = re.search('(?:password|pass): (.+)', decrypted_password)
-                if pw:
-                    return pw.groups()[0]
-                else:  # If there is no match, password is the first line
-                    return decrypted_password.split('\n')[0]
-            elif entry == EntryType.hostname:
-                hostname = re.search(
-                    '(?:host|hostname): (.+)', decrypted_password
+            decrypted_password = self._decrypt(ciphertext=ciphertext)
+            if decrypted_password is None:
+                raise Exception(
+                    'Couldn\'t decrypt %s at %s' % (path, commit)
                 )
-                if hostname:
-                    return hostname.groups()[0]
-            else:
-                return decrypted_password
-        else:
-            raise Exception('Couldn\'t decrypt %s' % path)
+            history.append((commit, extract_entry(decrypted_password, entry)))
 
-    def insert_password(self, path, password):
-        """Encrypts the password at the given path
+        return history
 
-        :param path: Where to insert the password. Ex: 'passwordstore.org'
-        :param password: The password to insert, can be multi-line
+    def close(self):
+        """Stops the helper processes started by the password store"""
+        self.unwatch()
+        self.stop_background_push()
+        self._git_writer.stop()
+        self._close_git()
+        self.crypto.close()
+
+    def _close_git(self):
+        """Stops the git processes, so they are restarted for a new git_dir"""
+        with self._git_cat_file_lock:
+            if self._git_cat_file is not None:
+                self._git_cat_file.close()
+                self._git_cat_file = None
+        with self._git_backend_lock:
+            if self._git_backend is not None:
+                self._git_backend.close()
+                self._git_backend = None
+
+    def _encrypt(self, text, file_path, gpg_id):
+        """Encrypts text for gpg_id to file_path
+
+        The file is written under a temporary name and renamed, so that it
+        is replaced at once.
+
+        :param gpg_id: The content of a .gpg-id file, one key per line.
+        :returns: True if the encryption succeeded.
         """
+        temp_path = _temporary_path(file_path)
+        try:
+            if not self.crypto.encrypt(
+                text,
+                temp_path,
+                [line.strip() for line in gpg_id.splitlines() if line.strip()]
+            ):
+                return False
+            os.rename(temp_path, file_path)
+            return True
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
 
+    def _write_password(self, path, password):
+        with self._entry_locks.hold([path]):
+            return self._write_locked_password(path, password)
+
+    def _write_locked_password(self, path, password):
         passfile_path = os.path.realpath(
             os.path.join(self.path, path + '.gpg')
         )
+        gpg_id = self._get_gpg_id(passfile_path)
 
-        if not os.path.isdir(os.path.dirname(passfile_path)):
-            os.makedirs(os.path.dirname(passfile_path))
+        if self.content_manifest is not None and \
+                self.content_manifest.is_unchanged(
+                    path, password, passfile_path, gpg_id):
+            return False
 
-        gpg = subprocess.Popen(
-            [
-                GPG_BIN,
-                '-e',
-                '-r', self._get_gpg_id(passfile_path),
-                '--batch',
-                '--use-agent',
-                '--no-tty',
-                '--yes',
-                '-o', passfile_path
-            ],
-            shell=False,
-            stdin=subprocess.PIPE
-        )
+        _makedirs(os.path.dirname(passfile_path))
 
-        gpg.stdin.write(password.encode())
-        gpg.stdin.close()
-        gpg.wait()
+        if self.decryption_cache is not None:
+            self.decryption_cache.invalidate(path)
+
+        encrypted = self._encrypt(password, passfile_path, gpg_id)
+        self.entry_index.invalidate([path])
+
+        if self.content_manifest is not None:
+            if encrypted:
+                self.content_manifest.record(
+                    path, password, passfile_path, gpg_id
+                )
+            else:
+                self.content_manifest.forget(path)
+
+        return True
+
+    def insert_password(self, path, password):
+        """Encrypts the password at the given path
+
+        :param path: Where to insert the password. Ex: 'passwordstore.org'
+        :param password: The password to insert, can be multi-line
+        :returns: False if the password was left as is because it already
+                  had this content, which is only known to stores created
+                  with content_manifest=True. True otherwise.
+        """
+        written = self._write_password(path, password)
+        if self.content_manifest is not None:
+            self.content_manifest.save()
+        return written
 
     def generate_password(
         self,
@@ -219,28 +819,318 @@ class PasswordStore(object):
         :param first_line_only: Modify only the first line of an existing entry
         :returns: Generated password.
         """
-        if first_line_only:
-            old_content = self.get_decrypted_password(path)
-            content_wo_pass = ''.join(old_content.partition('\n')[1:])
+        return self.generate_passwords(
+            [path],
+            digits=digits,
+            symbols=symbols,
+            length=length,
+            first_line_only=first_line_only
+        )[path]
+
+    def insert_passwords(self, passwords, workers=None):
+        """Encrypts many passwords concurrently
+
+        :param passwords: A dict mapping where to insert each password to
+                          the password. Example: {'passwordstore.org': 'pw'}
+        :param workers: How many gpg processes may run at the same time.
+                        By default, the number of CPUs.
+        :returns: A dict mapping each path to what insert_password would
+                  have returned for it.
+        """
+        paths = sorted(passwords)
+        written = _map_concurrently(
+            lambda path: self._write_password(path, passwords[path]),
+            paths,
+            workers
+        )
+        if self.content_manifest is not None:
+            self.content_manifest.save()
+
+        return dict(zip(paths, written))
+
+    def generate_passwords(
+        self,
+        paths,
+        digits=True,
+        symbols=True,
+        length=25,
+        first_line_only=False,
+        workers=None
+    ):
+        """Generates and stores many random passwords
+
+        The randomness for all the passwords is drawn at once, and the
+        passwords are decrypted (with first_line_only) and encrypted
+        concurrently.
+
+        :param paths: Where to insert the passwords.
+                      Ex: ['passwordstore.org', 'Email/bob.net']
+        :param digits: Should the passwords have digits? Defaults to True
+        :param symbols: Should the passwords have symbols? Defaults to True
+        :param length: Length of the passwords. Defaults to 25
+        :param first_line_only: Modify only the first line of existing
+                                entries
+        :param workers: How many gpg processes may run at the same time.
+                        By default, the number of CPUs.
+        :returns: A dict mapping each path to its generated password.
+        """
+        paths = sorted(set(paths))
+
+        passwords = dict(zip(
+            paths,
+            _random_passwords(
+                _password_chars(digits, symbols), length, len(paths)
+            )
+        ))
+
+        def generate(path):
+            # The old content is read under the lock of the entry, so that
+            # writes made meanwhile are not lost
+            with self._entry_locks.hold([path]):
+                rest = ''
+                if first_line_only:
+                    rest = ''.join(self.get_decrypted_password(
+                        path
+                    ).partition('\n')[1:])
+                self._write_locked_password(path, passwords[path] + rest)
+
+        _map_concurrently(generate, paths, workers)
+        if self.content_manifest is not None:
+            self.content_manifest.save()
+
+        return passwords
+
+    def _entries_below(self, path):
+        """Returns the entries of the folder path, or [path] for an entry"""
+        if not self._is_valid_store_subpath(os.path.join(self.path, path)):
+            raise Exception('%s is not in the password store.' % path)
+
+        if os.path.isdir(os.path.join(self.path, path)):
+            prefix = path.strip('/') + '/' if path.strip('/') else ''
+            return [
+                entry for entry in self.get_passwords_list()
+                if entry.startswith(prefix)
+            ]
+        elif os.path.isfile(os.path.join(self.path, path + '.gpg')):
+            return [path]
+        raise Exception('%s is not in the password store.' % path)
+
+    def _forget_entries(self, paths):
+        self.entry_index.invalidate(paths)
+        for path in paths:
+            if self.decryption_cache is not None:
+                self.decryption_cache.invalidate(path)
+            if self.content_manifest is not None:
+                self.content_manifest.forget(path)
+        if self.content_manifest is not None:
+            self.content_manifest.save()
+
+    def get_destination(self, old_path, new_path):
+        """Returns where old_path goes when moved or copied to new_path
+
+        Like cp(1) and mv(1), a password or folder moved to an existing
+        folder goes inside of it. A new_path ending in a trailing / is
+        always treated as a folder.
+
+        :param old_path: The password or folder to move. Ex: 'a.com'
+        :param new_path: Where to move it. Ex: 'Team/'
+        :returns: old_path and the new path of it. Ex: ('a.com', 'Team/a.com')
+        """
+        is_folder = new_path.endswith('/')
+        old_path = old_path.strip('/')
+        new_path = new_path.strip('/')
+        if is_folder or os.path.isdir(os.path.join(self.path, new_path)):
+            new_path = '/'.join(
+                filter(None, [new_path, os.path.basename(old_path)])
+            )
+        return old_path, new_path
+
+    def remove_password(self, path, recursive=False):
+        """Removes a password, or a folder of passwords
+
+        :param path: The password or folder to remove. Ex: 'Email/bob.net'
+        :param recursive: Allow removing a folder. Defaults to False.
+        :returns: The sorted list of the removed passwords.
+        """
+        entries = self._entries_below(path)
+        folder_path = os.path.join(self.path, path)
+
+        with self._entry_locks.hold(entries):
+            if os.path.isdir(folder_path):
+                if not recursive or \
+                        os.path.realpath(folder_path) == self.path:
+                    raise Exception('%s is a folder.' % path)
+                shutil.rmtree(folder_path)
+            else:
+                os.remove(os.path.join(self.path, path + '.gpg'))
+
+            self._drop_packs(entries)
+            self._forget_entries(entries)
+        return sorted(entries)
+
+    def _copy_entry(self, source, destination, source_gpg_id, gpg_id, move):
+        """Copies or moves one password file, re-encrypting it if needed
+
+        Files that keep their gpg id are copied as they are. The others are
+        decrypted and encrypted again for their new gpg id.
+        """
+        if source_gpg_id == gpg_id:
+            if move:
+                os.rename(source, destination)
+            else:
+                _copy_file(source, destination)
+            return
+
+        decrypted_password = self._decrypt(passfile_path=source)
+        if decrypted_password is None or \
+                not self._encrypt(decrypted_password, destination, gpg_id):
+            raise Exception('Couldn\'t re-encrypt %s' % source)
+        if move:
+            os.remove(source)
+
+    def _copy_or_move(self, old_path, new_path, move, overwrite=True,
+                      workers=None):
+        old_path, new_path = self.get_destination(old_path, new_path)
+        if not old_path:
+            raise Exception('The whole password store can\'t be copied or '
+                            'moved.')
+        old_entries = self._entries_below(old_path)
+        new_entries = [
+            new_path + entry[len(old_path):] for entry in old_entries
+        ]
+
+        with self._entry_locks.hold(old_entries + new_entries):
+            self._copy_or_move_locked(
+                old_path, new_path, old_entries, new_entries, move,
+                overwrite, workers
+            )
+        return old_entries, new_entries
+
+    def _drop_packs(self, entries):
+        """Removes the packs of the folders of entries that were removed
+
+        Otherwise, the packs would keep the passwords, encrypted for the
+        recipients they had.
+        """
+        with self._pack_lock:
+            for folder in set(entry.rpartition('/')[0] for entry in entries):
+                file_path = pack_path(self.path, folder)
+                if os.path.isfile(file_path):
+                    os.remove(file_path)
+
+    def _copy_or_move_locked(self, old_path, new_path, old_entries,
+                             new_entries, move, overwrite, workers):
+        source_folder = os.path.join(self.path, old_path)
+        destination_folder = os.path.join(self.path, new_path)
+        is_folder = os.path.isdir(source_folder)
+        destination = destination_folder if is_folder else \
+            destination_folder + '.gpg'
+        if new_path == old_path or \
+                not self._is_valid_store_subpath(destination) or \
+                os.path.realpath(destination) == self.path or \
+                is_folder and os.path.realpath(destination).startswith(
+                    os.path.realpath(source_folder) + os.sep):
+            raise Exception('%s is not a valid destination.' % new_path)
+
+        if not overwrite:
+            conflicts = [
+                entry for entry in new_entries
+                if os.path.lexists(os.path.join(self.path, entry + '.gpg'))
+            ]
+            if conflicts:
+                raise Exception('%s already exists.' % ', '.join(conflicts))
+
+        # The other files of a folder, such as its .gpg-id files, go first,
+        # as they decide who the passwords are encrypted for. Packs stay
+        # behind, they may be encrypted for other recipients.
+        if is_folder:
+            for directory, _, file_names in os.walk(source_folder):
+                target = os.path.join(
+                    destination_folder,
+                    os.path.relpath(directory, source_folder)
+                )
+                _makedirs(target)
+                for file_name in file_names:
+                    if not file_name.endswith('.gpg') and \
+                            file_name != PACK_NAME:
+                        _copy_file(
+                            os.path.join(directory, file_name),
+                            os.path.join(target, file_name)
+                        )
         else:
-            content_wo_pass = ''
+            _makedirs(os.path.dirname(destination))
 
-        chars = string.ascii_letters
+        files = [
+            (
+                os.path.join(self.path, old_entry + '.gpg'),
+                os.path.join(self.path, new_entry + '.gpg'),
+            )
+            for old_entry, new_entry in zip(old_entries, new_entries)
+        ]
+        _map_concurrently(
+            lambda file_paths: self._copy_entry(
+                file_paths[0],
+                file_paths[1],
+                self._get_gpg_id(file_paths[0]),
+                self._get_gpg_id(file_paths[1]),
+                move
+            ),
+            files,
+            workers
+        )
+
+        if move:
+            if is_folder:
+                shutil.rmtree(source_folder)
+            self._drop_packs(old_entries)
 
-        if symbols:
-            chars += string.punctuation
+    def copy_password(self, old_path, new_path, overwrite=True,
+                      workers=None):
+        """Copies a password, or a folder of passwords
 
-        if digits:
-            chars += string.digits
+        Passwords that end up under a different .gpg-id are decrypted and
+        encrypted again for it, concurrently. The others are copied as
+        they are.
+
+        :param old_path: The password or folder to copy. Ex: 'Email'
+        :param new_path: Where to copy it. Ex: 'Mail'
+        :param overwrite: Replace the passwords that already exist. If
+                          False, nothing is copied when one of them exists.
+                          Defaults to True.
+        :param workers: How many gpg processes may run at the same time.
+        :returns: The sorted list of the new passwords.
+        """
+        _, new_entries = self._copy_or_move(
+            old_path, new_path, False, overwrite, workers
+        )
+        self._forget_entries(new_entries)
+        return sorted(new_entries)
 
-        password = ''.join(choice(chars) for i in range(length))
+    def move_password(self, old_path, new_path, overwrite=True,
+                      workers=None):
+        """Moves a password, or a folder of passwords
 
-        self.insert_password(path, password + content_wo_pass)
+        Like copy_password, passwords are only encrypted again when their
+        .gpg-id changes.
 
-        return password
+        :param old_path: The password or folder to move. Ex: 'Email'
+        :param new_path: Where to move it. Ex: 'Mail'
+        :param overwrite: Replace the passwords that already exist. If
+                          False, nothing is moved when one of them exists.
+                          Defaults to True.
+        :param workers: How many gpg processes may run at the same time.
+        :returns: The sorted list of the passwords that were removed or
+                  created.
+        """
+        old_entries, new_entries = self._copy_or_move(
+            old_path, new_path, True, overwrite, workers
+        )
+        self._forget_entries(old_entries + new_entries)
+        return sorted(set(old_entries + new_entries))
 
     @staticmethod
-    def init(gpg_id, path, clone_url=None):
+    def init(gpg_id, path, clone_url=None, remote='origin', branch=None,
+             depth=None, filter_spec=None, sparse_paths=None):
         """Creates a password store to the given path
 
         :param gpg_id: Default gpg key identification used for encryption and
@@ -250,6 +1140,18 @@ class PasswordStore(object):
         :param clone_url: If specified, the clone_url parameter will be used
                           to import a password store from a git repository.
                           Example: ssh://myserver.net:/home/bob/.password-store
+        :param remote: The name of the cloned remote. Defaults to 'origin'.
+        :param branch: The branch to check out. By default, the branch the
+                       HEAD of the remote points to.
+        :param depth: Only fetch this many commits. 1 only fetches the
+                      current passwords, without their history.
+        :param filter_spec: A partial clone filter. Example: 'blob:none'
+                            only fetches the files that are checked out, and
+                            the others when they are needed. The remote
+                            must allow it with uploadpack.allowFilter.
+        :param sparse_paths: Only check out these folders, and the files at
+                             the root of the store, such as .gpg-id. Needs
+                             git 2.25. Example: ['Team/CI']
         :returns: PasswordStore object
         """
         git_dir = os.path.join(path, '.git')
@@ -259,45 +1161,53 @@ class PasswordStore(object):
         if not os.path.exists(path):
             os.makedirs(path)
 
-        # Clone an existing remote repo
-        if clone_url:
-            # Init git repo
-            subprocess.call(
-                [
-                    "git",
-                    "--git-dir=%s" % git_dir,
-                    "--work-tree=%s" % git_work_tree,
-                    "init", path
-                ],
-                shell=False
-            )
-
-            # Add remote repo
-            subprocess.call(
+        def git(*args):
+            process = subprocess.Popen(
                 [
                     "git",
                     "--git-dir=%s" % git_dir,
                     "--work-tree=%s" % git_work_tree,
-                    "remote",
-                    "add",
-                    "origin",
-                    clone_url
-                ],
+                ] + list(args),
                 shell=False,
+                stdout=subprocess.PIPE
             )
+            stdout, _ = process.communicate()
+            if process.returncode != 0:
+                raise Exception('git %s failed' % args[0])
+            return stdout.decode()
+
+        # Clone an existing remote repo
+        if clone_url:
+            git("init", path)
+            git("remote", "add", remote, clone_url)
+
+            if branch is None:
+                branch = 'master'
+                for line in git(
+                        "ls-remote", "--symref", remote, "HEAD"
+                ).splitlines():
+                    if line.startswith('ref: refs/heads/'):
+                        branch = line.split()[1][len('refs/heads/'):]
 
-            # Pull remote repo
-            # TODO: add parameters for remote and branch ?
-            subprocess.call(
+            # Before anything is checked out, so that a partial clone only
+            # fetches the files of these folders
+            if sparse_paths:
+                git("sparse-checkout", "set", "--cone", *sparse_paths)
+
+            git(*(
+                ["fetch"] +
+                (["--depth=%d" % depth] if depth else []) +
+                (["--filter=%s" % filter_spec] if filter_spec else []) +
                 [
-                    "git",
-                    "--git-dir=%s" % git_dir,
-                    "--work-tree=%s" % git_work_tree,
-                    "pull",
-                    "origin",
-                    "master"
-                ],
-                shell=False
+                    remote,
+                    "+refs/heads/%s:refs/remotes/%s/%s" % (
+                        branch, remote, branch
+                    ),
+                ]
+            ))
+            git(
+                "checkout", "-B", branch, "--track",
+                "%s/%s" % (remote, branch)
             )
 
         gpg_id_path = os.path.join(path, '.gpg-id')
@@ -308,6 +1218,18 @@ class PasswordStore(object):
 
         return PasswordStore(path)
 
+    def _get_git_backend(self):
+        with self._git_backend_lock:
+            backend = self._git_backend
+            if backend is None or backend.git_dir != self.git_dir:
+                if backend is not None:
+                    backend.close()
+                backend = GIT_BACKENDS[self.git_backend](
+                    self.git_dir, self.path
+                )
+                self._git_backend = backend
+            return backend
+
     def git_init(self, git_dir=None):
         """Transform  the existing password store into a git repository
 
@@ -315,19 +1237,17 @@ class PasswordStore(object):
                         be created at the root of the password store in a .git
                         folder.
         """
+        with self._git_init_lock:
+            self._git_init(git_dir)
 
+    def _git_init(self, git_dir):
+        self._close_git()
+        # git_dir is set first, for the threads that check uses_git
         self.git_dir = git_dir or os.path.join(self.path, '.git')
         self.uses_git = True
 
-        subprocess.call(
-            [
-                'git',
-                "--git-dir=%s" % self.git_dir,
-                "--work-tree=%s" % self.path,
-                'init',
-            ],
-            shell=False
-        )
+        git = self._get_git_backend()
+        git.init()
 
         self.git_add_and_commit(
             '.',
@@ -345,64 +1265,318 @@ class PasswordStore(object):
             message="Configure git repository for gpg file diff."
         )
 
-        subprocess.call(
-            [
-                'git',
-                "--git-dir=%s" % self.git_dir,
-                "--work-tree=%s" % self.path,
-                'config',
-                '--local',
-                'diff.gpg.binary',
-                'true'
-            ],
-            shell=False
+        git.set_config('diff.gpg.binary', 'true')
+        git.set_config('diff.gpg.textconv', 'gpg -d')
+
+    def _git_output(self, *args):
+        output = self._get_git_backend().output(*args)
+        if output is None:
+            raise Exception('git %s failed' % args[0])
+        return output
+
+    def _current_branch(self):
+        return self._git_output('symbolic-ref', '--short', 'HEAD').strip()
+
+    def git_push(self, remote='origin', branch=None):
+        """Pushes the current branch
+
+        :param remote: The remote to push to. Defaults to 'origin'.
+        :param branch: The remote branch to update. Defaults to the name of
+                       the current branch.
+        """
+        self._git_writer.run(
+            self._git_output,
+            'push', '--quiet', remote,
+            'HEAD:%s' % (branch or self._current_branch())
         )
 
-        subprocess.call(
-            [
-                'git',
-                "--git-dir=%s" % self.git_dir,
-                "--work-tree=%s" % self.path,
-                'config',
-                '--local',
-                'diff.gpg.textconv',
-                'gpg -d'
-            ],
-            shell=False
+    def sync(self, remote='origin', branch=None, push=True):
+        """Fetches and rebases on a remote branch, then pushes to it
+
+        Only the passwords changed by the rebase are invalidated in the
+        entry index and in the decryption cache.
+
+        :param remote: The remote to sync with. Defaults to 'origin'.
+        :param branch: The remote branch. Defaults to the name of the
+                       current branch.
+        :param push: Push the local commits once rebased. Defaults to True.
+        :returns: The sorted list of the passwords that were added, changed
+                  or removed. Example: ['Email/bob.net']
+        """
+        if not self.uses_git:
+            raise Exception('The password store does not use git')
+
+        branch = branch or self._current_branch()
+
+        def pull():
+            old_head = self._get_git_backend().output(
+                'rev-parse', '--verify', '--quiet', 'HEAD'
+            )
+            self._git_output('pull', '--quiet', '--rebase', remote, branch)
+            return old_head, self._git_output('rev-parse', 'HEAD').strip()
+
+        old_head, new_head = self._git_writer.run(pull)
+
+        if old_head is None:
+            changed_files = self._git_output(
+                'ls-tree', '-r', '-z', '--name-only', new_head
+            )
+        elif old_head.strip() != new_head:
+            changed_files = self._git_output(
+                'diff', '--name-only', '-z', old_head.strip(), new_head
+            )
+        else:
+            changed_files = ''
+
+        changed = sorted(
+            changed_file[:-len('.gpg')]
+            for changed_file in changed_files.split('\0')
+            if changed_file.endswith('.gpg')
         )
 
-    def git_add_and_commit(self, path, message=None):
+        self.entry_index.invalidate(changed)
+        if self.decryption_cache is not None:
+            for path in changed:
+                self.decryption_cache.invalidate(path)
 
-        subprocess.call(
-            [
-                'git',
-                "--git-dir=%s" % self.git_dir,
-                "--work-tree=%s" % self.path,
-                'add',
-                path
-            ],
-            shell=False
+        if push:
+            self.git_push(remote, branch)
+
+        return changed
+
+    def start_background_push(self, delay=5.0, remote='origin', branch=None):
+        """Pushes commits from a background thread
+
+        Instead of pushing after every commit, commits made through this
+        PasswordStore are pushed together once no commit happened for
+        delay seconds. Call stop_background_push, or close, to push what
+        is left.
+
+        :param delay: Seconds without commit before pushing. Defaults to 5.
+        :param remote: The remote to push to. Defaults to 'origin'.
+        :param branch: The remote branch to update. Defaults to the name of
+                       the current branch.
+        """
+        self.stop_background_push()
+        self._background_pusher = BackgroundPusher(
+            lambda: self.git_push(remote, branch),
+            delay=delay
         )
 
-        if message:
-            subprocess.call(
-                [
-                    'git',
-                    "--git-dir=%s" % self.git_dir,
-                    "--work-tree=%s" % self.path,
-                    'commit',
-                    '-m',
-                    message
-                ],
-                shell=False
-            )
+    def stop_background_push(self, flush=True):
+        """Stops pushing from a background thread
+
+        :param flush: Push the commits that were not pushed yet.
+                      Defaults to True.
+        """
+        pusher, self._background_pusher = self._background_pusher, None
+        if pusher is not None:
+            pusher.stop(flush=flush)
+
+    def git_add_and_commit(self, path, message=None):
+        """Commits changes to the git repository of the password store
+
+        :param path: The path to add, relative to the password store, or a
+                     list of paths to add in the same commit. Removed files
+                     are removed from the repository.
+        :param message: The commit message. If None, git opens an editor.
+        """
+        if isinstance(path, (list, tuple, set, frozenset)):
+            paths = list(path)
         else:
-            subprocess.call(
-                [
-                    'git',
-                    "--git-dir=%s" % self.git_dir,
-                    "--work-tree=%s" % self.path,
-                    'commit'
-                ],
-                shell=False
+            paths = [path]
+        self._git_writer.run(
+            lambda: self._get_git_backend().add_and_commit(paths, message)
+        )
+
+        if self._background_pusher is not None:
+            self._background_pusher.notify()
+
+
+class StoreRevision(object):
+    """A read-only view of a password store at a git revision
+
+    The revision is resolved to a commit once, so the view does not move
+    when the branch does. Entries and .gpg-id files are listed by one git
+    ls-tree, and blobs are read through the git cat-file process of the
+    store. Listing, .gpg-id resolution and decryption behave like on the
+    working tree, writing raises.
+
+    :param store: The PasswordStore, which must use git.
+    :param rev: The revision. Example: 'HEAD~3'
+    """
+
+    def __init__(self, store, rev):
+        if not store.uses_git:
+            raise Exception('The password store does not use git')
+
+        try:
+            commit = store._git_output(
+                'rev-parse', '--verify', '--quiet', rev + '^{commit}'
+            ).strip()
+        except Exception:
+            raise Exception('Unknown revision %s' % rev)
+
+        self.store = store
+        self.rev = rev
+        self.commit = commit
+        self.path = store.path
+        self.git_dir = store.git_dir
+        self.uses_git = True
+        self.crypto = store.crypto
+        self._entries = None
+        self._gpg_id_blobs = None
+        self._gpg_ids = {}
+        self._lock = threading.Lock()
+
+    def _list_tree(self):
+        """Reads the entries and .gpg-id blobs of the commit, once"""
+        with self._lock:
+            if self._entries is None:
+                entries = {}
+                gpg_id_blobs = {}
+                for line in self.store._git_output(
+                        'ls-tree', '-r', '-z', '--full-tree', self.commit
+                ).split('\0'):
+                    if not line:
+                        continue
+                    info, _, path = line.partition('\t')
+                    _, object_type, sha = info.split()
+                    if object_type != 'blob':
+                        continue
+                    directory, _, name = path.rpartition('/')
+                    if name == '.gpg-id':
+                        gpg_id_blobs[directory] = sha
+                    elif name.endswith('.gpg'):
+                        entries[path[:-len('.gpg')]] = sha
+                self._gpg_id_blobs = gpg_id_blobs
+                self._entries = entries
+            return self._entries
+
+    def _read_blob(self, sha):
+        git_object = self.store._get_git_cat_file().read_object(sha)
+        if git_object is None:
+            raise Exception('Couldn\'t read %s at %s' % (sha, self.rev))
+        return git_object[1]
+
+    def get_passwords_list(self):
+        """Returns a list of the passwords at the revision
+
+        :returns: Example: ['Email/bob.net', 'example.com']
+        """
+        return sorted(self._list_tree())
+
+    def has_password(self, path):
+        """Returns True if path is a password at the revision"""
+        return path in self._list_tree()
+
+    def _read_gpg_id(self, directory):
+        """Returns the content of the .gpg-id file of directory, or None
+
+        :param directory: The directory, relative to the store. The root
+                          is ''.
+        """
+        self._list_tree()
+        if directory not in self._gpg_ids:
+            gpg_id = None
+            if directory in self._gpg_id_blobs:
+                gpg_id = self._read_blob(
+                    self._gpg_id_blobs[directory]
+                ).decode('utf8').strip()
+            self._gpg_ids[directory] = gpg_id
+        return self._gpg_ids[directory]
+
+    def _get_gpg_id(self, file_location):
+        file_path = os.path.abspath(file_location)
+        if file_path.endswith('.gpg'):
+            file_path = os.path.dirname(file_path)
+
+        directory = os.path.relpath(file_path, self.path).replace(os.sep, '/')
+        if directory == '..' or directory.startswith('../'):
+            raise Exception("could not find .gpg-id file")
+
+        directory = '' if directory == '.' else directory
+        while True:
+            gpg_id = self._read_gpg_id(directory)
+            if gpg_id is not None:
+                return gpg_id
+            if not directory:
+                raise Exception("could not find .gpg-id file")
+            directory = directory.rpartition('/')[0]
+
+    def open_packs(self):
+        """Returns None, packs are only read from the working tree"""
+        return None
+
+    def get_decrypted_password(self, path, entry=None, rev=None, packs=None):
+        """Returns the content of the decrypted password at the revision
+
+        :param path: The path of the password to be decrypted. Example:
+                     'email.com'
+        :param entry: The entry to retreive. (EntryType enum)
+        :param rev: Read the password at this other revision instead.
+        :param packs: Ignored, for compatibility with PasswordStore.
+        """
+        if rev is not None:
+            return self.store.get_decrypted_password(
+                path, entry=entry, rev=rev
             )
+
+        entries = self._list_tree()
+        if path not in entries:
+            raise Exception('%s does not exist at %s' % (path, self.rev))
+
+        ciphertext = self._read_blob(entries[path])
+        self.store._check_secret_keys(path, ciphertext=ciphertext)
+        decrypted_password = self.store._decrypt(ciphertext=ciphertext)
+        if decrypted_password is None:
+            raise Exception('Couldn\'t decrypt %s at %s' % (path, self.rev))
+        return extract_entry(decrypted_password, entry)
+
+    def get_decrypted_passwords(
+            self, paths, entry=None, workers=None, rev=None,
+            skip_undecryptable=False
+    ):
+        """Like PasswordStore.get_decrypted_passwords, at the revision"""
+        undecryptable = object()
+
+        def decrypt(path):
+            try:
+                return self.get_decrypted_password(path, entry=entry, rev=rev)
+            except MissingSecretKeyError:
+                if not skip_undecryptable:
+                    raise
+                return undecryptable
+
+        unique_paths = sorted(set(paths))
+        decrypted_passwords = _map_concurrently(decrypt, unique_paths, workers)
+
+        return dict(
+            (path, decrypted_password) for path, decrypted_password in
+            zip(unique_paths, decrypted_passwords)
+            if decrypted_password is not undecryptable
+        )
+
+    def get_password_history(self, path, entry=None, max_count=None):
+        """Like PasswordStore.get_password_history"""
+        return self.store.get_password_history(
+            path, entry=entry, max_count=max_count
+        )
+
+    def _read_only(self, *args, **kwargs):
+        raise Exception(
+            'The password store at %s is read-only' % self.rev
+        )
+
+    insert_password = _read_only
+    insert_passwords = _read_only
+    generate_password = _read_only
+    generate_passwords = _read_only
+    remove_password = _read_only
+    copy_password = _read_only
+    move_password = _read_only
+    git_add_and_commit = _read_only
+    sync = _read_only
+
+    def close(self):
+        """Does nothing, the helper processes belong to the store"""
@@ -0,0 +1,203 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import stat
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+from pexpect import pxssh
+
+from .entry_type import EntryType
+from .entry_type import extract_entry
+from .passwordstore import DEFAULT_WORKERS
+
+# Seconds a master connection stays open after its last session ended
+CONTROL_PERSIST = 600
+
+# Default number of hosts a command runs on at the same time
+DEFAULT_JOBS = 8
+
+
+def control_directory():
+    """Returns the directory of the ssh control sockets, creating it
+
+    The directory is only accessible by the current user, as anyone who
+    can reach a control socket can use its connection without logging in.
+    """
+    directory = os.path.join(
+        os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+        'pypass-ssh-%d' % os.getuid()
+    )
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0o700)
+
+    directory_stat = os.lstat(directory)
+    if not stat.S_ISDIR(directory_stat.st_mode) or \
+            directory_stat.st_uid != os.getuid() or \
+            stat.S_IMODE(directory_stat.st_mode) & 0o077:
+        raise Exception('%s is not a private directory' % directory)
+
+    return directory
+
+
+def control_options(directory=None, persist=CONTROL_PERSIST):
+    """Returns the ssh options that share one connection per host
+
+    :param directory: Where to keep the control sockets. Defaults to
+                      control_directory().
+    :param persist: Seconds the connection stays open after its last use.
+    """
+    return {
+        'ControlMaster': 'auto',
+        'ControlPath': os.path.join(
+            directory or control_directory(), '%C'
+        ),
+        'ControlPersist': str(persist),
+    }
+
+
+def _credentials(path, decrypted_password):
+    hostname = extract_entry(decrypted_password, EntryType.hostname)
+    if hostname is None:
+        raise Exception('%s has no hostname entry' % path)
+    return (
+        hostname,
+        extract_entry(decrypted_password, EntryType.username),
+        extract_entry(decrypted_password, EntryType.password),
+    )
+
+
+def get_credentials(store, paths, workers=None, errors=None):
+    """Decrypts the ssh credentials of many entries at once
+
+    :param store: The PasswordStore to read the entries from.
+    :param paths: The entries. Example: ['Servers/web1', 'Servers/web2']
+    :param workers: How many gpg processes may run at the same time.
+    :param errors: A dict the entries whose credentials can't be read are
+                   added to, with why. By default, an exception is raised
+                   for the first of them.
+    :returns: A dict mapping each path to a (hostname, username, password)
+              tuple.
+    """
+    paths = sorted(set(paths))
+    packs = store.open_packs()
+
+    def read(path):
+        try:
+            if not store.has_password(path):
+                raise Exception('%s is not in the password store' % path)
+            return path, _credentials(
+                path, store.get_decrypted_password(path, packs=packs)
+            ), None
+        except Exception as e:
+            return path, None, str(e)
+
+    pool = ThreadPool(max(1, min(workers or DEFAULT_WORKERS, len(paths))))
+    try:
+        results = pool.map(read, paths)
+    finally:
+        pool.close()
+        pool.join()
+
+    credentials = {}
+    for path, path_credentials, error in results:
+        if error is None:
+            credentials[path] = path_credentials
+        elif errors is None:
+            raise Exception(error)
+        else:
+            errors[path] = error
+    return credentials
+
+
+def login(hostname, username, password, options=None):
+    """Opens an ssh session, reusing the master connection to the host
+
+    :returns: A logged in pxssh session.
+    """
+    session = pxssh.pxssh(
+        options=control_options() if options is None else options
+    )
+    session.login(hostname, username, password=password)
+    return session
+
+
+def run_command(session, command, timeout=-1):
+    """Runs command in a logged in session
+
+    :returns: A tuple of the exit status of command and its output.
+    """
+    session.sendline(command)
+    session.prompt(timeout=timeout)
+    # The first line is the echo of the command
+    output = session.before.decode('utf-8', 'replace') \
+        .replace('\r\n', '\n').partition('\n')[2]
+
+    session.sendline('echo $?')
+    session.prompt(timeout=timeout)
+    status = session.before.decode('utf-8', 'replace').split()[-1]
+
+    return int(status), output
+
+
+def fan_out(store, paths, command, jobs=DEFAULT_JOBS, options=None):
+    """Runs command on the hosts of many entries
+
+    All the credentials are decrypted before the first connection. At most
+    jobs hosts are connected to at the same time, each through its shared
+    master connection.
+
+    :param store: The PasswordStore to read the entries from.
+    :param paths: The entries of the hosts.
+    :param command: The shell command to run on each host.
+    :param jobs: How many hosts to run command on at the same time.
+    :param options: ssh options. Defaults to control_options().
+    :returns: An iterator of (path, exit status, output) tuples, in the
+              order the hosts finish. The exit status is None and the
+              output is the error message when the credentials of the host
+              can't be read, or when it could not be reached.
+    """
+    errors = {}
+    credentials = get_credentials(store, paths, errors=errors)
+    for path in sorted(errors):
+        yield path, None, errors[path]
+    paths = sorted(credentials)
+    if not paths:
+        return
+    if options is None:
+        options = control_options()
+
+    def run(path):
+        try:
+            session = login(*credentials[path], options=options)
+            try:
+                return (path,) + run_command(session, command)
+            finally:
+                session.logout()
+        except Exception as e:
+            return path, None, str(e)
+
+    pool = ThreadPool(max(1, min(jobs, len(paths))))
+    try:
+        for result in pool.imap_unordered(run, paths):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
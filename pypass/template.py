@@ -0,0 +1,98 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import re
+
+from .entry_type import EntryType
+from .entry_type import extract_entry
+
+# Matches {{ pass:path }} and {{ pass:path#field }}
+REFERENCE_RE = re.compile(r'\{\{\s*pass:([^#}\s]+)(?:#(\w+))?\s*\}\}')
+
+
+def _get_entry_type(path, field):
+    if field is None:
+        return None
+    try:
+        return EntryType[field]
+    except KeyError:
+        raise Exception('Unknown field %s for %s' % (field, path))
+
+
+def find_references(template):
+    """Returns the unique password references of a template
+
+    :param template: The template text.
+    :returns: A sorted list of (path, field) tuples. field is None when
+              the whole content of the password is referenced.
+    """
+    return sorted(
+        set(
+            (match.group(1), match.group(2))
+            for match in REFERENCE_RE.finditer(template)
+        ),
+        key=lambda reference: (reference[0], reference[1] or '')
+    )
+
+
+def render_template(store, template):
+    """Renders a template, yielding the output piece by piece
+
+    Every ``{{ pass:path }}`` or ``{{ pass:path#field }}`` reference is
+    replaced with the decrypted password, or with one of its fields
+    (password, username or hostname). Each referenced password is
+    decrypted only once, and all of them are decrypted concurrently before
+    the output starts. Stores created with ``cache_decrypted=True`` only
+    decrypt again the passwords that changed since the previous render.
+
+    Missing passwords, unknown fields and passwords that can't be
+    decrypted raise an exception before anything is yielded.
+
+    :param store: The PasswordStore to read passwords from.
+    :param template: The template text.
+    """
+    references = find_references(template)
+    entry_types = dict(
+        (reference, _get_entry_type(*reference)) for reference in references
+    )
+    for path, _ in references:
+        if not store.has_password(path):
+            raise Exception('%s is not in the password store' % path)
+    decrypted_passwords = store.get_decrypted_passwords(
+        path for path, _ in references
+    )
+
+    values = {}
+    for path, field in references:
+        value = extract_entry(
+            decrypted_passwords[path],
+            entry_types[(path, field)]
+        )
+        if value is None:
+            raise Exception('%s has no %s entry' % (path, field))
+        if field is None:
+            value = value.rstrip('\n')
+        values[(path, field)] = value
+
+    position = 0
+    for match in REFERENCE_RE.finditer(template):
+        yield template[position:match.start()]
+        yield values[(match.group(1), match.group(2))]
+        position = match.end()
+    yield template[position:]
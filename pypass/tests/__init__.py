@@ -18,8 +18,31 @@
 #
 
 import os
+import shutil
+import tempfile
 import unittest
 
 skipIfTravis = unittest.skipIf(
     os.getenv('TRAVIS') == 'true', "Skipping this test on travis."
 )
+
+
+def use_temporary_cache(test_case):
+    """Points XDG_CACHE_HOME to a new directory until test_case ends
+
+    So that the caches of the stores, such as the list of secret keys, are
+    not written to the home directory.
+    """
+    cache_dir = tempfile.mkdtemp()
+    old_cache_home = os.environ.get('XDG_CACHE_HOME')
+    os.environ['XDG_CACHE_HOME'] = cache_dir
+
+    def restore():
+        shutil.rmtree(cache_dir)
+        if old_cache_home is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = old_cache_home
+
+    test_case.addCleanup(restore)
+    return cache_dir
@@ -0,0 +1,159 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pypass import PasswordStore
+from pypass.audit import audit
+from pypass.audit import entropy_bits
+from pypass.audit import modification_times
+from pypass.tests import use_temporary_cache
+
+DAY = 86400
+
+
+class TestAudit(unittest.TestCase):
+
+    def setUp(self):
+        use_temporary_cache(self)
+        self.dir = tempfile.mkdtemp()
+
+        # .gpg_id file
+        with open(os.path.join(self.dir, '.gpg-id'), 'w') as gpg_id_file:
+            gpg_id_file.write('5C5833E3')
+
+        self.store = PasswordStore(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def commit_at(self, paths, timestamp):
+        os.environ['GIT_COMMITTER_DATE'] = '%d +0000' % timestamp
+        try:
+            self.store.git_add_and_commit(
+                [path + '.gpg' for path in paths], message='Change.'
+            )
+        finally:
+            del os.environ['GIT_COMMITTER_DATE']
+
+    def test_entropy_bits(self):
+        self.assertEqual(entropy_bits(''), 0)
+        self.assertAlmostEqual(entropy_bits('aaaa'), 4 * 4.7, places=1)
+        self.assertAlmostEqual(entropy_bits('aA1!'), 4 * 6.55, places=1)
+        self.assertGreater(entropy_bits('aa\xe9'), entropy_bits('aaa'))
+
+    def test_audit_finds_reused_and_weak_passwords(self):
+        strong = 'Xk2$pQ9!vL4#mN7&wR1@'
+        self.store.insert_passwords({
+            'a.com': strong + '\nuser: alice',
+            'b.com': 'password: %s\nuser: bob' % strong,
+            'c.com': 'hunter2',
+            'Email/d.net': 'hunter2\nother content',
+            'e.com': 'Zq8&Tn3!Yw6$Hs0@Pk5%',
+        })
+
+        self.assertEqual(
+            list(audit(self.store)),
+            [
+                ('Email/d.net', 'weak', entropy_bits('hunter2')),
+                ('b.com', 'reused', 'a.com'),
+                ('c.com', 'reused', 'Email/d.net'),
+                ('c.com', 'weak', entropy_bits('hunter2')),
+            ]
+        )
+
+    def test_audit_only_checks_paths(self):
+        self.store.insert_passwords({'a.com': 'weak', 'b.com': 'weak'})
+
+        self.assertEqual(
+            list(audit(self.store, paths=['b.com'], min_entropy=0)),
+            []
+        )
+
+    def test_audit_reports_unreadable_passwords(self):
+        with open(os.path.join(self.dir, 'broken.gpg'), 'w') as broken:
+            broken.write('not encrypted')
+
+        problems = list(audit(self.store))
+        self.assertEqual(len(problems), 1)
+        self.assertEqual(problems[0][:2], ('broken', 'unreadable'))
+
+    def test_audit_finds_stale_passwords(self):
+        self.store.git_init()
+        now = time.time()
+        self.store.insert_passwords({
+            'old.com': 'Xk2$pQ9!vL4#mN7&wR1@',
+            'renewed.com': 'Zq8&Tn3!Yw6$Hs0@Pk5%',
+        })
+        self.commit_at(['old.com', 'renewed.com'], now - 100 * DAY)
+        self.store.insert_password('renewed.com', 'Ab9!Cd8@Ef7#Gh6$Ij5%')
+        self.commit_at(['renewed.com'], now - 10 * DAY)
+        self.store.insert_password('uncommitted.com', 'Kl4^Mn3&Op2*Qr1(St0)')
+
+        problems = list(audit(self.store, max_age=30, now=now))
+        self.assertEqual(
+            [problem[:2] for problem in problems],
+            [('old.com', 'stale')]
+        )
+        self.assertAlmostEqual(problems[0][2], 100, places=3)
+
+    def test_modification_times(self):
+        self.store.git_init()
+        self.store.insert_passwords({'a.com': 'a', 'Email/b.net': 'b'})
+        self.commit_at(['a.com', 'Email/b.net'], 1000000000)
+        self.store.insert_password('a.com', 'changed')
+        self.commit_at(['a.com'], 1100000000)
+
+        self.assertEqual(
+            modification_times(self.store, ['a.com', 'Email/b.net']),
+            {'a.com': 1100000000, 'Email/b.net': 1000000000}
+        )
+
+        # Paths git would quote, read from a subfolder of the store
+        self.store.insert_password(u'Email/caf\xe9 "b"', 'c')
+        self.commit_at([u'Email/caf\xe9 "b"'], 1200000000)
+        old_cwd = os.getcwd()
+        os.chdir(os.path.join(self.dir, 'Email'))
+        try:
+            self.assertEqual(
+                modification_times(
+                    self.store, ['a.com', u'Email/caf\xe9 "b"']
+                ),
+                {'a.com': 1100000000, u'Email/caf\xe9 "b"': 1200000000}
+            )
+        finally:
+            os.chdir(old_cwd)
+
+    def test_modification_times_without_git(self):
+        self.store.insert_password('a.com', 'a')
+        os.utime(os.path.join(self.dir, 'a.com.gpg'), (1000, 1000))
+
+        self.assertEqual(
+            modification_times(self.store, ['a.com', 'missing']),
+            {'a.com': 1000}
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
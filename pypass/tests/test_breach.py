@@ -0,0 +1,105 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from pypass import PasswordStore
+from pypass.audit import audit
+from pypass.breach import BreachDatabase
+from pypass.tests import use_temporary_cache
+
+
+def sha1(password):
+    return hashlib.sha1(password.encode('utf-8')).hexdigest().upper()
+
+
+class TestBreachDatabase(unittest.TestCase):
+
+    def write_database(self, lines, newline='\r\n'):
+        file_path = os.path.join(self.dir, 'breaches.txt')
+        with open(file_path, 'w') as database:
+            database.write(newline.join(lines) + newline)
+        return file_path
+
+    def setUp(self):
+        use_temporary_cache(self)
+        self.dir = tempfile.mkdtemp()
+        self.breached = ['hunter2', 'password', '123456', 'letmein']
+        self.database_path = self.write_database(sorted(
+            ['%s:%d' % (sha1(password), position + 1)
+             for position, password in enumerate(self.breached)] +
+            ['%040X:7' % number for number in range(0, 2 ** 160, 2 ** 150)]
+        ))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_count(self):
+        with BreachDatabase(self.database_path) as database:
+            for position, password in enumerate(self.breached):
+                self.assertEqual(database.count(password), position + 1)
+            self.assertEqual(database.count('Xk2$pQ9!vL4#mN7&wR1@'), 0)
+            self.assertEqual(database.count_hash('0' * 40), 7)
+            self.assertEqual(database.count_hash('f' * 40), 0)
+
+    def test_count_without_counts_and_lowercase(self):
+        file_path = self.write_database(
+            sorted(sha1(password).lower() for password in self.breached),
+            newline='\n'
+        )
+
+        with BreachDatabase(file_path) as database:
+            for password in self.breached:
+                self.assertEqual(database.count(password), 1)
+            self.assertEqual(database.count('not breached'), 0)
+
+    def test_invalid_databases(self):
+        self.assertRaises(
+            Exception, BreachDatabase, self.write_database([''], newline='')
+        )
+        self.assertRaises(
+            Exception, BreachDatabase, self.write_database(['not a hash'])
+        )
+
+    def test_audit_finds_breached_passwords(self):
+        store_dir = os.path.join(self.dir, 'store')
+        os.mkdir(store_dir)
+        with open(os.path.join(store_dir, '.gpg-id'), 'w') as gpg_id_file:
+            gpg_id_file.write('5C5833E3')
+
+        store = PasswordStore(store_dir)
+        store.insert_passwords({
+            'a.com': 'letmein\nuser: alice',
+            'b.com': 'Xk2$pQ9!vL4#mN7&wR1@',
+        })
+
+        with BreachDatabase(self.database_path) as database:
+            self.assertEqual(
+                list(audit(store, min_entropy=0, breach_db=database)),
+                [('a.com', 'breached', 4)]
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
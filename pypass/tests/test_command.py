@@ -17,10 +17,13 @@
 #    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import binascii
+import json
 import os
 import re
 import shutil
 import subprocess
+import sys
 import tempfile
 import unittest
 
@@ -28,6 +31,7 @@ import click.testing
 
 import pypass.command
 import pypass.tests
+from pypass.openpgp import recipient_key_ids
 from pypass.passwordstore import PasswordStore
 
 
@@ -66,8 +70,18 @@ class TestCommand(unittest.TestCase):
         with open(os.path.join(self.dir, '.gpg-id'), 'w') as gpg_id_file:
             gpg_id_file.write('5C5833E3')
 
+        # Keep the caches of the commands out of the home directory
+        self.cache_dir = tempfile.mkdtemp()
+        self.old_cache_home = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = self.cache_dir
+
     def tearDown(self):
         shutil.rmtree(self.dir)
+        shutil.rmtree(self.cache_dir)
+        if self.old_cache_home is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.old_cache_home
 
     def test_init(self):
         init_dir = tempfile.mkdtemp()
@@ -180,6 +194,130 @@ class TestCommand(unittest.TestCase):
         xclip.wait()
         self.assertEqual(xclip.stdout.read().decode('utf8'), 'clipme999')
 
+    def test_env(self):
+        store = PasswordStore(self.dir)
+        store.insert_password('db', "s3cr'et\nusername: admin\n")
+        store.insert_password('api', 'token\n')
+
+        spec_path = os.path.join(self.dir, 'spec')
+        with open(spec_path, 'w') as spec:
+            spec.write('# comment\n\nAPI_TOKEN=api\n')
+
+        env_result = self.run_cli(
+            [
+                'env',
+                '--map', 'DB_USER=db:username',
+                '-m', 'DB_PASS=db:password',
+                '--spec', spec_path,
+            ]
+        )
+        self.assertEqual(
+            env_result.output,
+            "export DB_USER=admin\n"
+            "export DB_PASS='s3cr'\"'\"'et'\n"
+            "export API_TOKEN=token\n"
+        )
+
+        missing_result = self.run_cli(
+            ['env', '-m', 'NOPE=nope.com'],
+            expect_failure=True
+        )
+        self.assertEqual(
+            missing_result.output,
+            'Error: nope.com is not in the password store.\n'
+        )
+
+        # A password that can't be decrypted fails without a traceback
+        with open(os.path.join(self.dir, 'broken.gpg'), 'wb') as broken:
+            broken.write(b'garbage')
+        for command in (['env'], ['exec', 'true']):
+            broken_result = self.run_cli(
+                [command[0], '-m', 'BROKEN=broken'] + command[1:],
+                expect_failure=True
+            )
+            self.assertEqual(broken_result.exit_code, 1)
+            self.assertNotIsInstance(broken_result.exception, Exception)
+            self.assertEqual(broken_result.stdout, '')
+            self.assertIn('Error: ', broken_result.stderr)
+            self.assertIn('broken', broken_result.stderr)
+
+    def test_exec(self):
+        store = PasswordStore(self.dir)
+        store.insert_password('db', 'pw\nhost: db.example.com')
+
+        command = subprocess.Popen(
+            [
+                sys.executable, '-m', 'pypass.command',
+                '--PASSWORD_STORE_DIR', self.dir,
+                'exec',
+                '--map', 'DB_HOST=db:hostname',
+                '--map', 'DB_PASS=db:password',
+                '--',
+                sys.executable, '-c',
+                'import os; print(os.environ["DB_HOST"] + " "'
+                ' + os.environ["DB_PASS"])',
+            ],
+            shell=False,
+            stdout=subprocess.PIPE
+        )
+        stdout, _ = command.communicate()
+        self.assertEqual(command.returncode, 0)
+        self.assertEqual(stdout.decode(), 'db.example.com pw\n')
+
+    def test_connect_without_host(self):
+        store = PasswordStore(self.dir)
+        store.insert_password('web', 'pw\nuser: alice')
+
+        for args in (['connect', 'web'],
+                     ['connect', '--exec', 'uptime', 'web']):
+            result = self.run_cli(args, expect_failure=True)
+            self.assertEqual(result.exit_code, 1)
+            self.assertNotIsInstance(result.exception, Exception)
+            self.assertIn('web has no hostname entry', result.stderr)
+
+    def test_render(self):
+        store = PasswordStore(self.dir)
+        store.insert_password('db', 'pw\nusername: admin')
+
+        template_path = os.path.join(self.dir, 'template.in')
+        with open(template_path, 'w') as template:
+            template.write('user={{ pass:db#username }}\npass={{pass:db}}\n')
+
+        render_result = self.run_cli(['render', template_path])
+        self.assertEqual(
+            render_result.output,
+            'user=admin\npass=pw\nusername: admin\n'
+        )
+
+        with open(os.path.join(self.dir, 'broken.gpg'), 'wb') as broken:
+            broken.write(b'garbage')
+        for reference, error in [
+                ('missing', 'missing is not in the password store'),
+                ('broken', "Couldn't decrypt broken"),
+                ('db#nope', 'Unknown field nope for db'),
+        ]:
+            with open(template_path, 'w') as template:
+                template.write('x={{ pass:%s }}\n' % reference)
+            render_result = self.run_cli(['render', template_path],
+                                         expect_failure=True)
+            self.assertEqual(render_result.exit_code, 1)
+            self.assertEqual(render_result.stdout, '')
+            self.assertEqual(render_result.stderr, 'Error: %s.\n' % error)
+
+    def test_sync_out(self):
+        store = PasswordStore(self.dir)
+        store.insert_password('prod/db', 'dbpass')
+        store.insert_password('dev/db', 'devpass')
+
+        destination = tempfile.mkdtemp()
+        sync_result = self.run_cli(['sync-out', destination, 'prod'])
+        self.assertIn('Updated db\n', sync_result.output)
+        with open(os.path.join(destination, 'db'), 'r') as db:
+            self.assertEqual(db.read(), 'dbpass')
+        self.assertFalse(os.path.exists(os.path.join(destination, 'dev')))
+
+        shutil.rmtree(destination)
+
     def test_edit(self):
         store = PasswordStore(self.dir)
         store.insert_password('test.com', 'editme')
@@ -190,6 +328,117 @@ class TestCommand(unittest.TestCase):
         edited_content = store.get_decrypted_password('test.com')
         self.assertEqual(edited_content, 'edited')
 
+    def test_batch(self):
+        self.run_cli(['git', 'init'])
+        operations = [
+            {'op': 'insert', 'path': 'a.com', 'content': 'a\nuser: al'},
+            {'op': 'insert', 'path': 'b.com', 'content': 'b', 'id': 2},
+            {'op': 'show', 'path': 'a.com', 'field': 'username'},
+            {'op': 'generate', 'path': 'c.com', 'length': 8},
+            {'op': 'mv', 'from': 'a.com', 'to': 'd.com'},
+            {'op': 'cp', 'from': 'd.com', 'to': 'e.com'},
+            {'op': 'rm', 'path': 'b.com'},
+            {'op': 'show', 'path': 'b.com'},
+            {'op': 'fly'},
+            {'op': 'insert', 'path': 'f.com'},
+        ]
+        batch_result = self.run_cli(
+            ['batch'],
+            input='\n'.join(json.dumps(op) for op in operations) + '\n',
+            expect_failure=True
+        )
+        self.assertEqual(batch_result.exit_code, 1)
+
+        results = [
+            json.loads(line) for line in batch_result.output.splitlines()
+        ]
+        self.assertEqual(len(results), len(operations))
+        self.assertEqual(results[0], {'ok': True, 'changed': True})
+        self.assertEqual(results[1], {'ok': True, 'changed': True, 'id': 2})
+        self.assertEqual(results[2], {'ok': True, 'content': 'al'})
+        self.assertEqual(len(results[3]['password']), 8)
+        self.assertEqual(results[4]['entries'], ['a.com', 'd.com'])
+        self.assertEqual(results[5]['entries'], ['e.com'])
+        self.assertEqual(results[6]['entries'], ['b.com'])
+        self.assertFalse(results[7]['ok'])
+        self.assertEqual(results[8], {'ok': False, 'error': 'unknown op fly'})
+        self.assertEqual(results[9], {'ok': False, 'error': 'missing content'})
+
+        # All the changes are in one commit
+        self.assertLastCommitMessage(
+            'Batch of 10 operations changing 5 passwords.'
+        )
+        git_status = subprocess.Popen(
+            [
+                'git',
+                '--git-dir=%s' % os.path.join(self.dir, '.git'),
+                '--work-tree=%s' % self.dir,
+                'status', '--porcelain'
+            ],
+            stdout=subprocess.PIPE
+        )
+        self.assertEqual(git_status.communicate()[0], b'')
+
+    def test_connect_needs_exec_for_many_hosts(self):
+        connect_result = self.run_cli(
+            ['connect', 'web1', 'web2'],
+            expect_failure=True
+        )
+        self.assertEqual(
+            connect_result.output,
+            'Error: give one path, or a command with --exec.\n'
+        )
+
+    def test_edit_unchanged(self):
+        self.run_cli(['git', 'init'])
+        store = PasswordStore(self.dir)
+        store.insert_password('test.com', 'edited')
+        store.git_add_and_commit('test.com.gpg', message='Add test.com')
+
+        mock_editor = os.path.join(os.path.dirname(__file__), 'mock_editor.py')
+        edit_result = self.run_cli(
+            ['--EDITOR', mock_editor, 'edit', 'test.com']
+        )
+
+        self.assertEqual(edit_result.output, 'test.com is unchanged.\n')
+        self.assertLastCommitMessage('Add test.com')
+
+    def test_insert_unchanged(self):
+        self.run_cli(['git', 'init'])
+        self.run_cli(['insert', '-e', 'test.com'], input='same')
+        passfile_path = os.path.join(self.dir, 'test.com.gpg')
+        with open(passfile_path, 'rb') as passfile:
+            ciphertext = passfile.read()
+
+        # Without the manifest, the password is always written again
+        insert_result = self.run_cli(['insert', '-e', 'test.com'],
+                                     input='same')
+        self.assertFalse(insert_result.output.endswith(
+            'test.com is unchanged.\n'
+        ))
+        with open(passfile_path, 'rb') as passfile:
+            self.assertNotEqual(passfile.read(), ciphertext)
+
+        self.run_cli(['--PASSWORD_STORE_CONTENT_MANIFEST',
+                      'insert', '-e', 'test.com'], input='same')
+        with open(passfile_path, 'rb') as passfile:
+            ciphertext = passfile.read()
+
+        insert_result = self.run_cli(['--PASSWORD_STORE_CONTENT_MANIFEST',
+                                      'insert', '-e', 'test.com'],
+                                     input='same')
+        self.assertTrue(insert_result.output.endswith(
+            'test.com is unchanged.\n'
+        ))
+        with open(passfile_path, 'rb') as passfile:
+            self.assertEqual(passfile.read(), ciphertext)
+
+        self.run_cli(['insert', '-e', 'test.com'], input='other')
+        self.assertEqual(
+            PasswordStore(self.dir).get_decrypted_password('test.com'),
+            'other'
+        )
+
     def test_edit_not_exist(self):
         edit_result = self.run_cli(
             ['edit', 'woijewoifj.ccc']
@@ -322,6 +571,99 @@ class TestCommand(unittest.TestCase):
             'Error: test_folder is not in the password store\n'
         )
 
+    def test_rm_cp_mv_commit(self):
+        self.run_cli(['git', 'init'])
+        store = PasswordStore(self.dir)
+        store.insert_passwords({'a.com': 'a', 'Team/b.com': 'b'})
+        with open(os.path.join(self.dir, 'Team', '.gpg-id'), 'w') as gpg_id:
+            gpg_id.write('FB7C4A645890CA9A')
+        store.git_add_and_commit(['.'], message='Add passwords.')
+
+        def git_status():
+            git = subprocess.Popen(
+                [
+                    'git',
+                    '--git-dir=%s' % os.path.join(self.dir, '.git'),
+                    '--work-tree=%s' % self.dir,
+                    'status', '--porcelain'
+                ],
+                shell=False,
+                stdout=subprocess.PIPE
+            )
+            return git.communicate()[0].decode()
+
+        self.run_cli(['cp', 'a.com', 'Team/a.com'])
+        self.assertLastCommitMessage('Copy a.com to Team/a.com.')
+        self.assertEqual(git_status(), '')
+        # Encrypted again for the .gpg-id of Team
+        with open(os.path.join(self.dir, 'Team', 'a.com.gpg'), 'rb') as f:
+            self.assertEqual(recipient_key_ids(f.read()), ['96A03622462C6FA9'])
+        self.assertEqual(store.get_decrypted_password('Team/a.com'), 'a')
+
+        self.run_cli(['mv', 'Team', 'Moved'])
+        self.assertLastCommitMessage('Rename Team to Moved.')
+        self.assertEqual(git_status(), '')
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.dir, 'Moved', '.gpg-id'))
+        )
+
+        self.run_cli(['rm', '-r', 'Moved'], input='y\n')
+        self.assertLastCommitMessage('Remove Moved from store.')
+        self.assertEqual(git_status(), '')
+
+        self.run_cli(['rm', 'a.com'], input='y\n')
+        self.assertLastCommitMessage('Remove a.com from store.')
+        self.assertEqual(git_status(), '')
+
+    def test_cp_mv_to_folder(self):
+        self.run_cli(['git', 'init'])
+        store = PasswordStore(self.dir)
+        store.insert_passwords({'a.com': 'a', 'b.com': 'b', 'Team/c': 'c'})
+        store.git_add_and_commit(['.'], message='Add passwords.')
+
+        self.run_cli(['mv', 'a.com', 'Team/'])
+        self.assertLastCommitMessage('Rename a.com to Team/.')
+        self.assertEqual(store.get_decrypted_password('Team/a.com'), 'a')
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'a.com.gpg')))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'Team.gpg')))
+
+        # An existing folder is a folder, even without a trailing /
+        self.run_cli(['cp', 'b.com', 'Team'])
+        self.assertEqual(store.get_decrypted_password('Team/b.com'), 'b')
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'Team.gpg')))
+
+        # A new one is created for a trailing /
+        self.run_cli(['mv', 'b.com', 'New/'])
+        self.assertEqual(store.get_decrypted_password('New/b.com'), 'b')
+
+        git_status = subprocess.Popen(
+            [
+                'git',
+                '--git-dir=%s' % os.path.join(self.dir, '.git'),
+                '--work-tree=%s' % self.dir,
+                'status', '--porcelain'
+            ],
+            shell=False,
+            stdout=subprocess.PIPE
+        )
+        self.assertEqual(git_status.communicate()[0].decode(), '')
+
+    def test_cp_mv_no_overwrite(self):
+        store = PasswordStore(self.dir)
+        store.insert_passwords({'a.com': 'a', 'b.com': 'b'})
+
+        for command in ['cp', 'mv']:
+            result = self.run_cli(
+                [command, '--no-overwrite', 'a.com', 'b.com'],
+                expect_failure=True
+            )
+            self.assertEqual(result.exit_code, 1)
+            self.assertEqual(result.output, 'Error: b.com already exists.\n')
+            self.assertEqual(store.get_decrypted_password('b.com'), 'b')
+
+        self.run_cli(['mv', 'a.com', 'b.com'])
+        self.assertEqual(store.get_decrypted_password('b.com'), 'a')
+
     def test_find(self):
         # Create dummy files
         open(os.path.join(self.dir, 'linux.ca.gpg'), 'a').close()
@@ -337,6 +679,157 @@ class TestCommand(unittest.TestCase):
 
         self.assertIsNotNone(re.search(expected_regex, find_result.output))
 
+    def test_ls_and_find_json(self):
+        open(os.path.join(self.dir, 'test.com.gpg'), 'a').close()
+        os.mkdir(os.path.join(self.dir, 'Email'))
+        open(os.path.join(self.dir, 'Email', 'bob.net.gpg'), 'a').close()
+
+        self.assertEqual(
+            self.run_cli(['ls', '--format', 'ndjson']).output,
+            '{"path": "Email/bob.net"}\n{"path": "test.com"}\n'
+        )
+        self.assertEqual(
+            json.loads(
+                self.run_cli(['ls', '--format', 'json', 'Email']).output
+            ),
+            [{'path': 'Email/bob.net'}]
+        )
+        self.assertEqual(
+            json.loads(
+                self.run_cli(['find', '--format', 'json', 'test']).output
+            ),
+            [{'path': 'test.com'}]
+        )
+        self.assertEqual(
+            self.run_cli(['find', '--format', 'json', 'nothing']).output,
+            '[]\n'
+        )
+
+    def test_show_many(self):
+        store = PasswordStore(self.dir)
+        store.insert_passwords({
+            'a.com': 'first\nuser: alice',
+            'b.com': 'second',
+        })
+
+        show_result = self.run_cli(
+            ['show', '--format', 'ndjson', '-f', 'password', '-f', 'username',
+             'b.com', 'nope.com', 'a.com'],
+            expect_failure=True
+        )
+        self.assertEqual(show_result.exit_code, 1)
+        self.assertEqual(
+            [json.loads(line) for line in show_result.output.splitlines()],
+            [
+                {'path': 'b.com', 'password': 'second', 'username': None},
+                {'path': 'nope.com',
+                 'error': 'nope.com is not in the password store'},
+                {'path': 'a.com', 'password': 'first', 'username': 'alice'},
+            ]
+        )
+
+        self.assertEqual(
+            json.loads(self.run_cli(
+                ['show', '--format', 'json', '-'], input='a.com\n\nb.com\n'
+            ).output),
+            [
+                {'path': 'a.com', 'content': 'first\nuser: alice'},
+                {'path': 'b.com', 'content': 'second'},
+            ]
+        )
+        self.assertEqual(
+            self.run_cli(['show', 'a.com', 'b.com']).output,
+            'a.com:\nfirst\nuser: alice\nb.com:\nsecond\n'
+        )
+        self.assertEqual(
+            self.run_cli(['show', '-c', 'a.com', 'b.com'],
+                         expect_failure=True).output,
+            'Error: --clip shows a single password.\n'
+        )
+
+    def test_mount(self):
+        team_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(team_dir, '.gpg-id'), 'w') as gpg_id:
+                gpg_id.write('5C5833E3')
+            PasswordStore(team_dir).insert_password('db', 'dbpass')
+            PasswordStore(self.dir).insert_password('mine', 'minepass')
+            mount = ['--mount', 'team=%s' % team_dir]
+
+            ls_result = self.run_cli(mount + ['ls'])
+            self.assertIsNotNone(re.search(
+                r'Password Store\s.*mine\s.*team.*\s.*db',
+                ls_result.output
+            ))
+            self.assertEqual(
+                self.run_cli(mount + ['show', 'team/db']).output,
+                'dbpass\n'
+            )
+            self.assertEqual(
+                self.run_cli(mount + ['grep', 'pass']).output,
+                'mine:\nminepass\nteam/db:\ndbpass\n'
+            )
+
+            bad_mount = self.run_cli(
+                ['--mount', team_dir, 'ls'],
+                expect_failure=True
+            )
+            self.assertEqual(
+                bad_mount.output,
+                'Error: --mount expects PREFIX=DIRECTORY, got %s.\n'
+                % team_dir
+            )
+        finally:
+            shutil.rmtree(team_dir)
+
+    def test_pack(self):
+        self.run_cli(['git', 'init'])
+        self.run_cli(['insert', '-e', 'a.com'], input='GREPME a')
+        self.run_cli(['insert', '-e', 'Web/b.com'], input='GREPME b')
+
+        self.assertEqual(
+            self.run_cli(['pack']).output, 'Packed /\nPacked Web\n'
+        )
+        self.assertLastCommitMessage('Pack 2 folders in the password store.')
+        self.assertEqual(self.run_cli(['pack']).output, '')
+
+        self.run_cli(['insert', '-e', 'Web/b.com'], input='GREPME new b')
+        self.assertEqual(
+            self.run_cli(['grep', 'GREPME']).output,
+            'Web/b.com:\nGREPME new b\na.com:\nGREPME a\n'
+        )
+
+        def git(*args):
+            return subprocess.Popen(
+                [
+                    'git',
+                    '--git-dir=%s' % os.path.join(self.dir, '.git'),
+                    '--work-tree=%s' % self.dir,
+                ] + list(args),
+                shell=False,
+                stdout=subprocess.PIPE
+            ).communicate()[0].decode()
+
+        # Moving or removing a password removes the pack of its folder
+        self.run_cli(['mv', 'a.com', 'Other/a.com'])
+        self.assertFalse(
+            os.path.exists(os.path.join(self.dir, '.pypass-pack'))
+        )
+        self.assertEqual(git('status', '--porcelain'), '')
+        self.assertEqual(git('ls-files', '.pypass-pack'), '')
+
+        self.run_cli(['rm', 'Web/b.com'], input='y\n')
+        self.assertEqual(git('status', '--porcelain'), '')
+        self.assertEqual(git('ls-files', 'Web/.pypass-pack'), '')
+
+        self.run_cli(['insert', '-e', 'Web/c.com'], input='c')
+        self.assertEqual(self.run_cli(['pack']).output,
+                         'Packed Other\nPacked Web\n')
+        self.run_cli(['rm', '-r', 'Web'], input='y\n')
+        self.assertEqual(self.run_cli(['pack', 'Web']).output, '')
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'Web')))
+        self.assertEqual(git('status', '--porcelain'), '')
+
     def test_grep(self):
         store = PasswordStore(self.dir)
         store.insert_password('grep_test.com', 'GREPME')
@@ -347,6 +840,126 @@ class TestCommand(unittest.TestCase):
             'grep_test.com:\nGREPME\n'
         )
 
+    def test_grep_json(self):
+        store = PasswordStore(self.dir)
+        store.insert_password('grep_test.com', 'GREPME\nother')
+
+        self.assertEqual(
+            json.loads(
+                self.run_cli(['grep', '--format', 'json', 'GREP']).output
+            ),
+            [{'path': 'grep_test.com', 'lines': ['GREPME']}]
+        )
+
+    def test_grep_skips_undecryptable(self):
+        store = PasswordStore(self.dir)
+        store.insert_password('grep_test.com', 'GREPME')
+        store.insert_password('theirs.com', 'GREPME')
+
+        theirs_path = os.path.join(self.dir, 'theirs.com.gpg')
+        with open(theirs_path, 'rb') as f:
+            ciphertext = f.read()
+        with open(theirs_path, 'wb') as f:
+            f.write(ciphertext.replace(
+                binascii.unhexlify('6C8110881C10BC07'),
+                binascii.unhexlify('0123456789ABCDEF')
+            ))
+
+        grep_result = self.run_cli(['grep', 'GREPME'])
+        self.assertEqual(grep_result.stdout, 'grep_test.com:\nGREPME\n')
+        self.assertIn(
+            'Skipped 1 passwords not encrypted for any of your secret keys: '
+            'theirs.com\n',
+            grep_result.output
+        )
+
+    def test_audit(self):
+        store = PasswordStore(self.dir)
+        store.insert_passwords({
+            'a.com': 'Xk2$pQ9!vL4#mN7&wR1@',
+            'b.com': 'Xk2$pQ9!vL4#mN7&wR1@',
+            'c.com': 'hunter2',
+            'other/d.com': 'hunter2',
+        })
+
+        audit_result = self.run_cli(['audit'], expect_failure=True)
+        self.assertEqual(audit_result.exit_code, 1)
+        self.assertEqual(
+            audit_result.output,
+            'b.com: reuses the password of a.com\n'
+            'c.com: weak password (36 bits)\n'
+            'other/d.com: reuses the password of c.com\n'
+            'other/d.com: weak password (36 bits)\n'
+        )
+
+        audit_result = self.run_cli(['audit', 'other', '--min-entropy', '10'])
+        self.assertEqual(audit_result.output, '')
+
+        audit_result = self.run_cli(
+            ['audit', '--format', 'ndjson', 'other'], expect_failure=True
+        )
+        self.assertEqual(audit_result.exit_code, 1)
+        record = json.loads(audit_result.output)
+        self.assertEqual(record['path'], 'other/d.com')
+        self.assertEqual(record['problem'], 'weak')
+        self.assertEqual(record['message'], 'weak password (36 bits)')
+
+    def test_audit_breach_db(self):
+        store = PasswordStore(self.dir)
+        store.insert_password('a.com', 'hunter2')
+
+        breach_db = os.path.join(self.cache_dir, 'breaches.txt')
+        with open(breach_db, 'w') as breaches:
+            breaches.write(
+                'F3BBBD66A63D4BF1747940578EC3D0103530E21D:17\r\n'
+            )
+
+        audit_result = self.run_cli(
+            ['audit', '--min-entropy', '0', '--breach-db', breach_db],
+            expect_failure=True
+        )
+        self.assertEqual(audit_result.exit_code, 1)
+        self.assertEqual(
+            audit_result.output,
+            'a.com: breached password (seen 17 times)\n'
+        )
+
+    def test_verify(self):
+        self.run_cli(['git', 'init'])
+        store = PasswordStore(self.dir)
+        store.insert_passwords({'a.com': 'a', 'Team/b.com': 'b'})
+        store.git_add_and_commit(['.'], message='Add passwords.')
+        with open(os.path.join(self.dir, 'Team', '.gpg-id'), 'w') as gpg_id:
+            gpg_id.write('5C5833E3')
+
+        verify_result = self.run_cli(['verify', '--decrypt'])
+        self.assertEqual(
+            verify_result.stdout.splitlines()[-2:],
+            ['./.gpg-id: 1 verified, 0 failed',
+             'Team/.gpg-id: 1 verified, 0 failed']
+        )
+
+        with open(os.path.join(self.dir, 'a.com.gpg'), 'wb') as f:
+            f.write(b'corrupt')
+        store.insert_password('Team/c.com', 'c')
+
+        verify_result = self.run_cli(
+            ['verify', '--changed-since', 'HEAD'], expect_failure=True
+        )
+        self.assertEqual(verify_result.exit_code, 1)
+        self.assertEqual(
+            verify_result.stdout.splitlines()[-3:],
+            ['a.com: corrupt (invalid packet header at byte 0)',
+             './.gpg-id: 0 verified, 1 failed',
+             'Team/.gpg-id: 1 verified, 0 failed']
+        )
+
+        verify_result = self.run_cli(['verify', 'Team'])
+        self.assertEqual(
+            verify_result.stdout.splitlines()[-1:],
+            ['Team/.gpg-id: 2 verified, 0 failed']
+        )
+
     def test_git_init(self):
         self.run_cli(['git', 'init'])
 
@@ -407,6 +1020,70 @@ class TestCommand(unittest.TestCase):
         )
         self.assertEqual(show_result.output, 'super_secret\n')
 
+    def test_show_rev(self):
+        rev_result = self.run_cli(
+            ['show', '--rev', 'HEAD', 'test.com'],
+            expect_failure=True
+        )
+        self.assertEqual(
+            rev_result.output,
+            'Error: the password store does not use git.\n'
+        )
+
+        self.run_cli(['git', 'init'])
+        self.run_cli(['insert', '-e', 'test.com'], input='first')
+        self.run_cli(['insert', '-e', 'test.com'], input='second')
+
+        self.assertEqual(
+            self.run_cli(['show', '--rev', 'HEAD~1', 'test.com']).output,
+            'first\n'
+        )
+        self.assertEqual(
+            self.run_cli(['show', '-r', 'HEAD', 'test.com']).output,
+            'second\n'
+        )
+
+        missing_result = self.run_cli(
+            ['show', '--rev', 'HEAD~2', 'test.com'],
+            expect_failure=True
+        )
+        self.assertEqual(
+            missing_result.output,
+            'Error: test.com does not exist at HEAD~2.\n'
+        )
+
+    def test_ls_find_grep_rev(self):
+        self.run_cli(['git', 'init'])
+        self.run_cli(['insert', '-e', 'old.com'], input='GREPME old')
+        self.run_cli(['rm', 'old.com'], input='y\n')
+        self.run_cli(['insert', '-e', 'new.com'], input='GREPME new')
+
+        ls_output = self.run_cli(['ls', '--rev', 'HEAD~2']).output
+        self.assertIn('old.com', ls_output)
+        self.assertNotIn('new.com', ls_output)
+        self.assertEqual(
+            self.run_cli(
+                ['find', '-r', 'HEAD~2', '--format', 'ndjson', 'com']
+            ).output,
+            '{"path": "old.com"}\n'
+        )
+        self.assertEqual(
+            self.run_cli(['grep', '--rev', 'HEAD~2', 'GREPME']).output,
+            'old.com:\nGREPME old\n'
+        )
+        self.assertEqual(
+            self.run_cli(['grep', 'GREPME']).output,
+            'new.com:\nGREPME new\n'
+        )
+
+        unknown_result = self.run_cli(
+            ['ls', '--rev', 'no-such-revision'], expect_failure=True
+        )
+        self.assertEqual(
+            unknown_result.output,
+            'Error: Unknown revision no-such-revision.\n'
+        )
+
     def test_git_forward_options(self):
         self.run_cli(['git', 'init'])
         self.run_cli(
@@ -509,6 +1186,40 @@ class TestCommand(unittest.TestCase):
         self.assertEqual(len(new_password), 10)
         self.assertEqual(remainder, 'second')
 
+    def test_rotate(self):
+        self.run_cli(['git', 'init'])
+        store = PasswordStore(self.dir)
+        store.insert_password('prod/db/main', 'old\nuser: admin')
+        store.insert_password('prod/db/replica', 'old')
+        store.insert_password('prod/web', 'untouched')
+
+        rotate = self.run_cli(['rotate', '-n', 'prod/db', '15'])
+        self.assertEqual(
+            rotate.output,
+            'Rotated prod/db/main\nRotated prod/db/replica\n'
+        )
+        self.assertLastCommitMessage('Rotate 2 passwords in prod/db.')
+
+        main, _, remainder = store.get_decrypted_password(
+            'prod/db/main'
+        ).partition('\n')
+        self.assertIsNotNone(re.match('[a-zA-Z0-9]{15}$', main))
+        self.assertEqual(remainder, 'user: admin')
+        self.assertNotEqual(
+            store.get_decrypted_password('prod/db/replica'),
+            'old'
+        )
+        self.assertEqual(
+            store.get_decrypted_password('prod/web'),
+            'untouched'
+        )
+
+        missing = self.run_cli(['rotate', 'nope'], expect_failure=True)
+        self.assertEqual(
+            missing.output,
+            'Error: nope is not in the password store.\n'
+        )
+
     @pypass.tests.skipIfTravis
     def test_generate_clip(self):
         generate = self.run_cli(['generate', '-c', 'clip.me'])
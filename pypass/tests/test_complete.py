@@ -0,0 +1,146 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from pypass.complete import complete_entries
+from pypass.index import EntryIndex
+from pypass.keys import _parse_secret_keys
+from pypass.keys import list_secret_keys
+
+
+class TestComplete(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = tempfile.mkdtemp()
+
+        for name in [
+                'Email/bob.net',
+                'Email/alice.net',
+                'Deep/only/child',
+                'test.com',
+                '.hidden/secret']:
+            path = os.path.join(self.dir, name + '.gpg')
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        shutil.rmtree(self.cache)
+
+    def test_complete_entries(self):
+        index = EntryIndex(self.dir)
+
+        self.assertEqual(
+            complete_entries(index, ''),
+            ['Deep/', 'Email/', 'test.com']
+        )
+        self.assertEqual(
+            complete_entries(index, 'Email/a'),
+            ['Email/alice.net']
+        )
+        self.assertEqual(
+            complete_entries(index, 'E', folders_only=True),
+            ['Email/']
+        )
+        self.assertEqual(
+            complete_entries(index, 'D', expand=True),
+            ['Deep/only/child']
+        )
+        self.assertEqual(complete_entries(index, '.hidden/'), [])
+        self.assertEqual(complete_entries(index, 'nope/'), [])
+
+    def test_saved_index(self):
+        cache_path = os.path.join(self.cache, 'index')
+
+        index = EntryIndex(self.dir)
+        complete_entries(index, 'Email/')
+        index.save(cache_path)
+
+        loaded = EntryIndex(self.dir)
+        loaded.load(cache_path)
+        self.assertEqual(
+            complete_entries(loaded, 'Email/'),
+            ['Email/alice.net', 'Email/bob.net']
+        )
+
+        # A saved index of another store is ignored
+        other = EntryIndex(self.cache)
+        other.load(cache_path)
+        self.assertEqual(complete_entries(other, 'Email/'), [])
+
+        # Changes made after the index was saved are seen
+        os.remove(os.path.join(self.dir, 'Email', 'bob.net.gpg'))
+        open(os.path.join(self.dir, 'Email', 'carol.net.gpg'), 'w').close()
+        loaded = EntryIndex(self.dir)
+        loaded.load(cache_path)
+        self.assertEqual(
+            complete_entries(loaded, 'Email/'),
+            ['Email/alice.net', 'Email/carol.net']
+        )
+
+    def test_complete_command(self):
+        environment = dict(os.environ)
+        environment['PASSWORD_STORE_DIR'] = self.dir
+        environment['XDG_CACHE_HOME'] = self.cache
+
+        output = subprocess.check_output(
+            [
+                sys.executable, '-c',
+                'import sys; sys.argv[0] = "pypass"; '
+                'from pypass.entrypoint import main; main()',
+                '__complete', 'entries', 'Email/'
+            ],
+            env=environment
+        )
+        self.assertEqual(output, b'Email/alice.net\nEmail/bob.net\n')
+        self.assertEqual(
+            len(os.listdir(os.path.join(self.cache, 'pypass'))),
+            1
+        )
+
+    def test_parse_secret_keys_skips_stubs(self):
+        self.assertEqual(
+            _parse_secret_keys(
+                'sec:u:1024:1:50C0C7445C5833E3:1415298335:::u:::scESC:::#:'
+                '::::0:\n'
+                'uid:u::::1415298335::41007C07::Offline <a@b.c>::::::::::0:\n'
+                'ssb:u:1024:1:6C8110881C10BC07:1415298335::::::e::::::::\n'
+            ),
+            (['6C8110881C10BC07'], ['Offline <a@b.c>'])
+        )
+
+    def test_list_secret_keys(self):
+        cache_path = os.path.join(self.cache, 'secret-keys')
+
+        key_ids, uids = list_secret_keys(cache_path=cache_path)
+        self.assertIn('6C8110881C10BC07', key_ids)
+        self.assertTrue(os.path.isfile(cache_path))
+
+        self.assertEqual(
+            list_secret_keys(cache_path=cache_path),
+            (key_ids, uids)
+        )
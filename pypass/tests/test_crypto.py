@@ -0,0 +1,262 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from pypass import PasswordStore
+from pypass.crypto import GPGBackend
+from pypass.crypto import GPGServerBackend
+from pypass.crypto import PGPyBackend
+from pypass.crypto import _matches_key
+from pypass.tests import use_temporary_cache
+
+try:
+    import pgpy
+except ImportError:
+    pgpy = None
+
+KEY_FILE = os.path.join(os.path.dirname(__file__), 'test_key_sec.asc')
+FINGERPRINT = 'D3D7CF5C9A636C0D27E2DC0850C0C7445C5833E3'
+
+skipIfNoPGPy = unittest.skipIf(pgpy is None, 'PGPy is not installed')
+
+
+class TestCrypto(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = use_temporary_cache(self)
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, '.gpg-id'), 'w') as gpg_id_file:
+            gpg_id_file.write('5C5833E3')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_matches_key(self):
+        key_ids = [FINGERPRINT, '2BFB5B83894C19160C53236E6C8110881C10BC07']
+        uids = ['pypass testing (testing key) <test@key.com>']
+        self.assertTrue(_matches_key('5C5833E3', key_ids, uids))
+        self.assertTrue(_matches_key('0x6c8110881c10bc07', key_ids, uids))
+        self.assertTrue(_matches_key('<test@key.com>', key_ids, uids))
+        self.assertTrue(_matches_key('testing key', key_ids, uids))
+        self.assertFalse(_matches_key('86B4789B', key_ids, uids))
+        self.assertFalse(_matches_key('<other@key.com>', key_ids, uids))
+
+    def test_unknown_backend(self):
+        self.assertRaises(
+            Exception, PasswordStore, self.dir, crypto_backend='rot13'
+        )
+
+    def test_gpg_backend(self):
+        gpg = GPGBackend()
+        self.assertEqual(gpg.find_keys('test@key.com'), [FINGERPRINT])
+        self.assertIn('6C8110881C10BC07', gpg.secret_key_ids())
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.cache_dir, 'pypass', 'secret-keys')
+        ))
+
+        cache_path = os.path.join(self.dir, 'secret-keys')
+        self.assertIn(
+            '6C8110881C10BC07',
+            GPGBackend(cache_path=cache_path).secret_key_ids()
+        )
+        self.assertTrue(os.path.isfile(cache_path))
+
+        file_path = os.path.join(self.dir, 'a.gpg')
+        self.assertTrue(gpg.encrypt('secret\n', file_path, ['5C5833E3']))
+        self.assertEqual(gpg.decrypt(file_path=file_path), 'secret\n')
+        self.assertEqual(gpg.recipients(file_path), ['6C8110881C10BC07'])
+        self.assertFalse(
+            gpg.encrypt('secret\n', file_path, ['<nobody@key.com>'])
+        )
+
+    @skipIfNoPGPy
+    def test_pgpy_backend(self):
+        backend = PGPyBackend([KEY_FILE])
+        self.assertEqual(backend.find_keys('5C5833E3'), [FINGERPRINT])
+        self.assertEqual(backend.find_keys('86B4789B'), [])
+        self.assertEqual(
+            backend.secret_key_ids(),
+            set(['50C0C7445C5833E3', '6C8110881C10BC07'])
+        )
+
+        file_path = os.path.join(self.dir, 'a.gpg')
+        self.assertTrue(backend.encrypt('secret\n', file_path, ['5C5833E3']))
+        self.assertEqual(backend.decrypt(file_path=file_path), 'secret\n')
+        self.assertEqual(backend.recipients(file_path), ['6C8110881C10BC07'])
+        self.assertFalse(backend.encrypt('secret\n', file_path, ['86B4789B']))
+        self.assertEqual(backend.decrypt(ciphertext=b'garbage'), None)
+
+    @skipIfNoPGPy
+    def test_pgpy_backend_key_files_from_environment(self):
+        os.environ['PASSWORD_STORE_PGPY_KEYS'] = KEY_FILE
+        try:
+            backend = PGPyBackend()
+        finally:
+            del os.environ['PASSWORD_STORE_PGPY_KEYS']
+        self.assertEqual(backend.find_keys('test@key.com'), [FINGERPRINT])
+
+    @skipIfNoPGPy
+    def test_backends_read_each_other(self):
+        gpg_store = PasswordStore(self.dir)
+        pgpy_store = PasswordStore(
+            self.dir, crypto_backend=PGPyBackend([KEY_FILE])
+        )
+
+        gpg_store.insert_password('by-gpg', 'one\nuser: bob')
+        pgpy_store.insert_password('by-pgpy', 'two\nuser: alice')
+
+        for store in (gpg_store, pgpy_store):
+            self.assertEqual(
+                store.get_decrypted_passwords(['by-gpg', 'by-pgpy']),
+                {'by-gpg': 'one\nuser: bob', 'by-pgpy': 'two\nuser: alice'}
+            )
+
+
+class TestGPGServer(unittest.TestCase):
+
+    def setUp(self):
+        use_temporary_cache(self)
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, '.gpg-id'), 'w') as gpg_id_file:
+            gpg_id_file.write('5C5833E3')
+        self.backend = GPGServerBackend(servers=1)
+
+    def tearDown(self):
+        self.backend.close()
+        shutil.rmtree(self.dir)
+
+    def file_path(self, name):
+        return os.path.join(self.dir, name + '.gpg')
+
+    def test_servers_are_reused(self):
+        for number in range(3):
+            self.assertTrue(self.backend.encrypt(
+                'secret %d\n' % number, self.file_path(str(number)),
+                ['5C5833E3']
+            ))
+        self.assertEqual(len(self.backend._idle), 1)
+        pid = self.backend._idle[0].process.pid
+
+        for number in range(3):
+            self.assertEqual(
+                self.backend.decrypt(file_path=self.file_path(str(number))),
+                'secret %d\n' % number
+            )
+        with open(self.file_path('1'), 'rb') as f:
+            self.assertEqual(
+                self.backend.decrypt(ciphertext=f.read()), 'secret 1\n'
+            )
+        self.assertIn(self.backend.reuse_for_decryption, (True, False))
+        # Remembered for the next processes, which don't probe again
+        self.assertEqual(
+            GPGServerBackend(servers=1).reuse_for_decryption,
+            self.backend.reuse_for_decryption
+        )
+
+        self.assertTrue(self.backend.encrypt(
+            'again', self.file_path('again'), ['5C5833E3']
+        ))
+        self.assertEqual(self.backend._idle[0].process.pid, pid)
+
+    def test_quiet(self):
+        # The probe of whether a server decrypts twice makes gpg 2.2 print
+        # warnings, which must not reach the terminal
+        script = (
+            'import os, sys\n'
+            'from pypass.crypto import GPGServerBackend\n'
+            'backend = GPGServerBackend(servers=1)\n'
+            'for name in ("a", "b"):\n'
+            '    path = os.path.join(sys.argv[1], name + ".gpg")\n'
+            '    backend.encrypt(name, path, ["5C5833E3"])\n'
+            '    assert backend.decrypt(file_path=path) == name\n'
+            'backend.close()\n'
+        )
+        process = subprocess.Popen(
+            [sys.executable, '-c', script, self.dir],
+            shell=False,
+            stderr=subprocess.PIPE,
+            cwd=os.path.dirname(os.path.dirname(os.path.dirname(
+                os.path.abspath(__file__)
+            )))
+        )
+        _, stderr = process.communicate()
+        self.assertEqual(process.returncode, 0)
+        self.assertEqual(stderr.decode(), '')
+
+    def test_failures(self):
+        self.assertFalse(self.backend.encrypt(
+            'secret', self.file_path('a'), ['<nobody@key.com>']
+        ))
+        self.assertFalse(os.path.exists(self.file_path('a')))
+        self.assertEqual(self.backend.decrypt(ciphertext=b'garbage'), None)
+        self.assertEqual(
+            self.backend.decrypt(file_path=self.file_path('missing')), None
+        )
+
+    def test_dead_and_stale_servers_are_replaced(self):
+        self.assertTrue(self.backend.encrypt(
+            'one', self.file_path('one'), ['5C5833E3']
+        ))
+        server = self.backend._idle[0]
+        server.process.kill()
+        server.process.wait()
+
+        self.assertTrue(self.backend.encrypt(
+            'two', self.file_path('two'), ['5C5833E3']
+        ))
+        self.assertNotEqual(self.backend._idle[0], server)
+
+        server = self.backend._idle[0]
+        server.keyring = None
+        self.assertEqual(
+            self.backend.decrypt(file_path=self.file_path('two')), 'two'
+        )
+        self.assertFalse(server.alive)
+
+    def test_connection_lost_during_operation(self):
+        self.assertTrue(self.backend.encrypt(
+            'one', self.file_path('one'), ['5C5833E3']
+        ))
+        # The server looks alive but its connection is gone
+        self.backend._idle[0].socket.close()
+        self.assertTrue(self.backend.encrypt(
+            'two', self.file_path('two'), ['5C5833E3']
+        ))
+        self.assertEqual(
+            self.backend.decrypt(file_path=self.file_path('two')), 'two'
+        )
+
+    def test_password_store(self):
+        store = PasswordStore(self.dir, crypto_backend='gpg-server')
+        passwords = dict(
+            ('site%d.com' % number, 'password %d' % number)
+            for number in range(10)
+        )
+        store.insert_passwords(passwords)
+        self.assertEqual(
+            store.get_decrypted_passwords(list(passwords)), passwords
+        )
+        store.close()
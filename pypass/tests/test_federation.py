@@ -0,0 +1,137 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pypass import PasswordStore
+from pypass.federation import FederatedStore
+from pypass.tests import use_temporary_cache
+from pypass.tree import render_tree
+
+
+class TestFederatedStore(unittest.TestCase):
+
+    def make_store(self, passwords):
+        path = tempfile.mkdtemp()
+        self.dirs.append(path)
+
+        # .gpg_id file
+        with open(os.path.join(path, '.gpg-id'), 'w') as gpg_id_file:
+            gpg_id_file.write('5C5833E3')
+
+        store = PasswordStore(path)
+        store.insert_passwords(passwords)
+        return store
+
+    def setUp(self):
+        use_temporary_cache(self)
+        self.dirs = []
+        self.personal = self.make_store({
+            'Email/bob.net': 'bob\nuser: bob',
+            'team/hidden': 'hidden by the team store',
+        })
+        self.team = self.make_store({
+            'db': 'dbpass\nuser: admin',
+            'Servers/web': 'webpass',
+        })
+        self.stores = FederatedStore({
+            '': self.personal,
+            'team/': self.team,
+        })
+
+    def tearDown(self):
+        for path in self.dirs:
+            shutil.rmtree(path)
+
+    def test_mounts(self):
+        self.assertEqual(self.stores.prefixes, ['', 'team'])
+        self.assertEqual(
+            self.stores.resolve('team/Servers/web'),
+            (self.team, 'Servers/web')
+        )
+        self.assertEqual(
+            self.stores.resolve('Email/bob.net'),
+            (self.personal, 'Email/bob.net')
+        )
+        self.assertRaises(
+            Exception,
+            FederatedStore,
+            {'team': self.team, 'team/': self.personal}
+        )
+        self.assertRaises(
+            Exception,
+            FederatedStore({'team': self.team}).resolve,
+            'Email/bob.net'
+        )
+
+    def test_listing(self):
+        self.assertEqual(
+            self.stores.get_passwords_list(),
+            ['Email/bob.net', 'team/Servers/web', 'team/db']
+        )
+        self.assertEqual(
+            list(self.stores.find(['web', 'bob'])),
+            ['Email/bob.net', 'team/Servers/web']
+        )
+        self.assertEqual(
+            render_tree(self.stores.find(['d*'])),
+            [u'└── \x1b[1m\x1b[34mteam\x1b[0m',
+             u'    └── db']
+        )
+
+    def test_decrypt(self):
+        self.assertEqual(
+            self.stores.get_decrypted_password('team/db'),
+            'dbpass\nuser: admin'
+        )
+        self.assertEqual(
+            self.stores.get_decrypted_passwords(
+                ['team/db', 'Email/bob.net']
+            ),
+            {
+                'team/db': 'dbpass\nuser: admin',
+                'Email/bob.net': 'bob\nuser: bob',
+            }
+        )
+        self.assertEqual(
+            list(self.stores.grep('^user: ')),
+            [('Email/bob.net', ['user: bob']),
+             ('team/db', ['user: admin'])]
+        )
+        self.assertEqual(
+            list(self.stores.iter_decrypted_passwords(
+                iter(['team/db', 'team/nope', 'Email/bob.net'])
+            )),
+            [
+                ('team/db', 'dbpass\nuser: admin', None),
+                ('team/nope', None,
+                 'team/nope is not in the password store'),
+                ('Email/bob.net', 'bob\nuser: bob', None),
+            ]
+        )
+
+    def test_insert(self):
+        self.stores.insert_password('team/new', 'new')
+        self.assertEqual(self.team.get_decrypted_password('new'), 'new')
+        self.assertFalse(
+            os.path.exists(os.path.join(self.personal.path, 'team', 'new.gpg'))
+        )
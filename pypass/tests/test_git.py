@@ -0,0 +1,312 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+
+from pypass import PasswordStore
+from pypass.git import GitCatFile
+from pypass.git import GitWriter
+from pypass.tests import use_temporary_cache
+
+
+class TestInProcessGitBackend(unittest.TestCase):
+
+    backend = 'inprocess'
+
+    def git(self, *args):
+        git = subprocess.Popen(
+            [
+                'git',
+                '--git-dir=%s' % os.path.join(self.dir, '.git'),
+                '--work-tree=%s' % self.dir,
+            ] + list(args),
+            shell=False,
+            stdout=subprocess.PIPE
+        )
+        stdout, _ = git.communicate()
+        self.assertEqual(git.returncode, 0)
+        return stdout.decode()
+
+    def setUp(self):
+        use_temporary_cache(self)
+        self.dir = tempfile.mkdtemp()
+
+        # .gpg_id file
+        with open(os.path.join(self.dir, '.gpg-id'), 'w') as gpg_id_file:
+            gpg_id_file.write('5C5833E3')
+
+        self.store = PasswordStore(self.dir, git_backend=self.backend)
+        self.store.git_init()
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.dir)
+
+    def test_unknown_backend(self):
+        self.assertRaises(
+            Exception, PasswordStore, self.dir, git_backend='nope'
+        )
+
+    def test_commit(self):
+        head = self.git('rev-parse', 'HEAD').strip()
+
+        self.store.insert_password('Email/bob.net', 'bob')
+        self.store.insert_password('alice.com', 'alice')
+        self.store.git_add_and_commit(
+            ['Email/bob.net.gpg', 'alice.com.gpg'],
+            message='Add two passwords.  \n\n\n'
+        )
+
+        self.assertEqual(self.git('log', '-1', '--pretty=%B'),
+                         'Add two passwords.\n\n')
+        self.assertEqual(self.git('rev-parse', 'HEAD~1').strip(), head)
+        self.assertEqual(
+            self.git('show', '--name-only', '--pretty=', 'HEAD').split(),
+            ['Email/bob.net.gpg', 'alice.com.gpg']
+        )
+        self.assertEqual(self.git('status', '--porcelain'), '')
+        self.git('fsck', '--strict')
+        self.assertIn(
+            'commit: Add two passwords.',
+            self.git('reflog', '-1', '--format=%gs')
+        )
+
+        # Removed files are removed from the repository
+        os.remove(os.path.join(self.dir, 'Email', 'bob.net.gpg'))
+        os.rmdir(os.path.join(self.dir, 'Email'))
+        self.store.git_add_and_commit('Email', message='Remove Email.')
+        self.assertEqual(
+            self.git('show', '--name-status', '--pretty=', 'HEAD').split(),
+            ['D', 'Email/bob.net.gpg']
+        )
+        self.assertEqual(self.git('status', '--porcelain'), '')
+
+        # Committing again without changes creates no commit
+        head = self.git('rev-parse', 'HEAD').strip()
+        self.store.git_add_and_commit('alice.com.gpg', message='Nothing.')
+        self.assertEqual(self.git('rev-parse', 'HEAD').strip(), head)
+
+        # Packed objects and refs are read as well
+        self.git('gc', '--quiet')
+        self.store.close()
+        self.store.insert_password('alice.com', 'changed')
+        self.store.git_add_and_commit('alice.com.gpg', message='Change.')
+        self.assertEqual(self.git('rev-parse', 'HEAD~1').strip(), head)
+        self.assertEqual(self.git('status', '--porcelain'), '')
+        self.git('fsck', '--strict')
+
+    def test_commit_removed_untracked(self):
+        self.store.insert_password('kept', 'kept')
+        self.store.insert_password('Gone/away', 'away')
+        shutil.rmtree(os.path.join(self.dir, 'Gone'))
+
+        self.store.git_add_and_commit(
+            ['kept.gpg', 'Gone/away.gpg', 'Gone'],
+            message='Add kept.'
+        )
+        self.assertEqual(
+            self.git('show', '--name-only', '--pretty=', 'HEAD').split(),
+            ['kept.gpg']
+        )
+
+    def test_hooks_use_git(self):
+        hook_path = os.path.join(self.dir, '.git', 'hooks', 'commit-msg')
+        with open(hook_path, 'w') as hook:
+            hook.write('#!/bin/sh\necho "Signed-off-by: hook" >> "$1"\n')
+        os.chmod(hook_path, 0o755)
+
+        self.store.insert_password('hooked', 'hooked')
+        self.store.git_add_and_commit('hooked.gpg', message='Hooked.')
+
+        self.assertEqual(
+            self.git('log', '-1', '--pretty=%B').strip(),
+            'Hooked.\nSigned-off-by: hook'
+        )
+
+
+class TestSubprocessGitBackend(TestInProcessGitBackend):
+
+    backend = 'subprocess'
+
+
+class TestGitCatFile(unittest.TestCase):
+
+    def test_read(self):
+        store_dir = tempfile.mkdtemp()
+        with open(os.path.join(store_dir, '.gpg-id'), 'w') as gpg_id_file:
+            gpg_id_file.write('5C5833E3')
+        PasswordStore(store_dir).git_init()
+
+        git_cat_file = GitCatFile(os.path.join(store_dir, '.git'))
+        self.assertEqual(git_cat_file.read('HEAD', '.gpg-id'), b'5C5833E3')
+        self.assertIsNone(git_cat_file.read('HEAD', 'nope'))
+        # git answers "HEAD:c d.gpg missing", three fields
+        self.assertIsNone(git_cat_file.read('HEAD', 'c d.gpg'))
+        self.assertEqual(git_cat_file.read_object('HEAD')[0], 'commit')
+        self.assertRaises(ValueError, git_cat_file.read_object, 'a\nb')
+
+        with open(os.path.join(store_dir, 'c d.gpg'), 'w') as spaced:
+            spaced.write('spaced')
+        PasswordStore(store_dir).git_add_and_commit('c d.gpg', message='c d')
+        self.assertEqual(git_cat_file.read('HEAD', 'c d.gpg'), b'spaced')
+        self.assertIsNone(git_cat_file.read('HEAD~1', 'c d.gpg'))
+        git_cat_file.close()
+
+        shutil.rmtree(store_dir)
+
+
+class TestGitWriter(unittest.TestCase):
+
+    def test_run(self):
+        writer = GitWriter()
+        running = []
+        overlaps = []
+
+        def job(number):
+            running.append(number)
+            if len(running) > 1:
+                overlaps.append(number)
+            running.remove(number)
+            return threading.current_thread(), number
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda n=n: results.append(writer.run(
+                job, n
+            )))
+            for n in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # All the jobs ran, one at a time, on the same thread
+        self.assertEqual(sorted(number for _, number in results),
+                         list(range(20)))
+        self.assertEqual(len(set(thread for thread, _ in results)), 1)
+        self.assertEqual(overlaps, [])
+
+        def fail():
+            raise Exception('failed')
+
+        self.assertRaises(Exception, writer.run, fail)
+
+        def interrupt():
+            raise KeyboardInterrupt()
+
+        # Not even a KeyboardInterrupt stops the thread or hangs the caller
+        self.assertRaises(KeyboardInterrupt, writer.run, interrupt)
+        self.assertEqual(writer.run(lambda: 2), 2)
+
+        # Jobs queued by a job run right away instead of deadlocking
+        self.assertEqual(writer.run(lambda: writer.run(lambda: 42)), 42)
+
+        writer.stop()
+        self.assertEqual(writer.run(lambda: 1), 1)
+        writer.stop()
+
+
+class TestSync(unittest.TestCase):
+
+    def setUp(self):
+        use_temporary_cache(self)
+        self.origin_dir = tempfile.mkdtemp()
+        self.first_dir = tempfile.mkdtemp()
+        self.second_dir = tempfile.mkdtemp()
+
+        subprocess.call(
+            ['git', 'init', '--quiet', '--bare', self.origin_dir],
+            shell=False
+        )
+
+        with open(os.path.join(self.first_dir, '.gpg-id'), 'w') as gpg_id:
+            gpg_id.write('5C5833E3')
+        self.first = PasswordStore(self.first_dir)
+        self.first.git_init()
+        self.first.insert_password('shared', 'v1')
+        self.first.git_add_and_commit('shared.gpg', message='Add shared.')
+        subprocess.call(
+            [
+                'git', '--git-dir=%s' % self.first.git_dir,
+                'remote', 'add', 'origin', self.origin_dir,
+            ],
+            shell=False
+        )
+        self.first.git_push()
+
+        self.second = PasswordStore.init(
+            '5C5833E3', self.second_dir, clone_url=self.origin_dir
+        )
+
+    def tearDown(self):
+        self.first.close()
+        self.second.close()
+        shutil.rmtree(self.origin_dir)
+        shutil.rmtree(self.first_dir)
+        shutil.rmtree(self.second_dir)
+
+    def test_sync(self):
+        second = PasswordStore(self.second_dir, cache_decrypted=True)
+        self.assertEqual(second.get_passwords_list(), ['shared'])
+        self.assertEqual(second.get_decrypted_password('shared'), 'v1')
+
+        self.first.insert_password('shared', 'v2')
+        self.first.insert_password('Email/new', 'new')
+        self.first.git_add_and_commit(
+            ['shared.gpg', 'Email/new.gpg'], message='Change.'
+        )
+        self.assertEqual(self.first.sync(), [])
+
+        self.assertEqual(second.sync(), ['Email/new', 'shared'])
+        self.assertNotIn('shared', second.decryption_cache)
+        self.assertEqual(second.get_passwords_list(), ['Email/new', 'shared'])
+        self.assertEqual(second.get_decrypted_password('shared'), 'v2')
+
+        # Nothing changed
+        self.assertEqual(second.sync(), [])
+
+        # Local commits are pushed
+        second.insert_password('local', 'local')
+        second.git_add_and_commit('local.gpg', message='Add local.')
+        second.sync()
+        self.assertEqual(self.first.sync(push=False), ['local'])
+        second.close()
+
+    def test_background_push(self):
+        pushes = []
+        git_push = self.first.git_push
+        self.first.git_push = lambda *args: pushes.append(git_push(*args))
+
+        self.first.start_background_push(delay=0.2)
+        for i in range(3):
+            self.first.insert_password('burst', str(i))
+            self.first.git_add_and_commit('burst.gpg', message=str(i))
+        self.first.stop_background_push()
+
+        # The three commits were pushed at once
+        self.assertEqual(len(pushes), 1)
+
+        self.assertEqual(self.second.sync(push=False), ['burst'])
+        self.assertEqual(self.second.get_decrypted_password('burst'), '2')
@@ -0,0 +1,123 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from pypass import PasswordStore
+from pypass.materialize import Materializer
+from pypass.tests import use_temporary_cache
+from pypass.watch import ADDED, DELETED, MODIFIED
+from pypass.watch import StoreWatcher
+
+
+class TestMaterialize(unittest.TestCase):
+
+    def setUp(self):
+        use_temporary_cache(self)
+        self.dir = tempfile.mkdtemp()
+        self.destination = os.path.join(tempfile.mkdtemp(), 'out')
+
+        # .gpg_id file
+        with open(os.path.join(self.dir, '.gpg-id'), 'w') as gpg_id_file:
+            gpg_id_file.write('5C5833E3')
+
+        self.store = PasswordStore(self.dir)
+        self.store.insert_password('prod/db', 'dbpass\n')
+        self.store.insert_password('prod/web/api', 'token')
+        self.store.insert_password('dev/db', 'devpass')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        shutil.rmtree(os.path.dirname(self.destination))
+
+    def read(self, name):
+        with open(os.path.join(self.destination, name), 'r') as f:
+            return f.read()
+
+    def test_sync(self):
+        materializer = Materializer(self.store, self.destination, 'prod')
+
+        self.assertEqual(materializer.sync(), (['db', 'web/api'], []))
+        self.assertEqual(self.read('db'), 'dbpass\n')
+        self.assertEqual(self.read('web/api'), 'token')
+        self.assertFalse(
+            os.path.exists(os.path.join(self.destination, 'dev'))
+        )
+        self.assertEqual(
+            stat.S_IMODE(
+                os.stat(os.path.join(self.destination, 'web/api')).st_mode
+            ),
+            0o600
+        )
+
+        # Nothing changed, nothing is decrypted
+        self.assertEqual(materializer.sync(), ([], []))
+
+        # Only the changed entry is written, removed entries are deleted
+        self.store.insert_password('prod/db', 'rotated')
+        os.remove(os.path.join(self.dir, 'prod', 'web', 'api.gpg'))
+        self.assertEqual(materializer.sync(), (['db'], ['web/api']))
+        self.assertEqual(self.read('db'), 'rotated')
+        self.assertFalse(
+            os.path.exists(os.path.join(self.destination, 'web'))
+        )
+
+        # A deleted plain text copy is written again
+        os.remove(os.path.join(self.destination, 'db'))
+        self.assertEqual(materializer.sync(), (['db'], []))
+
+    def test_watcher(self):
+        for use_inotify in (True, False):
+            watcher = StoreWatcher(
+                self.dir, poll_interval=0.01, use_inotify=use_inotify
+            )
+            with watcher:
+                self.assertEqual(watcher.read_events(timeout=0.05), [])
+
+                self.store.insert_password('prod/new', 'new')
+                self.store.insert_password('dev/db', 'changed')
+                os.remove(os.path.join(self.dir, 'prod', 'db.gpg'))
+                os.mkdir(os.path.join(self.dir, 'moved'))
+                os.rename(
+                    os.path.join(self.dir, 'prod', 'web'),
+                    os.path.join(self.dir, 'moved', 'web')
+                )
+
+                events = []
+                for _ in range(20):
+                    events.extend(watcher.read_events(timeout=0.05))
+                self.assertEqual(
+                    sorted(set(events)),
+                    sorted([
+                        (ADDED, os.path.join('prod', 'new.gpg')),
+                        (MODIFIED, os.path.join('dev', 'db.gpg')),
+                        (DELETED, os.path.join('prod', 'db.gpg')),
+                        (DELETED, os.path.join('prod', 'web', 'api.gpg')),
+                        (ADDED, os.path.join('moved', 'web', 'api.gpg')),
+                    ])
+                )
+
+            shutil.rmtree(os.path.join(self.dir, 'moved'))
+            os.remove(os.path.join(self.dir, 'prod', 'new.gpg'))
+            self.store.insert_password('prod/db', 'dbpass\n')
+            self.store.insert_password('prod/web/api', 'token')
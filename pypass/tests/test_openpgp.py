@@ -0,0 +1,98 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import base64
+import unittest
+
+from pypass.openpgp import iter_packets
+from pypass.openpgp import recipient_key_ids
+
+# A message for 6C8110881C10BC07: a PKESK packet in the old format, a
+# SEIPD packet in the new format, with a fake 3 byte body
+PKESK_BODY = b'\x03\x6c\x81\x10\x88\x1c\x10\xbc\x07\x01' + b'\x00' * 10
+MESSAGE = b'\x84' + bytearray([len(PKESK_BODY)]) + PKESK_BODY + \
+    b'\xd2\x03\x01\xaa\xbb'
+
+
+class TestOpenPGP(unittest.TestCase):
+
+    def test_iter_packets(self):
+        self.assertEqual(
+            list(iter_packets(MESSAGE)),
+            [(1, PKESK_BODY), (18, b'\x01\xaa\xbb')]
+        )
+
+    def test_iter_packets_partial_lengths(self):
+        # 2 bytes in a partial chunk, then the last byte
+        self.assertEqual(
+            list(iter_packets(b'\xd2\xe1\x01\xaa\x01\xbb')),
+            [(18, b'\x01\xaa\xbb')]
+        )
+        self.assertRaises(
+            Exception, list, iter_packets(b'\xc1\xe1\x03\xaa\x01\xbb')
+        )
+
+    def test_iter_packets_long_lengths(self):
+        body = b'\x01' + b'\x00' * 999
+        self.assertEqual(
+            list(iter_packets(b'\xd2\xc3\x28' + body)),
+            [(18, body)]
+        )
+        self.assertEqual(
+            list(iter_packets(b'\xd2\xff\x00\x00\x03\xe8' + body)),
+            [(18, body)]
+        )
+        self.assertEqual(
+            list(iter_packets(b'\xa5\x03\xe8' + body)),
+            [(9, body)]
+        )
+
+    def test_recipient_key_ids(self):
+        self.assertEqual(recipient_key_ids(MESSAGE), ['6C8110881C10BC07'])
+
+    def test_recipient_key_ids_armored(self):
+        armored = b'\n'.join([
+            b'-----BEGIN PGP MESSAGE-----',
+            b'Comment: test',
+            b'',
+            base64.b64encode(MESSAGE),
+            b'=AAAA',
+            b'-----END PGP MESSAGE-----',
+            b'',
+        ])
+        self.assertEqual(recipient_key_ids(armored), ['6C8110881C10BC07'])
+
+    def test_malformed_messages(self):
+        for message in [
+                b'',
+                b'not a message',
+                MESSAGE[:5],
+                MESSAGE[:-1],
+                MESSAGE + b'\x00',
+                MESSAGE + MESSAGE,
+                MESSAGE[:len(PKESK_BODY) + 2],
+                MESSAGE[len(PKESK_BODY) + 2:],
+                b'-----BEGIN PGP MESSAGE-----\n\nAAAA',
+        ]:
+            self.assertRaises(Exception, recipient_key_ids, message)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,22 +17,31 @@
 #    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import binascii
 import unittest
 import os
 import shutil
 import subprocess
 import string
 import tempfile
+import threading
+import time
 
 from pypass import PasswordStore
 from pypass import EntryType
+from pypass import MissingSecretKeyError
+from pypass.crypto import GPGBackend
+from pypass.openpgp import recipient_key_ids
+from pypass.tests import use_temporary_cache
 
 from ..passwordstore import GPG_BIN
+from ..passwordstore import _EntryLocks
 
 
 class TestPasswordStore(unittest.TestCase):
 
     def setUp(self):
+        use_temporary_cache(self)
         self.dir = tempfile.mkdtemp()
 
         # .gpg_id file
@@ -130,6 +139,355 @@ class TestPasswordStore(unittest.TestCase):
             store.get_decrypted_password('hello', entry=EntryType.hostname)
         )
 
+    def test_get_decrypted_passwords(self):
+        store = PasswordStore(self.dir)
+        store.insert_password('one.com', 'first\nusername: alice')
+        store.insert_password('two.com', 'second')
+
+        self.assertEqual(
+            store.get_decrypted_passwords(['one.com', 'two.com', 'one.com']),
+            {'one.com': 'first\nusername: alice', 'two.com': 'second'}
+        )
+        self.assertEqual(
+            store.get_decrypted_passwords(
+                ['one.com'], entry=EntryType.username
+            ),
+            {'one.com': 'alice'}
+        )
+        self.assertEqual(store.get_decrypted_passwords([]), {})
+        self.assertRaises(
+            Exception,
+            store.get_decrypted_passwords,
+            ['one.com', 'nope.com']
+        )
+
+    def test_missing_secret_key(self):
+        decryptions = []
+
+        class CountingBackend(GPGBackend):
+            def decrypt(self, file_path=None, ciphertext=None):
+                decryptions.append(file_path)
+                return GPGBackend.decrypt(self, file_path, ciphertext)
+
+        store = PasswordStore(self.dir, crypto_backend=CountingBackend())
+        store.insert_password('mine.com', 'mine')
+        store.insert_password('theirs.com', 'theirs')
+
+        # Point the session key at a key we have no secret key of
+        theirs_path = os.path.join(self.dir, 'theirs.com.gpg')
+        with open(theirs_path, 'rb') as f:
+            ciphertext = f.read()
+        with open(theirs_path, 'wb') as f:
+            f.write(ciphertext.replace(
+                binascii.unhexlify('6C8110881C10BC07'),
+                binascii.unhexlify('0123456789ABCDEF')
+            ))
+
+        with self.assertRaises(MissingSecretKeyError) as raised:
+            store.get_decrypted_password('theirs.com')
+        self.assertEqual(raised.exception.path, 'theirs.com')
+        self.assertEqual(raised.exception.key_ids, ['0123456789ABCDEF'])
+
+        self.assertRaises(
+            MissingSecretKeyError,
+            store.get_decrypted_passwords,
+            ['mine.com', 'theirs.com']
+        )
+        self.assertEqual(
+            store.get_decrypted_passwords(
+                ['mine.com', 'theirs.com'], skip_undecryptable=True
+            ),
+            {'mine.com': 'mine'}
+        )
+        self.assertNotIn(theirs_path, decryptions)
+
+    def test_get_decrypted_password_at_revision(self):
+        store = PasswordStore(self.dir)
+        self.assertRaises(
+            Exception, store.get_decrypted_password, 'hist', rev='HEAD'
+        )
+
+        store.git_init()
+        for version in ('v1', 'v2', 'v3'):
+            store.insert_password('hist', version + '\nusername: bob')
+            store.git_add_and_commit('hist.gpg', message=version)
+        os.remove(os.path.join(self.dir, 'hist.gpg'))
+        store.git_add_and_commit('hist.gpg', message='removed')
+
+        self.assertEqual(
+            store.get_decrypted_password('hist', rev='HEAD~1'),
+            'v3\nusername: bob'
+        )
+        self.assertEqual(
+            store.get_decrypted_password(
+                'hist', entry=EntryType.password, rev='HEAD~3'
+            ),
+            'v1'
+        )
+        self.assertEqual(
+            store.get_decrypted_passwords(['hist'], rev='HEAD~2'),
+            {'hist': 'v2\nusername: bob'}
+        )
+        self.assertRaises(
+            Exception, store.get_decrypted_password, 'hist', rev='HEAD'
+        )
+
+        history = store.get_password_history('hist', entry=EntryType.password)
+        self.assertEqual(
+            [content for _, content in history],
+            [None, 'v3', 'v2', 'v1']
+        )
+
+        # Paths are relative to the store, wherever the caller is
+        old_cwd = os.getcwd()
+        os.chdir(os.path.join(self.dir, 'Email'))
+        try:
+            self.assertEqual(len(store.get_password_history('hist')), 4)
+        finally:
+            os.chdir(old_cwd)
+
+        # Names with spaces, missing at some revisions
+        store.insert_password('My Bank', 'bank')
+        store.git_add_and_commit('My Bank.gpg', message='bank')
+        self.assertEqual(
+            store.get_password_history('My Bank'),
+            [(store._git_output('rev-parse', 'HEAD').strip(), 'bank')]
+        )
+        self.assertRaises(
+            Exception, store.get_decrypted_password, 'My Bank', rev='HEAD~1'
+        )
+
+        # All the revisions are read by the same git process
+        git_process = store._git_cat_file._process
+        store.get_decrypted_password('hist', rev='HEAD~2')
+        self.assertIs(store._git_cat_file._process, git_process)
+
+        store.close()
+        self.assertIsNone(store._git_cat_file)
+
+    def test_pack(self):
+        decryptions = []
+
+        class CountingBackend(GPGBackend):
+            def decrypt(self, file_path=None, ciphertext=None):
+                decryptions.append(os.path.basename(file_path))
+                return GPGBackend.decrypt(self, file_path, ciphertext)
+
+        store = PasswordStore(self.dir, crypto_backend=CountingBackend())
+        paths = ['Web/a', 'Web/b', 'Web/c']
+        for path in paths:
+            store.insert_password(path, path + '\nurl: ' + path)
+        pack_file = os.path.join(self.dir, 'Web', '.pypass-pack')
+
+        # Nothing in the root folder can be decrypted
+        self.assertEqual(store.pack(), ['Web'])
+        self.assertTrue(os.path.isfile(pack_file))
+        self.assertFalse(os.path.exists(
+            os.path.join(self.dir, '.pypass-pack')
+        ))
+        self.assertEqual(store.pack(), [])
+
+        del decryptions[:]
+        expected = dict((path, path + '\nurl: ' + path) for path in paths)
+        self.assertEqual(store.get_decrypted_passwords(paths), expected)
+        self.assertEqual(decryptions, ['.pypass-pack'])
+
+        # Per-file reads still decrypt the file
+        del decryptions[:]
+        self.assertEqual(
+            store.get_decrypted_password('Web/a', entry=EntryType.password),
+            'Web/a'
+        )
+        self.assertEqual(decryptions, ['a.gpg'])
+
+        # Files written since the pack shadow it
+        store.insert_password('Web/b', 'new b')
+        del decryptions[:]
+        self.assertEqual(
+            store.get_decrypted_passwords(['Web/a', 'Web/b']),
+            {'Web/a': expected['Web/a'], 'Web/b': 'new b'}
+        )
+        self.assertEqual(sorted(decryptions), ['.pypass-pack', 'b.gpg'])
+
+        # Removing a password removes the pack that still holds it
+        store.remove_password('Web/c')
+        self.assertFalse(os.path.exists(pack_file))
+        self.assertRaises(
+            Exception, store.get_decrypted_passwords, ['Web/c']
+        )
+
+        self.assertEqual(store.pack('Web'), ['Web'])
+        del decryptions[:]
+        self.assertEqual(
+            store.get_decrypted_passwords(['Web/a', 'Web/b']),
+            {'Web/a': expected['Web/a'], 'Web/b': 'new b'}
+        )
+        self.assertEqual(decryptions, ['.pypass-pack'])
+
+        # A pack for another .gpg-id than the one of its folder is ignored
+        with open(os.path.join(self.dir, 'Web', '.gpg-id'), 'w') as gpg_id:
+            gpg_id.write('D3D7CF5C9A636C0D27E2DC0850C0C7445C5833E3')
+        del decryptions[:]
+        store.get_decrypted_passwords(['Web/a', 'Web/b'])
+        self.assertEqual(
+            sorted(decryptions), ['.pypass-pack', 'a.gpg', 'b.gpg']
+        )
+        self.assertEqual(store.pack(), ['Web'])
+
+        # As does moving a password out of the folder
+        store.move_password('Web/a', 'Other/a')
+        self.assertFalse(os.path.exists(pack_file))
+        self.assertEqual(store.pack(), ['Other', 'Web'])
+
+        # A moved folder leaves its pack behind
+        store.move_password('Other', 'Moved')
+        self.assertFalse(os.path.exists(
+            os.path.join(self.dir, 'Moved', '.pypass-pack')
+        ))
+        self.assertEqual(store.get_decrypted_password('Moved/a'),
+                         expected['Web/a'])
+
+    def test_entry_locks(self):
+        entry_locks = _EntryLocks()
+        entered = threading.Event()
+
+        def hold():
+            with entry_locks.hold(['a/b']):
+                entered.set()
+
+        with entry_locks.hold(['a//b', '/a/b/']):
+            self.assertEqual(list(entry_locks._locks), ['a/b'])
+            thread = threading.Thread(target=hold)
+            thread.start()
+            # The same entry, so the other thread waits for it
+            self.assertFalse(entered.wait(0.2))
+        thread.join()
+        self.assertTrue(entered.is_set())
+        self.assertEqual(entry_locks._locks, {})
+
+    def test_concurrent_use(self):
+        store = PasswordStore(self.dir)
+        store.git_init()
+        shared = ['shared/%d' % number for number in range(3)]
+        for path in shared:
+            store.insert_password(path, 'initial')
+        written = dict((path, set(['initial'])) for path in shared)
+        errors = []
+
+        def write(thread):
+            try:
+                for number in range(8):
+                    own = 'thread%d/%d' % (thread, number)
+                    store.insert_password(own, own)
+                    path = shared[(thread + number) % len(shared)]
+                    content = '%d-%d' % (thread, number)
+                    written[path].add(content)
+                    store.insert_password(path, content)
+                    store.git_add_and_commit(
+                        [own + '.gpg', path + '.gpg'], message=own
+                    )
+            except Exception as e:
+                errors.append(e)
+
+        def read():
+            try:
+                for _ in range(10):
+                    for path in shared:
+                        self.assertIn(
+                            store.get_decrypted_password(path), written[path]
+                        )
+            except Exception as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target=write, args=(thread,))
+            for thread in range(6)
+        ] + [threading.Thread(target=read) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        # No write was lost, and every file decrypts
+        own_paths = [
+            'thread%d/%d' % (thread, number)
+            for thread in range(6) for number in range(8)
+        ]
+        self.assertEqual(
+            store.get_decrypted_passwords(own_paths),
+            dict((path, path) for path in own_paths)
+        )
+        for path, content in store.get_decrypted_passwords(shared).items():
+            self.assertIn(content, written[path])
+
+        # Everything was committed, and no temporary file was left behind
+        log = subprocess.check_output(
+            ['git', '-C', self.dir, 'log', '--format=%s']
+        ).decode().split('\n')
+        self.assertEqual(set(own_paths) - set(log), set())
+        self.assertEqual(subprocess.check_output(
+            ['git', '-C', self.dir, 'status', '--porcelain', '--',
+             'thread*', 'shared']
+        ), b'')
+        for _, _, file_names in os.walk(self.dir):
+            self.assertEqual(
+                [name for name in file_names if name.endswith('.tmp')], []
+            )
+        self.assertEqual(store._entry_locks._locks, {})
+        store.close()
+
+    def test_store_at_revision(self):
+        store = PasswordStore(self.dir)
+        self.assertRaises(Exception, store.at, 'HEAD')
+
+        store.git_init()
+        store.insert_password('old.com', 'old')
+        store.git_add_and_commit('old.com.gpg', message='old')
+        view = store.at('HEAD')
+
+        # Change the working tree and the branch after the view was made
+        store.remove_password('old.com')
+        store.insert_password('new.com', 'new')
+        with open(os.path.join(self.dir, 'Email', '.gpg-id'), 'w') as gpg_id:
+            gpg_id.write('5C5833E3')
+        store.git_add_and_commit('.', message='new')
+
+        self.assertEqual(view.get_passwords_list(), [
+            'Email/email.com',
+            'linux.ca',
+            'old.com',
+            'passwordstore.org',
+            'test.com',
+        ])
+        self.assertTrue(view.has_password('old.com'))
+        self.assertFalse(view.has_password('new.com'))
+        self.assertEqual(
+            view._get_gpg_id(os.path.join(self.dir, 'Email', 'a.gpg')),
+            '86B4789B'
+        )
+        self.assertEqual(
+            view._get_gpg_id(os.path.join(self.dir, 'old.com.gpg')),
+            '5C5833E3'
+        )
+        self.assertEqual(view.get_decrypted_password('old.com'), 'old')
+        self.assertEqual(
+            view.get_decrypted_passwords(['old.com']), {'old.com': 'old'}
+        )
+        self.assertEqual(
+            view.get_decrypted_password('new.com', rev='HEAD'), 'new'
+        )
+        self.assertRaises(Exception, view.get_decrypted_password, 'new.com')
+
+        self.assertRaises(Exception, view.insert_password, 'a.com', 'a')
+        self.assertRaises(Exception, view.remove_password, 'old.com')
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'a.com.gpg')))
+
+        self.assertRaises(Exception, store.at, 'no-such-revision')
+
+        view.close()
+        store.close()
+
     def test_get_decrypted_password_only_password(self):
         store = PasswordStore(self.dir)
         password = 'ELLO'
@@ -249,6 +607,84 @@ class TestPasswordStore(unittest.TestCase):
         shutil.rmtree(origin_dir)
         shutil.rmtree(destination_dir)
 
+    def test_init_shallow_sparse_clone(self):
+        origin_dir = tempfile.mkdtemp()
+        destination_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, origin_dir)
+        self.addCleanup(shutil.rmtree, destination_dir)
+
+        def git(*args):
+            subprocess.check_call(
+                ['git', '-C', origin_dir, '-c', 'user.name=pypass',
+                 '-c', 'user.email=pypass@example.com'] + list(args),
+                stdout=subprocess.PIPE
+            )
+
+        git('init', '-q')
+        git('checkout', '-q', '-b', 'trunk')
+        git('config', 'uploadpack.allowFilter', 'true')
+        os.makedirs(os.path.join(origin_dir, 'Team', 'CI'))
+        os.mkdir(os.path.join(origin_dir, 'Other'))
+        for name in ('.gpg-id', 'Team/CI/db.gpg', 'Other/web.gpg'):
+            with open(os.path.join(origin_dir, name), 'w') as f:
+                f.write(name)
+        git('add', '.')
+        git('commit', '-q', '-m', 'First.')
+        with open(os.path.join(origin_dir, 'Team/CI/db.gpg'), 'w') as f:
+            f.write('second')
+        git('commit', '-q', '-a', '-m', 'Second.')
+
+        store = PasswordStore.init(
+            path=destination_dir,
+            clone_url='file://' + origin_dir,
+            gpg_id='3CCC3A3A',
+            depth=1,
+            filter_spec='blob:none',
+            sparse_paths=['Team/CI']
+        )
+
+        # The branch of the remote HEAD was checked out, without history
+        self.assertEqual(store.get_passwords_list(), ['Team/CI/db'])
+        self.assertTrue(
+            os.path.isfile(os.path.join(destination_dir, '.gpg-id'))
+        )
+        self.assertEqual(
+            subprocess.check_output(
+                ['git', '-C', destination_dir, 'rev-list', '--count', 'HEAD']
+            ).strip(),
+            b'1'
+        )
+        self.assertEqual(
+            subprocess.check_output(
+                ['git', '-C', destination_dir, 'rev-parse', '--abbrev-ref',
+                 '@{upstream}']
+            ).strip(),
+            b'origin/trunk'
+        )
+
+        # Only the blobs that were checked out were fetched
+        missing = subprocess.check_output(
+            ['git', '-C', destination_dir, 'rev-list', '--objects',
+             '--missing=print', 'HEAD']
+        ).decode().split()
+        self.assertEqual(
+            [line for line in missing if line.startswith('?')],
+            ['?' + subprocess.check_output(
+                ['git', '-C', origin_dir, 'rev-parse', 'HEAD:Other/web.gpg']
+            ).decode().strip()]
+        )
+
+        missing_branch_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, missing_branch_dir)
+        self.assertRaises(
+            Exception,
+            PasswordStore.init,
+            path=missing_branch_dir,
+            clone_url='file://' + origin_dir,
+            gpg_id='3CCC3A3A',
+            branch='missing'
+        )
+
     def test_generate_password(self):
         store = PasswordStore(self.dir)
 
@@ -266,6 +702,241 @@ class TestPasswordStore(unittest.TestCase):
         length_100 = store.get_decrypted_password('hundred.org')
         self.assertEqual(len(length_100), 100)
 
+    def test_remove_copy_move_password(self):
+        store = PasswordStore(self.dir, cache_decrypted=True)
+        store.insert_password('Team/a', 'a')
+        store.insert_password('Team/Sub/b', 'b')
+        store.get_decrypted_password('Team/a')
+
+        self.assertEqual(
+            store.copy_password('Team', 'Copy'),
+            ['Copy/Sub/b', 'Copy/a']
+        )
+        self.assertEqual(store.get_decrypted_password('Copy/Sub/b'), 'b')
+
+        self.assertEqual(
+            store.move_password('Team/a', 'Other/a'),
+            ['Other/a', 'Team/a']
+        )
+        self.assertNotIn('Team/a', store.get_passwords_list())
+        self.assertNotIn('Team/a', store.decryption_cache)
+
+        # A folder moved to an existing folder goes inside of it
+        self.assertEqual(
+            store.move_password('Team', 'Other'),
+            ['Other/Team/Sub/b', 'Team/Sub/b']
+        )
+
+        self.assertRaises(Exception, store.remove_password, 'Copy')
+        self.assertEqual(
+            store.remove_password('Copy', recursive=True),
+            ['Copy/Sub/b', 'Copy/a']
+        )
+        self.assertEqual(store.remove_password('Other/a'), ['Other/a'])
+        self.assertRaises(Exception, store.remove_password, 'Other/a')
+        self.assertRaises(Exception, store.remove_password, '../etc')
+        self.assertRaises(Exception, store.move_password, 'Other', '..')
+
+    def test_copy_move_password_reencrypts(self):
+        store = PasswordStore(self.dir)
+        store.insert_password('a', 'a')
+        os.mkdir(os.path.join(self.dir, 'Team'))
+        # Team is encrypted for the third test key
+        with open(os.path.join(self.dir, 'Team', '.gpg-id'), 'w') as gpg_id:
+            gpg_id.write('FB7C4A645890CA9A')
+        store.insert_password('Team/b', 'b')
+
+        def read(path):
+            with open(os.path.join(self.dir, path + '.gpg'), 'rb') as f:
+                return f.read()
+
+        # Copied to another .gpg-id, the password is encrypted again
+        store.copy_password('a', 'Team/a')
+        self.assertEqual(recipient_key_ids(read('a')), ['6C8110881C10BC07'])
+        self.assertEqual(
+            recipient_key_ids(read('Team/a')), ['96A03622462C6FA9']
+        )
+        self.assertEqual(store.get_decrypted_password('Team/a'), 'a')
+
+        # Under the same .gpg-id, it is copied as is
+        store.copy_password('Team/b', 'Team/c')
+        self.assertEqual(read('Team/c'), read('Team/b'))
+
+        # A folder takes its .gpg-id along
+        team_b = read('Team/b')
+        store.move_password('Team', 'Moved')
+        self.assertEqual(read('Moved/b'), team_b)
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.dir, 'Moved', '.gpg-id'))
+        )
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'Team')))
+
+        # Moved out of it, the password is encrypted again
+        store.move_password('Moved/b', 'b')
+        self.assertEqual(recipient_key_ids(read('b')), ['6C8110881C10BC07'])
+        self.assertEqual(store.get_decrypted_password('b'), 'b')
+
+        # Moved to an existing folder, the password goes inside of it
+        store.move_password('b', 'Moved')
+        self.assertEqual(
+            recipient_key_ids(read('Moved/b')), ['96A03622462C6FA9']
+        )
+        self.assertEqual(store.get_decrypted_password('Moved/b'), 'b')
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'b.gpg')))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'Moved.gpg')))
+
+        # As does a password copied to a path ending in a trailing /
+        store.copy_password('a', 'New/')
+        self.assertEqual(store.get_decrypted_password('New/a'), 'a')
+
+    def test_copy_move_password_no_overwrite(self):
+        store = PasswordStore(self.dir)
+        store.insert_passwords({'X/one': '1', 'X/two': '2', 'Y/X/two': 'y'})
+
+        # Nothing is copied when one of the passwords exists
+        self.assertRaises(
+            Exception, store.copy_password, 'X', 'Y', overwrite=False
+        )
+        self.assertRaises(
+            Exception, store.move_password, 'X/two', 'Y/X/two',
+            overwrite=False
+        )
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'Y', 'X',
+                                                     'one.gpg')))
+        self.assertEqual(store.get_decrypted_password('Y/X/two'), 'y')
+
+        self.assertEqual(
+            store.copy_password('X', 'Z', overwrite=False),
+            ['Z/one', 'Z/two']
+        )
+        self.assertEqual(
+            store.move_password('X/two', 'Y/X/two'),
+            ['X/two', 'Y/X/two']
+        )
+        self.assertEqual(store.get_decrypted_password('Y/X/two'), '2')
+        self.assertRaises(Exception, store.copy_password, 'Z', 'Z/in')
+
+    def test_watch(self):
+        for use_inotify in (True, False):
+            store = PasswordStore(self.dir, cache_decrypted=True)
+            other_store = PasswordStore(self.dir)
+            store.insert_password('watched/a', 'a')
+            store.insert_password('watched/b', 'b')
+            store.get_decrypted_password('watched/a')
+
+            store.watch(poll_interval=0.01, use_inotify=use_inotify)
+            try:
+                self.assertTrue(store.watched)
+                self.assertEqual(
+                    store._get_gpg_id(os.path.join(self.dir, 'watched')),
+                    '5C5833E3'
+                )
+
+                other_store.insert_password('watched/a', 'changed')
+                other_store.insert_password('watched/new/c', 'c')
+                os.remove(os.path.join(self.dir, 'watched', 'b.gpg'))
+                with open(os.path.join(self.dir, 'watched', '.gpg-id'),
+                          'w') as gpg_id:
+                    gpg_id.write('50C0C7445C5833E3')
+
+                deadline = time.time() + 5
+                while time.time() < deadline and \
+                        'watched/new/c' not in store.get_passwords_list():
+                    time.sleep(0.01)
+                time.sleep(0.2)
+
+                self.assertEqual(
+                    [entry for entry in store.get_passwords_list()
+                     if entry.startswith('watched/')],
+                    ['watched/a', 'watched/new/c']
+                )
+                self.assertEqual(
+                    store.get_decrypted_password('watched/a'), 'changed'
+                )
+                self.assertEqual(
+                    store._get_gpg_id(os.path.join(self.dir, 'watched')),
+                    '50C0C7445C5833E3'
+                )
+            finally:
+                store.close()
+            self.assertFalse(store.watched)
+            shutil.rmtree(os.path.join(self.dir, 'watched'))
+
+    def test_git_init_keeps_watching(self):
+        store = PasswordStore(self.dir)
+        store.watch(poll_interval=0.01, use_inotify=False)
+        store.start_background_push(delay=60)
+        try:
+            store.git_init()
+            self.assertTrue(store.watched)
+            self.assertIsNotNone(store._background_pusher)
+            store.insert_password('after_init', 'a')
+            self.assertEqual(
+                store.get_decrypted_password('after_init'), 'a'
+            )
+        finally:
+            # There is no remote to push to
+            store.stop_background_push(flush=False)
+            store.close()
+
+    def test_content_manifest(self):
+        store = PasswordStore(self.dir, content_manifest=True)
+        self.assertTrue(store.insert_password('same.com', 'pw'))
+        self.assertFalse(store.insert_password('same.com', 'pw'))
+        self.assertTrue(store.insert_password('same.com', 'new pw'))
+
+        # The manifest is kept encrypted between stores
+        with open(store.content_manifest.file_path, 'rb') as manifest:
+            self.assertNotIn(b'same.com', manifest.read())
+        store = PasswordStore(self.dir, content_manifest=True)
+        self.assertEqual(
+            store.insert_passwords({'same.com': 'new pw', 'b.com': 'b'}),
+            {'same.com': False, 'b.com': True}
+        )
+
+        # Files changed behind the manifest's back are written again
+        PasswordStore(self.dir).insert_password('same.com', 'new pw')
+        self.assertTrue(store.insert_password('same.com', 'new pw'))
+        self.assertEqual(
+            store.get_decrypted_password('same.com'),
+            'new pw'
+        )
+
+    def test_generate_passwords(self):
+        store = PasswordStore(self.dir)
+        store.insert_password('bulk/a', 'old a\nuser: a')
+        store.insert_password('bulk/b', 'old b')
+
+        passwords = store.generate_passwords(
+            ['bulk/a', 'bulk/b', 'bulk/a'],
+            symbols=False,
+            length=12,
+            first_line_only=True,
+            workers=2
+        )
+
+        self.assertEqual(sorted(passwords), ['bulk/a', 'bulk/b'])
+        self.assertNotEqual(passwords['bulk/a'], passwords['bulk/b'])
+        for password in passwords.values():
+            self.assertEqual(len(password), 12)
+            self.assertTrue(password.isalnum())
+
+        self.assertEqual(
+            store.get_decrypted_password('bulk/a'),
+            passwords['bulk/a'] + '\nuser: a'
+        )
+        self.assertEqual(
+            store.get_decrypted_password('bulk/b'),
+            passwords['bulk/b']
+        )
+
+        self.assertRaises(
+            Exception,
+            store.generate_passwords,
+            ['bulk/a', 'bulk/missing'],
+            first_line_only=True
+        )
+
     def test_generate_password_uses_correct_gpg_id(self):
         store = PasswordStore(self.dir)
 
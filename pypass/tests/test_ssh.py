@@ -0,0 +1,128 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from pypass import PasswordStore
+from pypass import ssh
+from pypass.tests import use_temporary_cache
+
+
+class TestSsh(unittest.TestCase):
+
+    def setUp(self):
+        use_temporary_cache(self)
+        self.dir = tempfile.mkdtemp()
+
+        # .gpg_id file
+        with open(os.path.join(self.dir, '.gpg-id'), 'w') as gpg_id_file:
+            gpg_id_file.write('5C5833E3')
+
+        self.store = PasswordStore(self.dir)
+        self.store.insert_passwords({
+            'Servers/web1': 'pw1\nuser: alice\nhost: 127.0.0.1',
+            'Servers/web2': 'user: bob\npassword: pw2\nhost: localhost',
+            'Servers/nohost': 'pw3',
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_get_credentials(self):
+        self.assertEqual(
+            ssh.get_credentials(self.store, ['Servers/web1', 'Servers/web2']),
+            {
+                'Servers/web1': ('127.0.0.1', 'alice', 'pw1'),
+                'Servers/web2': ('localhost', 'bob', 'pw2'),
+            }
+        )
+        self.assertRaises(
+            Exception,
+            ssh.get_credentials,
+            self.store,
+            ['Servers/nohost']
+        )
+
+        errors = {}
+        self.assertEqual(
+            ssh.get_credentials(
+                self.store, ['Servers/web1', 'Servers/nohost', 'nope'],
+                errors=errors
+            ),
+            {'Servers/web1': ('127.0.0.1', 'alice', 'pw1')}
+        )
+        self.assertEqual(errors, {
+            'Servers/nohost': 'Servers/nohost has no hostname entry',
+            'nope': 'nope is not in the password store',
+        })
+
+    def test_control_options(self):
+        directory = ssh.control_directory()
+        self.assertEqual(
+            stat.S_IMODE(os.stat(directory).st_mode) & 0o077,
+            0
+        )
+
+        options = ssh.control_options(directory)
+        self.assertEqual(options['ControlMaster'], 'auto')
+        self.assertEqual(
+            options['ControlPath'],
+            os.path.join(directory, '%C')
+        )
+
+    def test_fan_out_unreachable(self):
+        control_dir = tempfile.mkdtemp()
+        try:
+            options = ssh.control_options(control_dir)
+            # Nothing listens on port 1, connections are refused at once
+            options['Port'] = '1'
+            results = list(ssh.fan_out(
+                self.store,
+                ['Servers/web1', 'Servers/web2'],
+                'true',
+                jobs=2,
+                options=options
+            ))
+        finally:
+            shutil.rmtree(control_dir)
+
+        self.assertEqual(
+            sorted(path for path, _, _ in results),
+            ['Servers/web1', 'Servers/web2']
+        )
+        for _, status, output in results:
+            self.assertIsNone(status)
+            self.assertTrue(output)
+
+    def test_fan_out_missing_credentials(self):
+        # The hosts whose credentials can't be read fail on their own
+        self.assertEqual(
+            list(ssh.fan_out(
+                self.store, ['Servers/nohost', 'nope'], 'true'
+            )),
+            [
+                ('Servers/nohost', None,
+                 'Servers/nohost has no hostname entry'),
+                ('nope', None, 'nope is not in the password store'),
+            ]
+        )
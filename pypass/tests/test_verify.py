@@ -0,0 +1,138 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pypass import PasswordStore
+from pypass.tests import use_temporary_cache
+from pypass.verify import changed_since
+from pypass.verify import gpg_id_subtree
+from pypass.verify import verify
+
+
+class TestVerify(unittest.TestCase):
+
+    def setUp(self):
+        use_temporary_cache(self)
+        self.dir = tempfile.mkdtemp()
+
+        # .gpg_id file
+        with open(os.path.join(self.dir, '.gpg-id'), 'w') as gpg_id_file:
+            gpg_id_file.write('5C5833E3')
+
+        self.store = PasswordStore(self.dir)
+        self.store.insert_passwords({
+            'a.com': 'a',
+            'Team/b.com': 'b',
+            'Team/Sub/c.com': 'c',
+        })
+        with open(os.path.join(self.dir, 'Team', '.gpg-id'), 'w') as gpg_id:
+            gpg_id.write('5C5833E3')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, path, content):
+        with open(os.path.join(self.dir, path + '.gpg'), 'wb') as f:
+            f.write(content)
+
+    def test_gpg_id_subtree(self):
+        subtrees = {}
+        self.assertEqual(gpg_id_subtree(self.store, 'a.com', subtrees), '')
+        self.assertEqual(
+            gpg_id_subtree(self.store, 'Team/Sub/c.com', subtrees), 'Team'
+        )
+        self.assertEqual(
+            subtrees, {'': '', 'Team/Sub': 'Team', 'Team': 'Team'}
+        )
+
+        os.remove(os.path.join(self.dir, '.gpg-id'))
+        self.assertEqual(gpg_id_subtree(self.store, 'a.com'), None)
+
+    def test_verify(self):
+        self.assertEqual(
+            list(verify(self.store, decrypt=True)),
+            [
+                ('Team/Sub/c.com', 'Team', None),
+                ('Team/b.com', 'Team', None),
+                ('a.com', '', None),
+            ]
+        )
+
+    def test_verify_finds_corrupt_files(self):
+        with open(os.path.join(self.dir, 'a.com.gpg'), 'rb') as f:
+            content = f.read()
+        self.write('a.com', content[:-1])
+        self.write('Team/b.com', b'')
+
+        results = dict(
+            (path, problem) for path, _, problem in verify(self.store)
+        )
+        self.assertEqual(
+            results,
+            {
+                'a.com': 'corrupt (truncated packet 18)',
+                'Team/b.com': 'corrupt (empty file)',
+                'Team/Sub/c.com': None,
+            }
+        )
+
+    def test_verify_finds_undecryptable_files(self):
+        # Well formed, but encrypted for a key we don't have
+        self.write(
+            'a.com',
+            b'\x84\x14\x03' + b'\x12' * 8 + b'\x01' + b'\x00' * 10 +
+            b'\xd2\x03\x01\xaa\xbb'
+        )
+
+        self.assertEqual(
+            list(verify(self.store, paths=['a.com'])),
+            [('a.com', '', None)]
+        )
+        self.assertEqual(
+            list(verify(self.store, paths=['a.com'], decrypt=True)),
+            [('a.com', '',
+              'undecryptable (no secret key for 1212121212121212)')]
+        )
+
+    def test_changed_since(self):
+        self.store.git_init()
+        self.store.git_add_and_commit(['.'], message='Add passwords.')
+        self.assertEqual(changed_since(self.store, 'HEAD'), [])
+
+        self.store.insert_password('a.com', 'changed')
+        self.store.insert_password('new.com', 'new')
+        self.store.remove_password('Team/b.com')
+        self.assertEqual(
+            changed_since(self.store, 'HEAD'), ['a.com', 'new.com']
+        )
+
+        self.store.git_add_and_commit(['.'], message='Change passwords.')
+        self.assertEqual(
+            changed_since(self.store, 'HEAD~1'), ['a.com', 'new.com']
+        )
+        self.assertRaises(Exception, changed_since, self.store, 'HEAD~10')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import colorama
+
+BRANCH = u'\u251c\u2500\u2500 '
+LAST_BRANCH = u'\u2514\u2500\u2500 '
+PIPE = u'\u2502   '
+SPACE = u'    '
+
+
+def _nest(entries):
+    """Returns {name: (children, is_entry)} for the top level of entries"""
+    root = {}
+    for entry in entries:
+        node = root
+        parts = entry.split('/')
+        for position, part in enumerate(parts):
+            children, is_entry = node.get(part, ({}, False))
+            is_entry = is_entry or position == len(parts) - 1
+            node[part] = (children, is_entry)
+            node = children
+    return root
+
+
+def _render(node, indent, lines):
+    items = []
+    for name in sorted(node):
+        children, is_entry = node[name]
+        if is_entry:
+            items.append((name, {}))
+        if children:
+            items.append((name, children))
+
+    for position, (name, children) in enumerate(items):
+        last = position == len(items) - 1
+        if children:
+            label = colorama.Style.BRIGHT + colorama.Fore.BLUE + name + \
+                colorama.Style.RESET_ALL
+        else:
+            label = name
+        lines.append(indent + (LAST_BRANCH if last else BRANCH) + label)
+        _render(children, indent + (SPACE if last else PIPE), lines)
+
+
+def render_tree(entries, title=None):
+    """Draws entries as a tree, like tree(1)
+
+    :param entries: Password paths. Example: ['Email/bob.net', 'a.com']
+    :param title: The first line. By default, there is none.
+    :returns: The lines of the tree, folders are colored.
+    """
+    lines = [] if title is None else [title]
+    _render(_nest(entries), u'', lines)
+    return lines
@@ -0,0 +1,153 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import os
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+from .openpgp import recipient_key_ids
+from .passwordstore import DEFAULT_WORKERS
+from .passwordstore import MissingSecretKeyError
+
+
+def gpg_id_subtree(store, path, subtrees=None):
+    """Returns the folder of the .gpg-id file that applies to path
+
+    :param store: The PasswordStore of the password.
+    :param path: The password. Example: 'Email/bob.net'
+    :param subtrees: A dict remembering the folders already looked up.
+    :returns: The folder, relative to the store, '' for the root, or None
+              if there is no .gpg-id file.
+    """
+    subtrees = {} if subtrees is None else subtrees
+    folder = os.path.dirname(path)
+    visited = []
+    while True:
+        if folder in subtrees:
+            subtree = subtrees[folder]
+            break
+        visited.append(folder)
+        if os.path.isfile(os.path.join(store.path, folder, '.gpg-id')):
+            subtree = folder
+            break
+        if not folder:
+            subtree = None
+            break
+        folder = os.path.dirname(folder)
+
+    for folder in visited:
+        subtrees[folder] = subtree
+    return subtree
+
+
+def changed_since(store, rev):
+    """Returns the passwords changed since a git revision
+
+    Passwords that were added, modified or renamed since rev, committed or
+    not, are listed. Removed passwords are not.
+
+    :param store: The PasswordStore of the passwords.
+    :param rev: The git revision. Example: 'HEAD~10'
+    """
+    if not store.uses_git:
+        raise Exception('The password store does not use git')
+
+    git = [
+        'git',
+        '--git-dir=%s' % store.git_dir,
+        '--work-tree=%s' % store.path,
+    ]
+    names = set()
+    for args in (
+            ['diff', '--name-only', '--no-renames', '-z', rev],
+            ['ls-files', '--others', '--exclude-standard', '-z'],
+    ):
+        git_process = subprocess.Popen(
+            git + args + ['--', '*.gpg'],
+            shell=False,
+            cwd=store.path,
+            stdout=subprocess.PIPE
+        )
+        stdout, _ = git_process.communicate()
+        if git_process.returncode != 0:
+            raise Exception('git %s failed' % args[0])
+        names.update(stdout.decode('utf-8').split('\0'))
+
+    entries = set(store.get_passwords_list())
+    return sorted(
+        name[:-len('.gpg')] for name in names
+        if name[:-len('.gpg')] in entries
+    )
+
+
+def verify_password(store, path, decrypt=False):
+    """Checks that the file of a password is a well formed message
+
+    :param store: The PasswordStore of the password.
+    :param path: The password. Example: 'Email/bob.net'
+    :param decrypt: Also check that we can decrypt it.
+    :returns: None if the password is fine, or why it is not.
+    """
+    try:
+        with open(os.path.join(store.path, path + '.gpg'), 'rb') as f:
+            recipient_key_ids(f.read())
+    except (IOError, OSError) as e:
+        return 'unreadable (%s)' % e.strerror
+    except Exception as e:
+        return 'corrupt (%s)' % e
+
+    if decrypt:
+        try:
+            store.get_decrypted_password(path)
+        except MissingSecretKeyError as e:
+            return 'undecryptable (no secret key for %s)' % ', '.join(
+                e.key_ids
+            )
+        except Exception:
+            return 'undecryptable'
+    return None
+
+
+def verify(store, paths=None, decrypt=False, workers=None):
+    """Checks the files of many passwords concurrently
+
+    :param store: The PasswordStore to verify.
+    :param paths: The passwords to check. By default, all of them.
+    :param decrypt: Also check that we can decrypt them.
+    :param workers: How many files are checked at the same time. By
+                    default, the number of CPUs.
+    :returns: An iterator of (path, .gpg-id folder, problem) tuples, in
+              the order of paths. problem is None for passwords that are
+              fine.
+    """
+    paths = sorted(set(store.get_passwords_list() if paths is None
+                       else paths))
+    subtrees = {}
+
+    pool = ThreadPool(max(1, min(workers or DEFAULT_WORKERS, len(paths))))
+    try:
+        for path, problem in pool.imap(
+                lambda path: (path, verify_password(store, path, decrypt)),
+                paths
+        ):
+            yield path, gpg_id_subtree(store, path, subtrees), problem
+    finally:
+        pool.close()
+        pool.join()
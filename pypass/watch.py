@@ -0,0 +1,308 @@
+#
+#    Copyright (C) 2014 Alexandre Viau <alexandre@alexandreviau.net>
+#
+#    This file is part of python-pass.
+#
+#    python-pass is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    python-pass is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with python-pass.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from .cache import file_signature
+
+ADDED = 'added'
+MODIFIED = 'modified'
+DELETED = 'deleted'
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def is_watched_file(filename):
+    """Tells if changes to filename are relevant to a password store"""
+    return filename.endswith('.gpg') or filename == '.gpg-id'
+
+
+def _coalesce(events):
+    """Merges successive events on the same path into one"""
+    merged = {}
+    order = []
+    for event, path in events:
+        previous = merged.get(path)
+        if previous is None:
+            order.append(path)
+            merged[path] = event
+        elif previous == ADDED:
+            merged[path] = None if event == DELETED else ADDED
+        elif previous == DELETED:
+            merged[path] = MODIFIED if event != DELETED else DELETED
+        else:
+            merged[path] = event
+    return [(merged[path], path) for path in order if merged[path]]
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        libc = ctypes.CDLL(
+            ctypes.util.find_library('c') or 'libc.so.6',
+            use_errno=True
+        )
+    except OSError:
+        return None
+
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+
+    libc.inotify_add_watch.argtypes = [
+        ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32
+    ]
+    return libc
+
+
+class StoreWatcher(object):
+    """Watches a password store for changes to .gpg and .gpg-id files
+
+    On Linux, changes are reported by inotify(7). Elsewhere, or when
+    inotify is unavailable, the store is polled.
+
+    :param path: The directory to watch, recursively.
+    :param poll_interval: Seconds between two scans of the tree when
+                          polling. Defaults to 1.
+    :param use_inotify: Set to False to force polling. By default, inotify
+                        is used when available.
+    """
+
+    def __init__(self, path, poll_interval=1.0, use_inotify=True):
+        self.path = os.path.abspath(path)
+        self.poll_interval = poll_interval
+        self._snapshot = self._scan()
+
+        self._libc = _load_libc() if use_inotify else None
+        self._fd = None
+        self._watches = {}
+        if self._libc is not None:
+            fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self._fd = fd
+                for directory in self._directories(self.path):
+                    self._add_watch(directory)
+
+    @property
+    def uses_inotify(self):
+        return self._fd is not None
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self._watches = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _relative(self, file_path):
+        return os.path.relpath(file_path, self.path)
+
+    def _directories(self, top):
+        for root, dirnames, _ in os.walk(top):
+            dirnames[:] = [d for d in dirnames if d != '.git']
+            yield root
+
+    def _scan(self, top=None):
+        snapshot = {}
+        for root, dirnames, filenames in os.walk(top or self.path):
+            dirnames[:] = [d for d in dirnames if d != '.git']
+            for filename in filenames:
+                if is_watched_file(filename):
+                    file_path = os.path.join(root, filename)
+                    signature = file_signature(file_path)
+                    if signature is not None:
+                        snapshot[self._relative(file_path)] = signature
+        return snapshot
+
+    def _add_watch(self, directory):
+        wd = self._libc.inotify_add_watch(
+            self._fd,
+            os.fsencode(directory) if hasattr(os, 'fsencode') else directory,
+            WATCH_MASK
+        )
+        if wd >= 0:
+            self._watches[wd] = directory
+
+    def _diff(self, new_snapshot, prefix=None):
+        """Returns the events between the current and a new snapshot
+
+        When prefix is given, only paths below prefix are compared.
+        """
+        def in_scope(relative_path):
+            return prefix is None or \
+                relative_path.startswith(prefix + os.sep)
+
+        events = []
+        for relative_path, signature in sorted(new_snapshot.items()):
+            old_signature = self._snapshot.get(relative_path)
+            if old_signature is None:
+                events.append((ADDED, relative_path))
+            elif old_signature != signature:
+                events.append((MODIFIED, relative_path))
+
+        for relative_path in sorted(self._snapshot):
+            if in_scope(relative_path) and \
+                    relative_path not in new_snapshot:
+                events.append((DELETED, relative_path))
+
+        for relative_path in list(self._snapshot):
+            if in_scope(relative_path):
+                del self._snapshot[relative_path]
+        self._snapshot.update(new_snapshot)
+
+        return events
+
+    def _rescan_directory(self, directory):
+        if self._fd is not None:
+            for subdirectory in self._directories(directory):
+                self._add_watch(subdirectory)
+        new_snapshot = self._scan(directory) \
+            if os.path.isdir(directory) else {}
+        return self._diff(new_snapshot, prefix=self._relative(directory))
+
+    def _file_event(self, file_path):
+        relative_path = self._relative(file_path)
+        signature = file_signature(file_path)
+        old_signature = self._snapshot.get(relative_path)
+
+        if signature is None:
+            if old_signature is None:
+                return []
+            del self._snapshot[relative_path]
+            return [(DELETED, relative_path)]
+
+        self._snapshot[relative_path] = signature
+        if old_signature is None:
+            return [(ADDED, relative_path)]
+        elif old_signature != signature:
+            return [(MODIFIED, relative_path)]
+        return []
+
+    def _read_inotify(self, timeout):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+
+        events = []
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size
+            name = buf[offset:offset + length].rstrip(b'\0').decode(
+                sys.getfilesystemencoding()
+            )
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                events.extend(self._diff(self._scan()))
+                continue
+
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if directory != self.path:
+                    continue
+                events.extend(self._diff({}))
+                continue
+
+            file_path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if name != '.git':
+                    events.extend(self._rescan_directory(file_path))
+            elif mask & IN_CREATE:
+                # The file content is reported by IN_CLOSE_WRITE
+                continue
+            elif is_watched_file(name):
+                events.extend(self._file_event(file_path))
+
+        return events
+
+    def read_events(self, timeout=None):
+        """Waits for changes and returns them
+
+        :param timeout: Maximum number of seconds to wait. By default, wait
+                        until something changes.
+        :returns: A list of (event, path) tuples where event is one of
+                  ADDED, MODIFIED or DELETED and path is relative to the
+                  watched directory. Example: [('added', 'Email/bob.gpg')]
+        """
+        deadline = None if timeout is None else time.time() + timeout
+
+        while True:
+            remaining = None if deadline is None \
+                else max(0, deadline - time.time())
+
+            if self._fd is not None:
+                events = self._read_inotify(remaining)
+            else:
+                time.sleep(
+                    self.poll_interval if remaining is None
+                    else min(self.poll_interval, remaining)
+                )
+                events = self._diff(self._scan())
+
+            events = _coalesce(events)
+            if events or (deadline is not None and time.time() >= deadline):
+                return events